@@ -1,20 +1,110 @@
 from telegram import Update
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Callable, ContextManager, Iterable, Tuple
 import os
 import yaml
+import asyncio
+import threading
+from contextlib import nullcontext
 
 from src.auth.permissions import UserRole
 from src.logger import logger
+from src.utils.file_utils import atomic_write_text
 
 class UserManager:
     """用户管理类"""
+    
+    # 用户列表修改后等待多少秒再写入配置文件，期间的多次修改合并为一次写入
+    SAVE_DELAY = 1.0
+    
     def __init__(self, config: Dict[str, Any]):
         """初始化用户管理类"""
         self.config = config
         self.config_file = config.get('config_file', 'config.yaml')
+        
+        # 内存中的用户列表立即生效，配置文件在线程池中延迟写入
+        # _version 每次修改加一，写入时记录版本，写入期间若有新修改则再次写入
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._version = 0
+        self._saved_version = 0
+        self._save_handle: Optional[asyncio.TimerHandle] = None
+        # 尚未写入配置文件的增删操作 (版本, 'add'/'remove', 用户ID列表)，配置热加载后重新应用
+        self._pending: List[Tuple[int, str, List[str]]] = []
+        # 写入配置文件时进入的上下文，用于让配置监视器忽略自身的写入
+        self.write_guard: Callable[[], ContextManager] = nullcontext
+        
+        # 整数用户ID -> 角色，权限检查只需一次哈希查找
+        self._roles: Dict[int, UserRole] = {}
+        # 推送目标列表，用户列表变化后置为None，下次使用时重新生成
+        self._admin_targets: Optional[List[int]] = None
+        self._all_targets: Optional[List[int]] = None
+        self.reload_ids()
+        
+    def reload_ids(self, config: Dict[str, Any] = None) -> None:
+        """从配置中重新读取管理员和普通用户列表（配置热加载后调用）
+        
+        Args:
+            config: 新的配置字典，默认为正在使用的配置；尚未保存的增删操作会写回其中
+        """
+        if config is None:
+            config = self.config
+        self.config_file = config.get('config_file', 'config.yaml')
         self.admin_ids = self._parse_admin_ids(config.get('telegram_admin_id', ''))
         self.allowed_user_ids = self._parse_user_ids(config.get('telegram_user_id', ''))
         
+        # 配置文件中还没有的增删操作重新应用到新读取的列表上，并重新安排写入
+        reapplied = self._apply_pending_changes()
+        self._rebuild_index()
+        if reapplied:
+            config['telegram_admin_id'] = ','.join(self.admin_ids)
+            config['telegram_user_id'] = ','.join(self.allowed_user_ids)
+            self._save_config()
+        
+    def _apply_pending_changes(self) -> bool:
+        """将尚未写入配置文件的增删操作按顺序应用到当前用户列表
+        
+        Returns:
+            bool: 是否有待写入的操作
+        """
+        with self._lock:
+            changes = list(self._pending)
+        
+        for _, action, user_ids in changes:
+            if action == 'add':
+                known = {self._to_int(uid) for uid in self.admin_ids + self.allowed_user_ids}
+                self.allowed_user_ids.extend(uid for uid in user_ids if int(uid) not in known)
+            else:
+                removed = {int(uid) for uid in user_ids}
+                self.allowed_user_ids = [uid for uid in self.allowed_user_ids if self._to_int(uid) not in removed]
+        return bool(changes)
+        
+    @staticmethod
+    def _to_int(user_id: Any) -> Optional[int]:
+        """将用户ID转换为整数，无法转换时返回None"""
+        if isinstance(user_id, int):
+            return user_id
+        try:
+            return int(str(user_id).strip())
+        except ValueError:
+            return None
+    
+    def _rebuild_index(self) -> None:
+        """根据管理员和普通用户列表重建角色索引，并使推送目标缓存失效"""
+        roles = {}
+        for user_id in self.allowed_user_ids:
+            numeric_id = self._to_int(user_id)
+            if numeric_id is not None:
+                roles[numeric_id] = UserRole.USER
+        # 同时出现在两个列表中的ID按管理员处理
+        for admin_id in self.admin_ids:
+            numeric_id = self._to_int(admin_id)
+            if numeric_id is not None:
+                roles[numeric_id] = UserRole.ADMIN
+        
+        self._roles = roles
+        self._admin_targets = None
+        self._all_targets = None
+        
     def _parse_admin_ids(self, admin_id_str: str) -> List[str]:
         """解析管理员ID列表"""
         if not admin_id_str:
@@ -29,12 +119,10 @@ class UserManager:
     
     def get_user_role(self, user_id: int) -> UserRole:
         """获取用户角色"""
-        user_id_str = str(user_id)
-        if user_id_str in self.admin_ids:
-            return UserRole.ADMIN
-        elif user_id_str in self.allowed_user_ids:
-            return UserRole.USER
-        return None
+        numeric_id = self._to_int(user_id)
+        if numeric_id is None:
+            return None
+        return self._roles.get(numeric_id)
         
     async def check_permission(self, update: Update, required_role: UserRole) -> bool:
         """检查用户是否有指定角色的权限
@@ -71,25 +159,43 @@ class UserManager:
         Returns:
             bool: 是否添加成功
         """
-        # 清理输入
-        user_id = user_id.strip()
+        return bool(self.add_users([user_id])['added'])
+    
+    def add_users(self, user_ids: Iterable[str]) -> Dict[str, List[str]]:
+        """批量添加普通用户，全部校验并加入内存后只写入一次配置文件
         
-        if not user_id:
-            return False
+        Args:
+            user_ids: 用户ID列表（字符串形式）
             
-        # 检查是否已经是用户
-        if user_id in self.allowed_user_ids:
-            return False
+        Returns:
+            Dict: added 为新添加的用户，existing 为已是用户或管理员的ID，invalid 为无法解析的ID
+        """
+        result = {'added': [], 'existing': [], 'invalid': []}
+        for user_id in user_ids:
+            # 清理输入
+            user_id = str(user_id).strip()
+            numeric_id = self._to_int(user_id) if user_id else None
+            if numeric_id is None:
+                if user_id:
+                    result['invalid'].append(user_id)
+                continue
             
-        # 检查是否已经是管理员
-        if user_id in self.admin_ids:
-            return False
+            # 检查是否已经是用户或管理员（含本次已添加的）
+            if numeric_id in self._roles:
+                result['existing'].append(user_id)
+                continue
             
-        # 添加到用户列表
-        self.allowed_user_ids.append(user_id)
+            # 添加到用户列表
+            user_id = str(numeric_id)
+            self.allowed_user_ids.append(user_id)
+            self._roles[numeric_id] = UserRole.USER
+            result['added'].append(user_id)
         
         # 更新配置
-        return self._save_config()
+        if result['added']:
+            self._all_targets = None
+            self._save_config(('add', result['added']))
+        return result
     
     def remove_user(self, user_id: str) -> bool:
         """删除普通用户
@@ -100,21 +206,45 @@ class UserManager:
         Returns:
             bool: 是否删除成功
         """
-        # 清理输入
-        user_id = user_id.strip()
+        return bool(self.remove_users([user_id])['removed'])
+    
+    def remove_users(self, user_ids: Iterable[str]) -> Dict[str, List[str]]:
+        """批量删除普通用户，全部校验后一次性从列表中移除并只写入一次配置文件
         
-        if not user_id:
-            return False
+        Args:
+            user_ids: 用户ID列表（字符串形式）
             
-        # 检查是否是用户
-        if user_id not in self.allowed_user_ids:
-            return False
+        Returns:
+            Dict: removed 为已删除的用户，missing 为不是普通用户的ID，invalid 为无法解析的ID
+        """
+        result = {'removed': [], 'missing': [], 'invalid': []}
+        to_remove = set()
+        for user_id in user_ids:
+            # 清理输入
+            user_id = str(user_id).strip()
+            numeric_id = self._to_int(user_id) if user_id else None
+            if numeric_id is None:
+                if user_id:
+                    result['invalid'].append(user_id)
+                continue
+            
+            # 检查是否是用户（含本次已删除的）
+            if self._roles.get(numeric_id) != UserRole.USER:
+                result['missing'].append(user_id)
+                continue
             
-        # 从用户列表中移除
-        self.allowed_user_ids.remove(user_id)
+            del self._roles[numeric_id]
+            to_remove.add(numeric_id)
+            result['removed'].append(str(numeric_id))
         
-        # 更新配置
-        return self._save_config()
+        if to_remove:
+            # 从用户列表中移除（配置中可能写有前导零等不同形式）
+            self.allowed_user_ids = [uid for uid in self.allowed_user_ids if self._to_int(uid) not in to_remove]
+            self._all_targets = None
+            
+            # 更新配置
+            self._save_config(('remove', result['removed']))
+        return result
         
     def get_all_users(self) -> Dict[str, List[str]]:
         """获取所有用户列表
@@ -127,72 +257,116 @@ class UserManager:
             'users': self.allowed_user_ids.copy()
         }
         
-    def _save_config(self) -> bool:
-        """保存配置到文件
+    def _save_config(self, change: Optional[Tuple[str, List[str]]] = None) -> bool:
+        """更新内存中的配置，并安排在线程池中写入配置文件
+        
+        在事件循环中调用时等待 SAVE_DELAY 秒再写入，期间的多次修改只写一次；
+        不在事件循环中（例如脚本调用）时直接同步写入。
+        
+        Args:
+            change: 本次的增删操作 ('add'/'remove', 用户ID列表)，写入前重新加载配置时会再次应用
         
         Returns:
-            bool: 是否保存成功
+            bool: 内存中的配置总是立即更新，返回True；同步写入时返回是否保存成功
         """
+        with self._lock:
+            self.config['telegram_admin_id'] = ','.join(self.admin_ids)
+            self.config['telegram_user_id'] = ','.join(self.allowed_user_ids)
+            self._version += 1
+            if change:
+                self._pending.append((self._version,) + change)
+        
         try:
-            # 读取当前配置文件
-            if os.path.exists(self.config_file):
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    config_data = yaml.safe_load(f)
-            else:
-                config_data = {}
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self.flush()
+        
+        if self._save_handle is None:
+            self._save_handle = loop.call_later(self.SAVE_DELAY, self._start_save, loop)
+        return True
+    
+    def _start_save(self, loop: asyncio.AbstractEventLoop) -> None:
+        """延迟结束后在线程池中写入配置文件"""
+        self._save_handle = None
+        loop.run_in_executor(None, self.flush)
+    
+    @property
+    def dirty(self) -> bool:
+        """是否有尚未写入配置文件的修改"""
+        return self._version != self._saved_version
+    
+    def flush(self) -> bool:
+        """将用户列表写入配置文件，没有修改时直接返回，可在线程池中调用
+        
+        读取配置文件后只替换用户配置项，写入临时文件后原子替换，其余配置项保持不变。
+        
+        Returns:
+            bool: 是否保存成功
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self.dirty:
+                    return True
+                version = self._version
+                admin_ids = self.config['telegram_admin_id']
+                user_ids = self.config['telegram_user_id']
             
-            # 更新用户配置
-            config_data['telegram_admin_id'] = ','.join(self.admin_ids)
-            config_data['telegram_user_id'] = ','.join(self.allowed_user_ids)
+            try:
+                # 读取和写入都在 write_guard 中进行，配置监视器据此判断写入前文件是否被外部修改过
+                with self.write_guard():
+                    # 读取当前配置文件
+                    if os.path.exists(self.config_file):
+                        with open(self.config_file, 'r', encoding='utf-8') as f:
+                            config_data = yaml.safe_load(f) or {}
+                    else:
+                        config_data = {}
+                    
+                    # 更新用户配置
+                    config_data['telegram_admin_id'] = admin_ids
+                    config_data['telegram_user_id'] = user_ids
+                    
+                    # 写入配置文件
+                    content = yaml.dump(config_data, default_flow_style=False, allow_unicode=True)
+                    atomic_write_text(self.config_file, content)
+            except Exception as e:
+                logger.error(f"保存用户配置失败: {str(e)}", exc_info=True)
+                return False
             
-            # 写入配置文件
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                yaml.dump(config_data, f, default_flow_style=False, allow_unicode=True)
-                
-            # 更新内存中的配置
-            self.config['telegram_admin_id'] = ','.join(self.admin_ids)
-            self.config['telegram_user_id'] = ','.join(self.allowed_user_ids)
+            with self._lock:
+                self._saved_version = version
+                self._pending = [change for change in self._pending if change[0] > version]
             
             logger.info(f"用户配置已更新并保存到 {self.config_file}")
             return True
-        except Exception as e:
-            logger.error(f"保存用户配置失败: {str(e)}", exc_info=True)
-            return False
     
     async def get_admin_user_ids(self) -> List[int]:
         """获取所有管理员用户ID列表（用于推送系统）
         
         Returns:
-            List[int]: 管理员用户ID列表
+            List[int]: 管理员用户ID列表，为缓存的列表，调用方不应修改
         """
-        try:
-            return [int(admin_id) for admin_id in self.admin_ids if admin_id.isdigit()]
-        except Exception as e:
-            logger.error(f"获取管理员用户ID列表失败: {str(e)}")
-            return []
+        if self._admin_targets is None:
+            self._admin_targets = self._unique_ids(self.admin_ids)
+        return self._admin_targets
     
     async def get_all_user_ids(self) -> List[int]:
         """获取所有用户ID列表（包括管理员和普通用户，用于推送系统）
         
         Returns:
-            List[int]: 所有用户ID列表
+            List[int]: 所有用户ID列表，为缓存的列表，调用方不应修改
         """
-        try:
-            all_ids = []
-            
-            # 添加管理员ID
-            for admin_id in self.admin_ids:
-                if admin_id.isdigit():
-                    all_ids.append(int(admin_id))
-            
-            # 添加普通用户ID
-            for user_id in self.allowed_user_ids:
-                if user_id.isdigit():
-                    user_id_int = int(user_id)
-                    if user_id_int not in all_ids:  # 避免重复
-                        all_ids.append(user_id_int)
-            
-            return all_ids
-        except Exception as e:
-            logger.error(f"获取所有用户ID列表失败: {str(e)}")
-            return [] 
\ No newline at end of file
+        if self._all_targets is None:
+            self._all_targets = self._unique_ids(self.admin_ids + self.allowed_user_ids)
+        return self._all_targets
+    
+    def _unique_ids(self, user_ids: List[str]) -> List[int]:
+        """转换为整数并去重，保持原有顺序
+        
+        Args:
+            user_ids: 用户ID字符串列表
+        
+        Returns:
+            List[int]: 整数用户ID列表，无法转换的ID被忽略
+        """
+        numeric_ids = (self._to_int(user_id) for user_id in user_ids)
+        return list(dict.fromkeys(user_id for user_id in numeric_ids if user_id is not None))
\ No newline at end of file
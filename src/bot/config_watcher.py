@@ -0,0 +1,99 @@
+"""配置文件热加载"""
+import os
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Set, Tuple
+
+from src.config import apply_config, read_config_file
+from src.logger import logger
+
+
+class ConfigWatcher:
+    """配置文件监视器
+    
+    定时检查配置文件的修改时间和大小，变化时重新读取并校验。校验通过后先在配置副本上应用，
+    由回调把发生变化的顶层配置项增量应用到各组件，全部成功后才原地更新正在使用的配置字典。
+    校验或应用失败时各组件按当前配置恢复，继续使用当前配置运行。
+    """
+    
+    def __init__(self, config: Dict[str, Any], on_change: Callable[[Set[str], Dict[str, Any]], Awaitable[None]]):
+        """初始化监视器
+        
+        Args:
+            config: 正在使用的配置字典，config_file 为配置文件路径
+            on_change: 配置变化后的回调，参数为变化的顶层配置项和要应用的配置，失败时抛出异常
+        """
+        self.config = config
+        self.on_change = on_change
+        self.config_file = config.get('config_file', 'config.yaml')
+        # 检查间隔（秒），0表示不监视
+        self.interval = config.get('config_reload_interval', 10)
+        self._signature = self._stat()
+        # 机器人自身写入配置文件期间持有，写入完成后记录新的签名
+        self._write_lock = threading.Lock()
+    
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        """获取配置文件的修改时间和大小，文件不存在时返回None"""
+        try:
+            stat = os.stat(self.config_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    @contextmanager
+    def self_write(self) -> Iterator[None]:
+        """机器人自身读取并写回配置文件时使用，可在线程池中调用
+        
+        写入前文件与上次加载时一致，写入的内容就与内存一致，写入后不触发重新加载；
+        文件在上次检查后被外部修改过时，写回的内容包含这些修改，保留旧签名让下次检查重新加载。
+        """
+        with self._write_lock:
+            unchanged = self._stat() == self._signature
+            yield
+            if unchanged:
+                self._signature = self._stat()
+    
+    async def check(self) -> Set[str]:
+        """检查配置文件是否变化，变化时重新加载
+        
+        Returns:
+            Set[str]: 发生变化的顶层配置项，没有变化或加载失败时为空
+        """
+        # 正在写入时跳过本次检查，等下次再看
+        if not self._write_lock.acquire(blocking=False):
+            return set()
+        try:
+            signature = self._stat()
+            if signature is None or signature == self._signature:
+                return set()
+            # 无论加载是否成功都记录本次签名，文件再次修改前不重复报错
+            self._signature = signature
+        finally:
+            self._write_lock.release()
+        
+        loop = asyncio.get_running_loop()
+        try:
+            new_config = await loop.run_in_executor(None, read_config_file, self.config_file)
+        except (OSError, ValueError) as e:
+            logger.error(f"重新加载配置文件 {self.config_file} 失败，继续使用当前配置: {str(e)}")
+            return set()
+        
+        candidate = dict(self.config)
+        changed = apply_config(candidate, new_config)
+        if not changed:
+            return changed
+        
+        try:
+            await self.on_change(changed, candidate)
+        except Exception as e:
+            logger.error(f"应用重新加载的配置失败，继续使用当前配置: {str(e)}", exc_info=True)
+            try:
+                await self.on_change(changed, self.config)
+            except Exception as e:
+                logger.error(f"按当前配置恢复组件失败: {str(e)}", exc_info=True)
+            return set()
+        
+        apply_config(self.config, candidate)
+        logger.info(f"配置文件已重新加载，变化的配置项: {', '.join(sorted(changed))}")
+        return changed
@@ -1,15 +1,23 @@
 #!/usr/bin/env python3
-from telegram.ext import ApplicationBuilder, Application
-from typing import Dict, Any
+import asyncio
+
+from telegram.ext import ApplicationBuilder, Application, ContextTypes
+from typing import Dict, Any, Set
 
 from src.auth import UserManager
 from src.logger import logger
-from src.utils import UserStatsManager
+from src.utils import UserStatsManager, UserUtils, user_cache
+from src.bot.config_watcher import ConfigWatcher
+from src.bot.gate import AccessGate
 from src.bot.plugins.loader import PluginLoader
 from src.push.manager import PushManager
 
 class TelegramBot:
     """Telegram机器人核心类"""
+    
+    # 修改后需要重启才能生效的配置项
+    RESTART_REQUIRED_KEYS = {'telegram_bot_token', 'plugins', 'stats', 'config_reload_interval'}
+    
     def __init__(self, config: Dict[str, Any]):
         """初始化机器人实例
         
@@ -18,9 +26,14 @@ class TelegramBot:
         """
         self.config = config
         self.user_manager = UserManager(config)
-        self.stats_manager = UserStatsManager()
+        self.stats_manager = UserStatsManager(config=config)
+        user_cache.configure(config)
         self.plugin_loader = PluginLoader(self.user_manager, config)
         self.push_manager = PushManager(self.user_manager, config)
+        self.access_gate = AccessGate(self.user_manager, config)
+        self.config_watcher = ConfigWatcher(config, self._apply_config_changes)
+        # 用户管理写入的配置文件内容与内存一致，无需重新加载
+        self.user_manager.write_guard = self.config_watcher.self_write
         self.app = None
         
     def setup(self) -> None:
@@ -33,6 +46,10 @@ class TelegramBot:
         # 添加管理器到应用数据
         self.app.bot_data['stats_manager'] = self.stats_manager
         self.app.bot_data['push_manager'] = self.push_manager
+        self.app.bot_data['access_gate'] = self.access_gate
+        
+        # 在所有插件之前拦截未授权用户
+        self.app.add_handler(self.access_gate.create_handler(), group=AccessGate.HANDLER_GROUP)
         
         # 加载并设置插件
         self.plugin_loader.setup_plugins(self.app)
@@ -55,6 +72,54 @@ class TelegramBot:
             
             # 启动推送管理器
             await self.push_manager.start_all_plugins(application)
+            
+            # 在后台线程中加载用户信息缓存，不阻塞启动
+            user_cache.preload()
+            
+            # 缓冲模式下定时落盘统计数据
+            if self.stats_manager.buffered and application.job_queue:
+                application.job_queue.run_repeating(
+                    self._flush_stats_job,
+                    interval=self.stats_manager.flush_interval,
+                    first=self.stats_manager.flush_interval,
+                    name="stats_flush"
+                )
+            
+            # 定时落盘用户信息缓存
+            if application.job_queue:
+                application.job_queue.run_repeating(
+                    self._flush_user_cache_job,
+                    interval=user_cache.flush_interval,
+                    first=user_cache.flush_interval,
+                    name="user_cache_flush"
+                )
+            
+            # 后台分批刷新过时的用户资料
+            if user_cache.refresh_interval > 0 and application.job_queue:
+                application.job_queue.run_repeating(
+                    self._refresh_user_cache_job,
+                    interval=user_cache.refresh_interval,
+                    first=user_cache.refresh_interval,
+                    name="user_cache_refresh"
+                )
+            
+            # 定时检查配置文件，修改后自动重新加载
+            if self.config_watcher.interval > 0 and application.job_queue:
+                application.job_queue.run_repeating(
+                    self._check_config_job,
+                    interval=self.config_watcher.interval,
+                    first=self.config_watcher.interval,
+                    name="config_reload"
+                )
+            
+            # 每天归档一次已结束月份的每日统计文件
+            if self.stats_manager.archive_enabled and application.job_queue:
+                application.job_queue.run_repeating(
+                    self._archive_stats_job,
+                    interval=24 * 60 * 60,
+                    first=60,
+                    name="stats_archive"
+                )
         
         # 设置停止时的处理
         async def post_shutdown(application: Application):
@@ -62,6 +127,15 @@ class TelegramBot:
             
             # 停止推送管理器
             await self.push_manager.stop_all_plugins()
+            
+            # 写入尚未保存的用户列表
+            self.user_manager.flush()
+            
+            # 落盘剩余统计数据并关闭存储
+            self.stats_manager.close()
+            
+            # 落盘用户信息缓存并关闭存储
+            user_cache.close()
         
         # 注册应用处理器
         self.app.post_init = post_init
@@ -70,6 +144,62 @@ class TelegramBot:
         # 开始轮询
         self.app.run_polling()
         
+    async def _flush_stats_job(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """定时任务：在线程池中落盘统计数据"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.stats_manager.flush)
+        
+    async def _flush_user_cache_job(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """定时任务：在线程池中落盘用户信息缓存"""
+        if not user_cache.dirty:
+            return
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, user_cache.flush)
+        
+    async def _refresh_user_cache_job(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """定时任务：刷新一批过时的用户资料"""
+        await UserUtils.refresh_stale_profiles(context)
+        
+    async def _archive_stats_job(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """定时任务：在线程池中归档已结束月份的每日统计"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.stats_manager.archive)
+        
+    async def _check_config_job(self, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """定时任务：检查配置文件是否修改"""
+        await self.config_watcher.check()
+        
+    async def _apply_config_changes(self, changed: Set[str], config: Dict[str, Any]) -> None:
+        """将重新加载的配置增量应用到各组件
+        
+        全部应用成功后配置监视器才更新正在使用的配置字典，直接读取配置的功能
+        （如IP插件的次数限制、IP获取地址）届时自动生效。应用失败时会用当前配置再次调用。
+        
+        Args:
+            changed: 发生变化的顶层配置项
+            config: 要应用的配置
+        """
+        if 'push' in changed:
+            await self.push_manager.reload_config(config)
+        
+        if 'user_cache' in changed:
+            user_cache.configure(config)
+        
+        if 'access_gate' in changed:
+            self.access_gate.configure(config)
+        
+        if 'commands_file' in changed:
+            self.plugin_loader.apply_command_config(config)
+        
+        # 最后应用用户列表，之后直到更新配置字典前没有 await，期间不会有用户增删
+        if changed & {'telegram_admin_id', 'telegram_user_id'}:
+            self.user_manager.reload_ids(config)
+            logger.info("已重新加载管理员和用户列表")
+        
+        restart_required = changed & self.RESTART_REQUIRED_KEYS
+        if restart_required:
+            logger.warning(f"配置项 {', '.join(sorted(restart_required))} 需要重启机器人才能生效")
+        
     def get_application(self) -> Application:
         """获取telegram应用实例"""
         if self.app is None:
@@ -0,0 +1,122 @@
+"""访问控制：在所有插件处理器之前拦截未授权用户"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes, MessageHandler, filters
+
+from src.auth import UserManager
+from src.logger import logger
+from src.utils.stats_counters import SpaceSaving
+
+
+class AccessGate:
+    """未授权用户拦截器
+    
+    注册在优先级最高的处理器组中，只检查命令消息（插件只处理命令，普通聊天消息不会被处理，也不提示）：
+    已授权用户直接放行；未授权用户的命令在任何插件代码、缓存写入、统计写入之前被丢弃，
+    同一用户在 reply_interval 秒内最多收到一次提示，并用 Space-Saving 计数记录被拒绝最多的发送者。
+    """
+    
+    # 处理器组，数字越小越先执行
+    HANDLER_GROUP = -1
+    
+    def __init__(self, user_manager: UserManager, config: Dict[str, Any]):
+        """初始化拦截器
+        
+        Args:
+            user_manager: 用户管理器
+            config: 配置字典，读取其中的 access_gate 部分
+        """
+        self.user_manager = user_manager
+        self.rejected_total = 0
+        self.rejected_senders = SpaceSaving(64)
+        self._last_reply: "OrderedDict[int, float]" = OrderedDict()
+        self.configure(config)
+    
+    def configure(self, config: Dict[str, Any]) -> None:
+        """根据配置调整提示间隔和计数容量，已有的计数保留
+        
+        Args:
+            config: 配置字典，读取其中的 access_gate 部分
+        """
+        gate_config = config.get('access_gate', {}) or {}
+        
+        # 同一用户两次提示之间的最小间隔（秒），0表示从不回复
+        self.reply_interval = gate_config.get('reply_interval', 60)
+        # 最多记录多少个用户的上次提示时间，超出时淘汰最久未提示的用户
+        self.reply_tracking_size = gate_config.get('reply_tracking_size', 1024)
+        # 容量变小时已跟踪的键保留，之后新键只替换计数最小的键
+        self.rejected_senders.capacity = gate_config.get('top_k_capacity', 64)
+    
+    def create_handler(self) -> MessageHandler:
+        """创建拦截命令消息的处理器
+        
+        Returns:
+            MessageHandler: 需注册到 HANDLER_GROUP 组
+        """
+        return MessageHandler(filters.COMMAND, self.check_update)
+    
+    async def check_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """检查命令消息的发送者，未授权时终止后续所有处理器
+        
+        Args:
+            update: Telegram更新对象
+            context: 上下文对象
+        
+        Raises:
+            ApplicationHandlerStop: 发送者未授权
+        """
+        user = update.effective_user
+        # 频道消息等没有发送者的更新交给后续处理器自行判断
+        if user is None or self.user_manager.get_user_role(user.id) is not None:
+            return
+        
+        self.rejected_total += 1
+        self.rejected_senders.add(str(user.id))
+        
+        if self._should_reply(user.id):
+            logger.warning(f"未授权的用户尝试访问，用户ID: {user.id}，用户名: {user.username}，全名: {user.full_name}")
+            if update.effective_message:
+                try:
+                    await update.effective_message.reply_text("未授权的用户")
+                except Exception as e:
+                    logger.debug(f"回复未授权用户 {user.id} 失败: {str(e)}")
+        
+        raise ApplicationHandlerStop
+    
+    def _should_reply(self, user_id: int) -> bool:
+        """判断是否需要提示该用户，需要时记录本次提示时间
+        
+        Args:
+            user_id: 用户ID
+        
+        Returns:
+            bool: 距上次提示已超过 reply_interval 秒
+        """
+        if self.reply_interval <= 0:
+            return False
+        
+        now = time.monotonic()
+        last = self._last_reply.get(user_id)
+        if last is not None and now - last < self.reply_interval:
+            return False
+        
+        self._last_reply[user_id] = now
+        self._last_reply.move_to_end(user_id)
+        while len(self._last_reply) > self.reply_tracking_size:
+            self._last_reply.popitem(last=False)
+        return True
+    
+    def get_rejected_summary(self, limit: int = 10) -> Tuple[int, List[Tuple[str, int]]]:
+        """获取被拒绝的更新统计
+        
+        Args:
+            limit: 最多返回的发送者数量
+        
+        Returns:
+            Tuple: (被拒绝的更新总数, [(用户ID, 次数), ...])，次数为上界估计，按次数降序
+        """
+        top = sorted(self.rejected_senders.items(), key=lambda item: (-item[1], item[0]))
+        return self.rejected_total, top[:limit]
@@ -1,4 +1,5 @@
 """插件接口定义"""
+import time
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
 from enum import Enum
@@ -8,6 +9,7 @@ from telegram import Update, BotCommand
 from telegram.ext import ContextTypes, CommandHandler, Application
 
 from src.auth import UserManager, UserRole
+from src.bot.plugins.limiter import CommandLimiter
 from src.utils.user_utils import UserUtils
 
 
@@ -32,8 +34,15 @@ class CommandInfo:
     is_visible: bool = True             # 是否在菜单中可见
     sort: int = 999                     # 排序权重，数字越小越靠前
     
+    # 限流配置，可在 commands.yaml 中覆盖，管理员不受按用户的限制
+    cooldown: float = 0                 # 同一用户两次调用的最小间隔（秒），0表示不限制
+    rate_limit: int = 0                 # 同一用户在 rate_period 秒内最多调用次数，0表示不限制
+    rate_period: float = 60             # 令牌桶恢复周期（秒）
+    max_concurrency: int = 0            # 该命令同时执行的最大数量，0表示不限制
+    
     # 运行时数据，不在配置中加载
     handler_instance: Optional[CommandHandler] = field(default=None, repr=False)
+    limiter: Optional[CommandLimiter] = field(default=None, repr=False)
 
 
 class PluginInterface(ABC):
@@ -111,9 +120,6 @@ class PluginInterface(ABC):
         """
         async def handler_wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
             """命令处理函数包装器"""
-            # 更新用户缓存信息
-            UserUtils.update_user_cache_from_update(update)
-            
             # 检查用户权限
             if not await self.user_manager.check_permission(update, command_info.required_role):
                 role_name = command_info.required_role.name.lower()
@@ -122,17 +128,39 @@ class PluginInterface(ABC):
                     parse_mode='Markdown'
                 )
                 return
+            
+            # 权限检查通过后才更新用户缓存信息
+            UserUtils.update_user_cache_from_update(update)
                 
             # 获取统计管理器（如果存在）
             stats_manager = context.bot_data.get('stats_manager')
             
-            # 记录命令使用情况
-            if stats_manager:
-                user_id = str(update.effective_user.id)
-                stats_manager.record_command_usage(user_id, command_info.command)
-                
-            # 调用实际处理函数
-            await command_info.handler(update, context, self.user_manager)
+            # 检查命令限流，被限流的调用不执行也不计入统计
+            limiter = command_info.limiter
+            if limiter:
+                user_id = update.effective_user.id
+                is_admin = self.user_manager.get_user_role(user_id) == UserRole.ADMIN
+                refusal = limiter.acquire(str(user_id), per_user=not is_admin)
+                if refusal:
+                    await update.message.reply_text(refusal)
+                    return
+            
+            # 调用实际处理函数，并在结束后记录命令使用情况、执行结果及耗时
+            outcome = "ok"
+            started = time.perf_counter()
+            try:
+                await command_info.handler(update, context, self.user_manager)
+            except Exception:
+                outcome = "error"
+                raise
+            finally:
+                if limiter:
+                    limiter.release()
+                if stats_manager:
+                    elapsed = time.perf_counter() - started
+                    user_id = str(update.effective_user.id)
+                    stats_manager.record_command_usage(user_id, command_info.command, outcome)
+                    stats_manager.record_command_latency(command_info.command, elapsed, outcome)
             
         return handler_wrapper
     
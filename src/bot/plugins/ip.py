@@ -292,21 +292,20 @@ class IPPlugin(PluginInterface):
             if all_users_stats:
                 message_parts.append(f"\n📋 **所有用户详细统计**:")
                 
-                # 获取管理员和普通用户列表
-                admin_ids = set(self.user_manager.admin_ids)
-                user_ids = set(self.user_manager.allowed_user_ids)
-                
                 # 按角色分组显示
                 admin_stats = []
                 user_stats = []
                 
+                # 一次性获取所有用户的显示名称（优先从缓存获取，其余并发请求API）
+                display_names = await UserUtils.get_user_display_names(all_users_stats.keys(), context)
+                
                 for user_id_str, count in sorted(all_users_stats.items(), key=lambda x: int(x[1]), reverse=True):
-                    # 获取用户显示名称（优先从缓存获取，必要时尝试API）
-                    user_display_name = await UserUtils.get_user_display_name(int(user_id_str), context)
+                    user_display_name = display_names[str(user_id_str)]
                     
-                    if user_id_str in admin_ids:
+                    stats_user_role = self.user_manager.get_user_role(user_id_str)
+                    if stats_user_role == UserRole.ADMIN:
                         admin_stats.append(f"🔑 {user_display_name}: {count}次 (管理员)")
-                    elif user_id_str in user_ids:
+                    elif stats_user_role == UserRole.USER:
                         remaining = max(0, user_limit - count)
                         user_stats.append(f"👤 {user_display_name}: {count}/{user_limit}次 (剩余: {remaining})")
                     else:
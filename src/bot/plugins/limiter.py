@@ -0,0 +1,170 @@
+"""命令限流器"""
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class ConcurrencyLimit:
+    """并发数限制：同时执行的处理函数数量不超过 limit"""
+    
+    __slots__ = ('limit', 'active')
+    
+    def __init__(self, limit: int):
+        """初始化
+        
+        Args:
+            limit: 最大并发数
+        """
+        self.limit = limit
+        self.active = 0
+    
+    def try_acquire(self) -> bool:
+        """尝试占用一个名额
+        
+        Returns:
+            bool: 是否占用成功，成功后必须调用 release
+        """
+        if self.active >= self.limit:
+            return False
+        self.active += 1
+        return True
+    
+    def release(self) -> None:
+        """释放一个名额"""
+        self.active -= 1
+
+
+class _PerUserState:
+    """按用户保存限流状态，最多保存 MAX_USERS 个用户，超出时丢弃最久未使用的用户"""
+    
+    MAX_USERS = 4096
+    
+    def __init__(self):
+        self._state: "OrderedDict[str, tuple]" = OrderedDict()
+    
+    def get(self, user_id: str) -> Optional[tuple]:
+        return self._state.get(user_id)
+    
+    def put(self, user_id: str, value: tuple) -> None:
+        self._state[user_id] = value
+        self._state.move_to_end(user_id)
+        if len(self._state) > self.MAX_USERS:
+            self._state.popitem(last=False)
+
+
+class Cooldown(_PerUserState):
+    """冷却时间：同一用户两次调用之间至少间隔 seconds 秒"""
+    
+    def __init__(self, seconds: float):
+        """初始化
+        
+        Args:
+            seconds: 冷却时间（秒）
+        """
+        super().__init__()
+        self.seconds = seconds
+    
+    def wait_time(self, user_id: str, now: float) -> float:
+        """距离下次可调用还需等待的秒数，0表示可以调用"""
+        state = self.get(user_id)
+        return max(0.0, state[0] - now) if state else 0.0
+    
+    def consume(self, user_id: str, now: float) -> None:
+        """记录一次调用"""
+        self.put(user_id, (now + self.seconds,))
+
+
+class TokenBucket(_PerUserState):
+    """令牌桶：每个用户最多连续调用 capacity 次，之后每 period/capacity 秒恢复一次"""
+    
+    def __init__(self, capacity: int, period: float):
+        """初始化
+        
+        Args:
+            capacity: 令牌桶容量
+            period: 令牌从空恢复到满所需时间（秒）
+        """
+        super().__init__()
+        self.capacity = capacity
+        self.rate = capacity / period
+    
+    def _tokens(self, user_id: str, now: float) -> float:
+        """当前可用令牌数"""
+        state = self.get(user_id)
+        if state is None:
+            return float(self.capacity)
+        tokens, updated = state
+        return min(float(self.capacity), tokens + (now - updated) * self.rate)
+    
+    def wait_time(self, user_id: str, now: float) -> float:
+        """距离下次可调用还需等待的秒数，0表示可以调用"""
+        tokens = self._tokens(user_id, now)
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+    
+    def consume(self, user_id: str, now: float) -> None:
+        """消耗一个令牌"""
+        self.put(user_id, (self._tokens(user_id, now) - 1, now))
+
+
+class CommandLimiter:
+    """单个命令的限流器，组合冷却时间、令牌桶、命令并发数和全局并发数
+    
+    所有检查都只涉及常数次字典操作。处理函数在事件循环中串行调度，不需要加锁。
+    """
+    
+    def __init__(self, cooldown: float = 0, rate_limit: int = 0, rate_period: float = 0,
+                 max_concurrency: int = 0, global_limit: Optional[ConcurrencyLimit] = None):
+        """初始化
+        
+        Args:
+            cooldown: 同一用户两次调用的最小间隔（秒），0表示不限制
+            rate_limit: 同一用户在 rate_period 秒内最多调用次数（令牌桶容量），0表示不限制
+            rate_period: 令牌桶恢复周期（秒）
+            max_concurrency: 该命令同时执行的最大数量，0表示不限制
+            global_limit: 所有命令共享的并发数限制
+        """
+        self.cooldown = Cooldown(cooldown) if cooldown > 0 else None
+        self.bucket = TokenBucket(rate_limit, rate_period) if rate_limit > 0 and rate_period > 0 else None
+        self.concurrency = ConcurrencyLimit(max_concurrency) if max_concurrency > 0 else None
+        self.global_limit = global_limit
+    
+    def acquire(self, user_id: str, per_user: bool = True) -> Optional[str]:
+        """尝试开始一次调用
+        
+        Args:
+            user_id: 用户ID
+            per_user: 是否检查按用户的限制（冷却时间、令牌桶），管理员不检查
+        
+        Returns:
+            Optional[str]: 拒绝原因，None表示允许，允许时调用结束后必须调用 release
+        """
+        if per_user and (self.cooldown or self.bucket):
+            now = time.monotonic()
+            wait = max(
+                self.cooldown.wait_time(user_id, now) if self.cooldown else 0.0,
+                self.bucket.wait_time(user_id, now) if self.bucket else 0.0
+            )
+            if wait > 0:
+                return f"⏳ 操作太频繁，请 {max(1, round(wait))} 秒后再试"
+        
+        if self.concurrency and not self.concurrency.try_acquire():
+            return "⏳ 该命令正在处理中，请稍后再试"
+        if self.global_limit and not self.global_limit.try_acquire():
+            if self.concurrency:
+                self.concurrency.release()
+            return "⏳ 机器人繁忙，请稍后再试"
+        
+        if per_user:
+            now = time.monotonic()
+            if self.cooldown:
+                self.cooldown.consume(user_id, now)
+            if self.bucket:
+                self.bucket.consume(user_id, now)
+        return None
+    
+    def release(self) -> None:
+        """结束一次调用，释放并发名额"""
+        if self.concurrency:
+            self.concurrency.release()
+        if self.global_limit:
+            self.global_limit.release()
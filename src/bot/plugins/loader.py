@@ -4,18 +4,51 @@ import inspect
 import os
 import sys
 import pkgutil
-from typing import Dict, List, Type, Set, Any
+import yaml
+from typing import Dict, List, Type, Set, Any, Optional
 
 from telegram import BotCommand
 from telegram.ext import Application
 
-from src.auth import UserManager
-from src.bot.plugins.interface import PluginInterface
+from src.auth import UserManager, UserRole
+from src.bot.plugins.interface import PluginInterface, CommandInfo, CommandCategory
+from src.bot.plugins.limiter import CommandLimiter, ConcurrencyLimit
 from src.logger import logger
 
 
+def _parse_bool(value: Any) -> bool:
+    """严格解析布尔值，只接受YAML中的 true/false
+    
+    Args:
+        value: 配置值
+    
+    Returns:
+        bool: 布尔值
+    
+    Raises:
+        ValueError: 值不是布尔类型，例如加了引号的 "false"
+    """
+    if not isinstance(value, bool):
+        raise ValueError(f"{value!r} 不是布尔值")
+    return value
+
+
 class PluginLoader:
     """插件加载器"""
+    
+    # commands.yaml 中可覆盖的命令字段及其类型转换
+    OVERRIDE_FIELDS = {
+        'description': str,
+        'category': lambda value: CommandCategory[str(value).upper()],
+        'required_role': lambda value: UserRole[str(value).upper()],
+        'is_visible': _parse_bool,
+        'sort': int,
+        'cooldown': float,
+        'rate_limit': int,
+        'rate_period': float,
+        'max_concurrency': int,
+    }
+    
     def __init__(self, user_manager: UserManager, config: Dict[str, Any]):
         """初始化插件加载器
         
@@ -32,6 +65,23 @@ class PluginLoader:
         plugin_config = self.config.get('plugins', {}) or {}
         self.enabled_plugins: List[str] = plugin_config.get('enabled', [])
         self.disabled_plugins: List[str] = plugin_config.get('disabled', [])
+        
+        # 所有命令共享的并发数限制
+        self.global_limit: Optional[ConcurrencyLimit] = None
+        # 插件代码中定义的命令字段，重新应用命令配置前先恢复，已删除的覆盖项不再生效
+        self._command_defaults: Dict[str, Dict[str, Any]] = {}
+    
+    @property
+    def commands_file(self) -> str:
+        """命令配置文件路径，默认与主配置文件在同一目录"""
+        return self._commands_file(self.config)
+    
+    @staticmethod
+    def _commands_file(config: Dict[str, Any]) -> str:
+        """从配置中获取命令配置文件路径"""
+        return config.get('commands_file') or os.path.join(
+            os.path.dirname(config.get('config_file', 'config.yaml')), 'commands.yaml'
+        )
     
     def discover_plugins(self) -> None:
         """发现所有可用插件"""
@@ -157,8 +207,106 @@ class PluginLoader:
             except Exception as e:
                 logger.error(f"设置插件 {plugin_name} 时出错: {str(e)}", exc_info=True)
         
+        # 应用命令配置文件中的覆盖项和限流配置
+        self.apply_command_config()
+        
         logger.info("所有插件设置完成")
     
+    def _load_command_config(self, commands_file: str) -> Dict[str, Any]:
+        """读取命令配置文件
+        
+        Args:
+            commands_file: 命令配置文件路径
+        
+        Returns:
+            Dict: 配置内容，文件不存在或读取失败时返回空字典
+        """
+        if not os.path.exists(commands_file):
+            return {}
+        try:
+            with open(commands_file, 'r', encoding='utf-8') as f:
+                return yaml.safe_load(f) or {}
+        except Exception as e:
+            logger.error(f"读取命令配置文件 {commands_file} 失败: {str(e)}")
+            return {}
+    
+    def apply_command_config(self, config: Dict[str, Any] = None) -> None:
+        """将命令配置文件中的覆盖项写入各插件的 CommandInfo，并为每个命令创建限流器
+        
+        每次都从插件定义的默认值开始应用，可在配置热加载后重复调用。
+        设置了 max_concurrency 的命令以非阻塞方式运行，其余命令仍逐个执行；
+        全局并发数限制只约束非阻塞运行的命令，不会让其他命令变为非阻塞。
+        
+        Args:
+            config: 读取 commands_file 的配置字典，默认为初始化时的配置
+        """
+        commands_file = self._commands_file(config if config is not None else self.config)
+        command_config = self._load_command_config(commands_file)
+        overrides = command_config.get('commands', {}) or {}
+        limits = command_config.get('limits', {}) or {}
+        
+        max_concurrency = int(limits.get('max_concurrency', 0) or 0)
+        self.global_limit = ConcurrencyLimit(max_concurrency) if max_concurrency > 0 else None
+        
+        known_commands = set()
+        for plugin in self.plugins.values():
+            for command_name, command_info in plugin.commands.items():
+                known_commands.add(command_name)
+                defaults = self._command_defaults.setdefault(command_name, {
+                    field_name: getattr(command_info, field_name) for field_name in self.OVERRIDE_FIELDS
+                })
+                for field_name, value in defaults.items():
+                    setattr(command_info, field_name, value)
+                if overrides.get(command_name):
+                    self._apply_command_override(command_info, overrides[command_name])
+                
+                limiter = self._create_limiter(command_info)
+                command_info.limiter = limiter
+                if command_info.handler_instance:
+                    command_info.handler_instance.block = command_info.max_concurrency <= 0
+        
+        for command_name in set(overrides) - known_commands:
+            logger.debug(f"命令配置中的命令 {command_name} 未加载，已忽略")
+        if overrides or limits:
+            logger.info(f"已应用命令配置 {commands_file}")
+    
+    def _apply_command_override(self, command_info: CommandInfo, override: Dict[str, Any]) -> None:
+        """将单个命令的覆盖项写入 CommandInfo，无效的字段记录警告后忽略
+        
+        Args:
+            command_info: 命令信息
+            override: 覆盖项
+        """
+        for field_name, value in override.items():
+            converter = self.OVERRIDE_FIELDS.get(field_name)
+            if converter is None:
+                logger.warning(f"命令 {command_info.command} 的配置项 {field_name} 不支持，已忽略")
+                continue
+            try:
+                setattr(command_info, field_name, converter(value))
+            except (KeyError, TypeError, ValueError):
+                logger.warning(f"命令 {command_info.command} 的配置项 {field_name} 的值 {value!r} 无效，已忽略")
+    
+    def _create_limiter(self, command_info: CommandInfo) -> Optional[CommandLimiter]:
+        """根据命令的限流配置创建限流器
+        
+        Args:
+            command_info: 命令信息
+        
+        Returns:
+            Optional[CommandLimiter]: 限流器，没有任何限制时返回None
+        """
+        if not (command_info.cooldown > 0 or command_info.rate_limit > 0
+                or command_info.max_concurrency > 0 or self.global_limit):
+            return None
+        return CommandLimiter(
+            cooldown=command_info.cooldown,
+            rate_limit=command_info.rate_limit,
+            rate_period=command_info.rate_period,
+            max_concurrency=command_info.max_concurrency,
+            global_limit=self.global_limit
+        )
+    
     async def setup_bot_commands(self, app: Application) -> None:
         """设置机器人命令列表
         
@@ -1,8 +1,14 @@
 """用户使用统计插件"""
+import os
+import csv
+import json
+import asyncio
+import tempfile
 from telegram import Update
 from telegram.ext import ContextTypes
 from datetime import date, timedelta
 from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from src.auth import UserManager, UserRole
 from src.logger import logger
@@ -17,6 +23,12 @@ class StatsPlugin(PluginInterface):
     description = "用户使用统计插件"
     version = "1.0.0"
     
+    # /stats_export 支持的导出格式
+    EXPORT_FORMATS = ("csv", "jsonl")
+    
+    # 日期区间的最大天数，避免单个命令扫描多年的统计文件
+    MAX_RANGE_DAYS = 366
+    
     def register_commands(self) -> None:
         """注册统计相关命令"""
         # 注册总体统计命令
@@ -75,7 +87,7 @@ class StatsPlugin(PluginInterface):
         self.register_command(
             CommandInfo(
                 command="stats_user",
-                description="显示指定用户的统计信息，格式: /stats_user [user_id]",
+                description="显示指定用户的统计信息，格式: /stats_user [user_id|@username]",
                 handler=self.stats_user_command,
                 category=CommandCategory.STATS,
                 required_role=UserRole.ADMIN,
@@ -83,6 +95,84 @@ class StatsPlugin(PluginInterface):
                 sort=5
             )
         )
+        
+        # 注册日期区间统计命令
+        self.register_command(
+            CommandInfo(
+                command="stats_range",
+                description="显示日期区间的命令使用统计，格式: /stats_range <开始日期> <结束日期> 或 /stats_range 7d|30d|90d",
+                handler=self.stats_range_command,
+                category=CommandCategory.STATS,
+                required_role=UserRole.ADMIN,
+                is_visible=True,
+                sort=6
+            )
+        )
+        
+        # 注册命令耗时统计命令
+        self.register_command(
+            CommandInfo(
+                command="stats_latency",
+                description="显示各命令执行耗时的分位数（p50/p95/p99）",
+                handler=self.stats_latency_command,
+                category=CommandCategory.STATS,
+                required_role=UserRole.ADMIN,
+                is_visible=True,
+                sort=7
+            )
+        )
+        
+        # 注册高频用户与命令统计命令
+        self.register_command(
+            CommandInfo(
+                command="stats_top",
+                description="显示最近最活跃的用户和命令，格式: /stats_top [hour|day]",
+                handler=self.stats_top_command,
+                category=CommandCategory.STATS,
+                required_role=UserRole.ADMIN,
+                is_visible=True,
+                sort=8
+            )
+        )
+        
+        # 注册活跃用户与留存统计命令
+        self.register_command(
+            CommandInfo(
+                command="stats_active",
+                description="显示日/周/月活跃用户数及留存，格式: /stats_active [日期]",
+                handler=self.stats_active_command,
+                category=CommandCategory.STATS,
+                required_role=UserRole.ADMIN,
+                is_visible=True,
+                sort=9
+            )
+        )
+        
+        # 注册统计导出命令
+        self.register_command(
+            CommandInfo(
+                command="stats_export",
+                description="导出日期区间的明细统计文件，格式: /stats_export [区间] [csv|jsonl]",
+                handler=self.stats_export_command,
+                category=CommandCategory.STATS,
+                required_role=UserRole.ADMIN,
+                is_visible=True,
+                sort=10
+            )
+        )
+        
+        # 注册按小时统计命令（由原始事件日志重新聚合）
+        self.register_command(
+            CommandInfo(
+                command="stats_hourly",
+                description="显示某天每小时的命令使用次数，格式: /stats_hourly [日期]",
+                handler=self.stats_hourly_command,
+                category=CommandCategory.STATS,
+                required_role=UserRole.ADMIN,
+                is_visible=True,
+                sort=11
+            )
+        )
     
     async def stats_total_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_manager: UserManager):
         """处理/stats_total命令，显示总体命令使用统计，仅管理员可用"""
@@ -156,16 +246,285 @@ class StatsPlugin(PluginInterface):
         # 获取命令参数
         args = context.args
         if not args:
-            await update.message.reply_text("❌ 请指定用户ID，格式: /stats_user [user_id]")
+            await update.message.reply_text("❌ 请指定用户ID或用户名，格式: /stats_user [user_id|@username]")
             return
             
-        user_id = args[0]
+        user_id = UserUtils.resolve_user_id(args[0])
+        if user_id is None:
+            await update.message.reply_text(f"❌ 无法识别用户: {args[0]}，用户名只能解析与机器人交互过的用户")
+            return
         try:
             await self.show_user_stats(update, stats_manager, user_id, context)
         except Exception as e:
             logger.error(f"显示指定用户统计时出错: {str(e)}")
             await update.message.reply_text(f"显示统计数据时出错: {str(e)}")
     
+    async def stats_range_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_manager: UserManager):
+        """处理/stats_range命令，显示日期区间的命令使用统计，仅管理员可用"""
+        
+        # 获取统计管理器
+        stats_manager: UserStatsManager = context.bot_data.get('stats_manager')
+        if not stats_manager:
+            await update.message.reply_text("❌ 统计功能未启用")
+            return
+        
+        date_range = self.parse_date_range(context.args)
+        if not date_range:
+            await update.message.reply_text(
+                "❌ 请指定日期区间\n"
+                "格式: /stats_range <开始日期> <结束日期>\n"
+                "或: /stats_range 7d | 30d | 90d\n"
+                "示例: /stats_range 2024-01-01 2024-01-31"
+            )
+            return
+        
+        if not self.is_range_allowed(*date_range):
+            await update.message.reply_text(f"❌ 日期区间不能超过 {self.MAX_RANGE_DAYS} 天")
+            return
+        
+        try:
+            await self.show_range_stats(update, stats_manager, *date_range)
+        except Exception as e:
+            logger.error(f"显示区间统计时出错: {str(e)}")
+            await update.message.reply_text(f"显示统计数据时出错: {str(e)}")
+    
+    async def stats_latency_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_manager: UserManager):
+        """处理/stats_latency命令，显示各命令执行耗时的分位数，仅管理员可用"""
+        
+        # 获取统计管理器
+        stats_manager: UserStatsManager = context.bot_data.get('stats_manager')
+        if not stats_manager:
+            await update.message.reply_text("❌ 统计功能未启用")
+            return
+        
+        try:
+            await self.show_latency_stats(update, stats_manager)
+        except Exception as e:
+            logger.error(f"显示耗时统计时出错: {str(e)}")
+            await update.message.reply_text(f"显示统计数据时出错: {str(e)}")
+    
+    async def stats_top_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_manager: UserManager):
+        """处理/stats_top命令，显示最近一小时或一天内最活跃的用户和命令，仅管理员可用"""
+        
+        # 获取统计管理器
+        stats_manager: UserStatsManager = context.bot_data.get('stats_manager')
+        if not stats_manager:
+            await update.message.reply_text("❌ 统计功能未启用")
+            return
+        
+        window = context.args[0].lower() if context.args else "hour"
+        if window not in ("hour", "day"):
+            await update.message.reply_text("❌ 时间窗口只能是 hour 或 day\n格式: /stats_top [hour|day]")
+            return
+        
+        try:
+            await self.show_top_stats(update, stats_manager, window, context)
+        except Exception as e:
+            logger.error(f"显示高频统计时出错: {str(e)}")
+            await update.message.reply_text(f"显示统计数据时出错: {str(e)}")
+    
+    async def stats_active_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_manager: UserManager):
+        """处理/stats_active命令，显示活跃用户数及留存，仅管理员可用"""
+        
+        # 获取统计管理器
+        stats_manager: UserStatsManager = context.bot_data.get('stats_manager')
+        if not stats_manager:
+            await update.message.reply_text("❌ 统计功能未启用")
+            return
+        
+        day = date.today()
+        if context.args:
+            try:
+                day = date.fromisoformat(context.args[0])
+            except ValueError:
+                await update.message.reply_text("❌ 日期格式错误\n格式: /stats_active [YYYY-MM-DD]")
+                return
+            if day > date.today():
+                await update.message.reply_text("❌ 日期不能晚于今天\n格式: /stats_active [YYYY-MM-DD]")
+                return
+        
+        try:
+            await self.show_active_stats(update, stats_manager, day)
+        except Exception as e:
+            logger.error(f"显示活跃用户统计时出错: {str(e)}")
+            await update.message.reply_text(f"显示统计数据时出错: {str(e)}")
+    
+    async def stats_hourly_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_manager: UserManager):
+        """处理/stats_hourly命令，显示某天每小时的命令使用次数，仅管理员可用"""
+        
+        # 获取统计管理器
+        stats_manager: UserStatsManager = context.bot_data.get('stats_manager')
+        if not stats_manager:
+            await update.message.reply_text("❌ 统计功能未启用")
+            return
+        
+        if not stats_manager.event_log:
+            await update.message.reply_text("❌ 按小时统计需要在配置中启用 stats.event_log")
+            return
+        
+        day = date.today()
+        if context.args:
+            try:
+                day = date.fromisoformat(context.args[0])
+            except ValueError:
+                await update.message.reply_text("❌ 日期格式错误\n格式: /stats_hourly [YYYY-MM-DD]")
+                return
+        
+        try:
+            await self.show_hourly_stats(update, stats_manager, day)
+        except Exception as e:
+            logger.error(f"显示按小时统计时出错: {str(e)}")
+            await update.message.reply_text(f"显示统计数据时出错: {str(e)}")
+    
+    async def stats_export_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_manager: UserManager):
+        """处理/stats_export命令，将明细统计导出为文件发送，仅管理员可用"""
+        
+        # 获取统计管理器
+        stats_manager: UserStatsManager = context.bot_data.get('stats_manager')
+        if not stats_manager:
+            await update.message.reply_text("❌ 统计功能未启用")
+            return
+        
+        # 最后一个参数可以指定文件格式，默认CSV
+        args = list(context.args or [])
+        export_format = "csv"
+        if args and args[-1].lower() in self.EXPORT_FORMATS:
+            export_format = args.pop().lower()
+        
+        # 未指定区间时导出最近30天
+        date_range = self.parse_date_range(args) if args else self.parse_date_range(["30d"])
+        if not date_range:
+            await update.message.reply_text(
+                "❌ 日期区间格式错误\n"
+                "格式: /stats_export [<开始日期> <结束日期> | 7d | 30d] [csv|jsonl]\n"
+                "示例: /stats_export 2024-01-01 2024-12-31 jsonl"
+            )
+            return
+        
+        if not self.is_range_allowed(*date_range):
+            await update.message.reply_text(f"❌ 日期区间不能超过 {self.MAX_RANGE_DAYS} 天")
+            return
+        
+        start, end = date_range
+        export_file = None
+        try:
+            # 逐行写入临时文件，在线程池中执行以免阻塞事件循环
+            loop = asyncio.get_running_loop()
+            export_file, row_count = await loop.run_in_executor(
+                None, self.write_export_file, stats_manager.iter_daily_rows(start, end), export_format
+            )
+            
+            if not row_count:
+                await update.message.reply_text(f"📊 {start.isoformat()} 至 {end.isoformat()} 没有统计数据")
+                return
+            
+            with open(export_file, 'rb') as f:
+                await update.message.reply_document(
+                    document=f,
+                    filename=f"stats_{start.isoformat()}_{end.isoformat()}.{export_format}",
+                    caption=f"📊 {start.isoformat()} 至 {end.isoformat()} 明细统计，共 {row_count} 行"
+                )
+        except Exception as e:
+            logger.error(f"导出统计数据时出错: {str(e)}")
+            await update.message.reply_text(f"导出统计数据时出错: {str(e)}")
+        finally:
+            if export_file and os.path.exists(export_file):
+                os.remove(export_file)
+    
+    @staticmethod
+    def write_export_file(rows: Iterable[Tuple[str, str, str, int]], export_format: str) -> Tuple[str, int]:
+        """将明细行写入临时文件
+        
+        Args:
+            rows: (日期, 用户ID, 命令, 次数) 的可迭代对象
+            export_format: 文件格式，csv 或 jsonl
+        
+        Returns:
+            Tuple[str, int]: (临时文件路径, 行数)，由调用方负责删除文件
+        """
+        fd, export_file = tempfile.mkstemp(prefix="stats-export-", suffix=f".{export_format}")
+        row_count = 0
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                if export_format == "csv":
+                    writer = csv.writer(f)
+                    writer.writerow(["date", "user_id", "command", "count"])
+                    for row in rows:
+                        writer.writerow(row)
+                        row_count += 1
+                else:
+                    for day_str, user_id, command, count in rows:
+                        f.write(json.dumps(
+                            {'date': day_str, 'user_id': user_id, 'command': command, 'count': count},
+                            ensure_ascii=False
+                        ) + "\n")
+                        row_count += 1
+        except Exception:
+            os.remove(export_file)
+            raise
+        return export_file, row_count
+    
+    @staticmethod
+    def format_duration(seconds: float) -> str:
+        """格式化耗时
+        
+        Args:
+            seconds: 耗时（秒）
+        
+        Returns:
+            str: 不足1秒显示毫秒，否则显示秒
+        """
+        if seconds < 1:
+            return f"{seconds * 1000:.0f}ms"
+        return f"{seconds:.2f}s"
+    
+    @staticmethod
+    def parse_date_range(args: List[str]) -> Optional[Tuple[date, date]]:
+        """解析日期区间参数
+        
+        支持 "<开始日期> <结束日期>"（YYYY-MM-DD）以及 "7d"、"30"
+        这类表示最近N天（含今天）的写法。
+        
+        Args:
+            args: 命令参数
+            
+        Returns:
+            Optional[Tuple[date, date]]: (开始日期, 结束日期)，参数无效时返回None
+        """
+        if not args:
+            return None
+        
+        try:
+            if len(args) == 1:
+                days = int(args[0].lower().rstrip('d'))
+                if days <= 0:
+                    return None
+                end = date.today()
+                return end - timedelta(days=days - 1), end
+            
+            start = date.fromisoformat(args[0])
+            end = date.fromisoformat(args[1])
+        except (ValueError, OverflowError):
+            # 天数过大时日期计算会溢出
+            return None
+        
+        if start > end:
+            start, end = end, start
+        return start, end
+    
+    @classmethod
+    def is_range_allowed(cls, start: date, end: date) -> bool:
+        """日期区间是否不超过 MAX_RANGE_DAYS 天
+        
+        Args:
+            start: 开始日期（包含）
+            end: 结束日期（包含）
+            
+        Returns:
+            bool: 是否允许查询
+        """
+        return (end - start).days + 1 <= cls.MAX_RANGE_DAYS
+    
     async def show_total_stats(self, update: Update, stats_manager: UserStatsManager):
         """显示总体统计信息
         
@@ -173,27 +532,23 @@ class StatsPlugin(PluginInterface):
             update: Telegram更新对象
             stats_manager: 统计管理器实例
         """
-        # 获取命令总体摘要
-        command_summary = stats_manager.get_command_summary()
+        # 获取已按使用次数降序排列的命令总体排名
+        sorted_commands = stats_manager.get_top_commands()
         
-        if not command_summary:
+        if not sorted_commands:
             await update.message.reply_text("📊 目前还没有统计数据")
             return
         
         # 构建消息
         message = "📊 *命令使用总体统计*\n\n"
         
-        # 按使用次数降序排序
-        sorted_commands = sorted(command_summary.items(), key=lambda x: x[1], reverse=True)
-        
         for command, count in sorted_commands:
             # 转义命令名称中的下划线
             escaped_command = command.replace('_', '\\_')
             message += f"/{escaped_command}: {count}次\n"
         
-        # 计算总使用次数
-        total_usage = sum(command_summary.values())
-        message += f"\n总计: {total_usage}次"
+        # 总使用次数
+        message += f"\n总计: {stats_manager.get_total_usage()}次"
         
         # 发送消息
         try:
@@ -241,6 +596,246 @@ class StatsPlugin(PluginInterface):
             logger.error(f"使用Markdown格式发送每日统计失败: {str(e)}")
             await update.message.reply_text(message.replace('*', ''), parse_mode=None)
     
+    async def show_range_stats(self, update: Update, stats_manager: UserStatsManager, start: date, end: date):
+        """显示日期区间统计信息
+        
+        Args:
+            update: Telegram更新对象
+            stats_manager: 统计管理器实例
+            start: 开始日期
+            end: 结束日期
+        """
+        title = f"{start.isoformat()} ~ {end.isoformat()}"
+        
+        # 区间最长一年，需要读取较多汇总文件，在线程池中计算
+        loop = asyncio.get_running_loop()
+        command_summary, active_users = await loop.run_in_executor(
+            None, self.collect_range_stats, stats_manager, start, end
+        )
+        
+        if not command_summary:
+            await update.message.reply_text(f"📊 {title} 没有统计数据")
+            return
+        
+        # 构建消息
+        message = f"📊 *{title} 命令使用统计*\n\n"
+        
+        # 按使用次数降序排序
+        sorted_commands = sorted(command_summary.items(), key=lambda x: x[1], reverse=True)
+        
+        for command, count in sorted_commands:
+            # 转义命令名称中的下划线
+            escaped_command = command.replace('_', '\\_')
+            message += f"/{escaped_command}: {count}次\n"
+        
+        # 计算总使用次数
+        total_usage = sum(command_summary.values())
+        message += f"\n总计: {total_usage}次"
+        message += f"\n活跃用户: {active_users}人"
+        
+        # 发送消息
+        try:
+            await update.message.reply_text(message, parse_mode='Markdown')
+        except Exception as e:
+            # 如果Markdown格式失败，尝试无格式发送
+            logger.error(f"使用Markdown格式发送区间统计失败: {str(e)}")
+            await update.message.reply_text(message.replace('*', ''), parse_mode=None)
+    
+    @staticmethod
+    def collect_range_stats(stats_manager: UserStatsManager, start: date, end: date) -> Tuple[Dict[str, int], int]:
+        """计算日期区间的命令汇总和去重活跃用户数，可在线程池中调用
+        
+        活跃用户数由每日活跃用户位图求并集得到，不需要合并每个用户的明细统计。
+        
+        Args:
+            stats_manager: 统计管理器实例
+            start: 开始日期
+            end: 结束日期
+        
+        Returns:
+            Tuple: ({命令: 次数}, 活跃用户数)，没有统计数据时活跃用户数为0
+        """
+        command_summary = stats_manager.get_range_command_summary(start, end)
+        if not command_summary:
+            return command_summary, 0
+        return command_summary, stats_manager.get_active_user_count(start, end)
+    
+    async def show_latency_stats(self, update: Update, stats_manager: UserStatsManager):
+        """显示各命令执行耗时统计
+        
+        Args:
+            update: Telegram更新对象
+            stats_manager: 统计管理器实例
+        """
+        latency_summary = stats_manager.get_latency_summary()
+        
+        if not latency_summary:
+            await update.message.reply_text("⏱ 自启动以来还没有命令耗时数据")
+            return
+        
+        # 构建消息，按p95从慢到快排序
+        message = "⏱ *命令执行耗时统计*（自启动以来）\n\n"
+        
+        sorted_commands = sorted(latency_summary.items(), key=lambda x: x[1]['p95'], reverse=True)
+        
+        for command, latency in sorted_commands:
+            # 转义命令名称中的下划线
+            escaped_command = command.replace('_', '\\_')
+            message += f"/{escaped_command}: {latency['count']}次"
+            if latency['errors']:
+                message += f"，出错{latency['errors']}次"
+            message += "\n"
+            message += (
+                f"  p50 {self.format_duration(latency['p50'])} | "
+                f"p95 {self.format_duration(latency['p95'])} | "
+                f"p99 {self.format_duration(latency['p99'])} | "
+                f"最大 {self.format_duration(latency['max'])}\n"
+            )
+        
+        # 发送消息
+        try:
+            await update.message.reply_text(message, parse_mode='Markdown')
+        except Exception as e:
+            # 如果Markdown格式失败，尝试无格式发送
+            logger.error(f"使用Markdown格式发送耗时统计失败: {str(e)}")
+            await update.message.reply_text(message.replace('*', ''), parse_mode=None)
+    
+    async def show_top_stats(self, update: Update, stats_manager: UserStatsManager, window: str, context: ContextTypes.DEFAULT_TYPE):
+        """显示最近最活跃的用户和命令
+        
+        Args:
+            update: Telegram更新对象
+            stats_manager: 统计管理器实例
+            window: 时间窗口，hour 或 day
+            context: Telegram上下文对象（用于获取用户昵称）
+        """
+        heavy_hitters = stats_manager.get_heavy_hitters(window)
+        window_name = "一小时" if window == "hour" else "一天"
+        
+        if not heavy_hitters['users']:
+            await update.message.reply_text(f"🔥 最近{window_name}内没有命令使用记录")
+            return
+        
+        # 构建消息
+        message = f"🔥 *最近{window_name}最活跃*（估计值）\n\n"
+        
+        display_names = await UserUtils.get_user_display_names(
+            [user_id for user_id, _ in heavy_hitters['users']], context
+        )
+        
+        message += "*用户:*\n"
+        for index, (user_id, count) in enumerate(heavy_hitters['users'], 1):
+            message += f"{index}. {display_names[user_id]}: {count}次\n"
+        
+        message += "\n*命令:*\n"
+        for command, count in heavy_hitters['commands']:
+            # 转义命令名称中的下划线
+            escaped_command = command.replace('_', '\\_')
+            message += f"/{escaped_command}: {count}次\n"
+        
+        # 启动以来被拦截的未授权用户
+        access_gate = context.bot_data.get('access_gate')
+        if access_gate:
+            rejected_total, rejected_senders = access_gate.get_rejected_summary()
+            if rejected_total:
+                message += f"\n*被拒绝的未授权访问:* {rejected_total}次\n"
+                for user_id, count in rejected_senders:
+                    message += f"`{user_id}`: {count}次\n"
+        
+        # 发送消息
+        try:
+            await update.message.reply_text(message, parse_mode='Markdown')
+        except Exception as e:
+            # 如果Markdown格式失败，尝试无格式发送
+            logger.error(f"使用Markdown格式发送高频统计失败: {str(e)}")
+            await update.message.reply_text(message.replace('*', ''), parse_mode=None)
+    
+    async def show_active_stats(self, update: Update, stats_manager: UserStatsManager, day: date):
+        """显示活跃用户数及留存
+        
+        Args:
+            update: Telegram更新对象
+            stats_manager: 统计管理器实例
+            day: 统计截至的日期
+        """
+        # 位图可能需要读盘或根据每日统计回填，在线程池中计算
+        loop = asyncio.get_running_loop()
+        active, retention = await loop.run_in_executor(None, self.collect_active_stats, stats_manager, day)
+        
+        # 构建消息
+        message = f"👥 *活跃用户统计* ({day.isoformat()})\n\n"
+        message += f"日活 (DAU): {active['dau']}人\n"
+        message += f"周活 (WAU，近7天): {active['wau']}人\n"
+        message += f"月活 (MAU，近30天): {active['mau']}人\n"
+        
+        # 第N日留存：N天前活跃的用户中，当天仍然活跃的比例
+        message += "\n*留存:*\n"
+        for days_after, (retained, cohort_size) in retention.items():
+            cohort_day = day - timedelta(days=days_after)
+            if cohort_size:
+                message += f"第{days_after}日留存: {retained}/{cohort_size} ({retained / cohort_size:.1%})\n"
+            else:
+                message += f"第{days_after}日留存: {cohort_day.isoformat()} 无活跃用户\n"
+        
+        # 发送消息
+        try:
+            await update.message.reply_text(message, parse_mode='Markdown')
+        except Exception as e:
+            # 如果Markdown格式失败，尝试无格式发送
+            logger.error(f"使用Markdown格式发送活跃用户统计失败: {str(e)}")
+            await update.message.reply_text(message.replace('*', ''), parse_mode=None)
+    
+    async def show_hourly_stats(self, update: Update, stats_manager: UserStatsManager, day: date):
+        """显示某天每小时的命令使用次数
+        
+        Args:
+            update: Telegram更新对象
+            stats_manager: 统计管理器实例
+            day: 日期
+        """
+        # 需要逐行读取当天的事件分段，在线程池中聚合
+        loop = asyncio.get_running_loop()
+        hourly = await loop.run_in_executor(None, stats_manager.get_hourly_summary, day)
+        
+        if not hourly:
+            await update.message.reply_text(f"🕐 {day.isoformat()} 没有命令事件记录（超过保留天数的事件已被删除）")
+            return
+        
+        # 构建消息，每小时显示总次数和最常用的命令
+        message = f"🕐 *每小时命令使用统计* ({day.isoformat()})\n\n"
+        for hour in sorted(hourly):
+            commands = hourly[hour]
+            top_command, top_count = max(commands.items(), key=lambda x: x[1])
+            # 转义命令名称中的下划线
+            escaped_command = top_command.replace('_', '\\_')
+            message += f"{hour:02d}:00 - {sum(commands.values())}次（最多: /{escaped_command} {top_count}次）\n"
+        
+        # 发送消息
+        try:
+            await update.message.reply_text(message, parse_mode='Markdown')
+        except Exception as e:
+            # 如果Markdown格式失败，尝试无格式发送
+            logger.error(f"使用Markdown格式发送按小时统计失败: {str(e)}")
+            await update.message.reply_text(message.replace('*', ''), parse_mode=None)
+    
+    @staticmethod
+    def collect_active_stats(stats_manager: UserStatsManager, day: date) -> Tuple[Dict[str, int], Dict[int, Tuple[int, int]]]:
+        """计算截至某天的活跃用户数和第1、7、30日留存，可在线程池中调用
+        
+        Args:
+            stats_manager: 统计管理器实例
+            day: 统计截至的日期，不能晚于今天
+        
+        Returns:
+            Tuple: (活跃用户数, {N: (留存人数, 同期群人数)})
+        """
+        active = stats_manager.get_active_summary(day)
+        retention = {
+            days_after: stats_manager.get_retention(day - timedelta(days=days_after), [days_after])[days_after]
+            for days_after in (1, 7, 30)
+        }
+        return active, retention
+    
     async def show_user_stats(self, update: Update, stats_manager: UserStatsManager, user_id: str, context: ContextTypes.DEFAULT_TYPE = None):
         """显示用户统计信息
         
@@ -318,13 +913,18 @@ class StatsPlugin(PluginInterface):
         admin_ids = all_users['admins']
         normal_user_ids = all_users['users']
         
+        # 一次性获取有统计数据的用户的显示名称
+        display_names = await UserUtils.get_user_display_names(
+            [user_id for user_id in admin_ids + normal_user_ids if user_id in user_menu_stats], context
+        )
+        
         # 构建消息
         message = "📊 *各用户菜单使用详情统计*\n\n"
         
         # 先显示管理员
         for user_id in admin_ids:
             if user_id in user_menu_stats:
-                user_display_name = await UserUtils.get_user_display_name(user_id, context)
+                user_display_name = display_names[user_id]
                 message += f"👑 {user_display_name}:\n"
                 
                 # 按使用次数对命令排序
@@ -340,7 +940,7 @@ class StatsPlugin(PluginInterface):
         # 再显示普通用户
         for user_id in normal_user_ids:
             if user_id in user_menu_stats:
-                user_display_name = await UserUtils.get_user_display_name(user_id, context)
+                user_display_name = display_names[user_id]
                 message += f"👤 {user_display_name}:\n"
                 
                 # 按使用次数对命令排序
@@ -388,13 +988,18 @@ class StatsPlugin(PluginInterface):
         admin_ids = all_users['admins']
         normal_user_ids = all_users['users']
         
+        # 一次性获取有统计数据的用户的显示名称
+        display_names = await UserUtils.get_user_display_names(
+            [user_id for user_id in admin_ids + normal_user_ids if user_id in user_menu_stats], context
+        )
+        
         # 构建消息
         message = f"📊 *{day.isoformat()} 各用户菜单使用详情*\n\n"
         
         # 先显示管理员
         for user_id in admin_ids:
             if user_id in user_menu_stats:
-                user_display_name = await UserUtils.get_user_display_name(user_id, context)
+                user_display_name = display_names[user_id]
                 message += f"👑 {user_display_name}:\n"
                 
                 # 按使用次数对命令排序
@@ -410,7 +1015,7 @@ class StatsPlugin(PluginInterface):
         # 再显示普通用户
         for user_id in normal_user_ids:
             if user_id in user_menu_stats:
-                user_display_name = await UserUtils.get_user_display_name(user_id, context)
+                user_display_name = display_names[user_id]
                 message += f"👤 {user_display_name}:\n"
                 
                 # 按使用次数对命令排序
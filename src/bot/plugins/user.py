@@ -1,6 +1,12 @@
 """用户管理插件"""
+import io
+import re
+import csv
+from typing import List, Optional, Tuple
+
 from telegram import Update
 from telegram.ext import ContextTypes
+from telegram.helpers import escape_markdown
 
 from src.auth import UserManager, UserRole
 from src.bot.plugins.interface import PluginInterface, CommandInfo, CommandCategory
@@ -14,6 +20,11 @@ class UserPlugin(PluginInterface):
     description = "用户管理插件"
     version = "1.0.0"
     
+    # 批量导入时文件大小上限（字节）
+    MAX_IMPORT_BYTES = 1024 * 1024
+    # 批量操作回复中最多列出的跳过条目数
+    SKIPPED_PREVIEW = 10
+    
     def register_commands(self) -> None:
         """注册用户管理相关命令"""
         # 用户列表命令
@@ -32,7 +43,7 @@ class UserPlugin(PluginInterface):
         self.register_command(
             CommandInfo(
                 command="adduser",
-                description="添加普通用户",
+                description="添加普通用户，支持多个ID或回复文件",
                 handler=self.add_user_command,
                 category=CommandCategory.USER,
                 required_role=UserRole.ADMIN,
@@ -44,7 +55,7 @@ class UserPlugin(PluginInterface):
         self.register_command(
             CommandInfo(
                 command="deluser",
-                description="删除普通用户",
+                description="删除普通用户，支持多个ID或回复文件",
                 handler=self.remove_user_command,
                 category=CommandCategory.USER,
                 required_role=UserRole.ADMIN,
@@ -64,6 +75,9 @@ class UserPlugin(PluginInterface):
         # 获取所有用户列表
         users = user_manager.get_all_users()
         
+        # 一次性获取所有用户的显示名称
+        display_names = await UserUtils.get_user_display_names(users['admins'] + users['users'], context)
+        
         # 构建回复消息
         message = "📋 *用户列表*\n\n"
         
@@ -73,66 +87,215 @@ class UserPlugin(PluginInterface):
             message += "  _无管理员用户_\n"
         else:
             for i, admin_id in enumerate(users['admins'], 1):
-                user_display_name = await UserUtils.get_user_display_name(int(admin_id), context)
-                message += f"  {i}. {user_display_name}\n"
+                message += f"  {i}. {display_names[str(admin_id)]}\n"
         
         message += "\n*👤 普通用户:*\n"
         if not users['users']:
             message += "  _无普通用户_\n"
         else:
             for i, user_id in enumerate(users['users'], 1):
-                user_display_name = await UserUtils.get_user_display_name(user_id, context)
-                message += f"  {i}. {user_display_name}\n"
+                message += f"  {i}. {display_names[str(user_id)]}\n"
         
         # 显示管理命令帮助
         message += "\n*🔧 用户管理命令:*\n"
-        message += "  `/adduser <用户ID>` - 添加普通用户\n"
-        message += "  `/deluser <用户ID>` - 删除普通用户\n"
+        message += "  `/adduser <用户ID|@用户名> ...` - 添加普通用户\n"
+        message += "  `/deluser <用户ID|@用户名> ...` - 删除普通用户\n"
+        message += "  回复包含用户ID的消息或 txt/csv 文件可批量添加或删除\n"
         
         await update.message.reply_text(message, parse_mode='Markdown')
     
     async def add_user_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_manager: UserManager):
         """处理/adduser命令，添加普通用户
         
+        支持一次提供多个用户ID或用户名，也可以回复一条包含用户ID的文本消息或 txt/csv 文件，
+        全部校验后一次性添加，只写入一次配置文件。
+        
         Args:
             update: Telegram更新对象
             context: 上下文对象
             user_manager: 用户管理器实例
         """
+        tokens = await self.collect_user_tokens(update, context)
+        if tokens is None:
+            return
         
         # 检查命令参数
-        if not context.args or len(context.args) != 1:
-            await update.message.reply_text("❌ 请提供用户ID\n用法: `/adduser <用户ID>`", parse_mode='Markdown')
+        if not tokens:
+            await update.message.reply_text(
+                "❌ 请提供用户ID或用户名\n"
+                "用法: `/adduser <用户ID|@用户名> ...`\n"
+                "或回复一条包含用户ID的消息或 txt/csv 文件",
+                parse_mode='Markdown'
+            )
             return
         
-        user_id = context.args[0]
+        user_ids, unknown = self.resolve_user_tokens(tokens)
         
-        # 添加用户
-        if user_manager.add_user(user_id):
-            logger.info(f"管理员 {update.effective_user.id} 添加了用户 {user_id}")
-            await update.message.reply_text(f"✅ 已成功添加用户: `{user_id}`", parse_mode='Markdown')
-        else:
-            await update.message.reply_text(f"❌ 添加用户失败，可能该ID已存在或为管理员", parse_mode='Markdown')
+        # 只有一个用户时保持原有的简单回复
+        if len(tokens) == 1:
+            if unknown:
+                await update.message.reply_text(
+                    f"❌ 无法识别用户: {escape_markdown(unknown[0])}\n用户名只能解析与机器人交互过的用户，请改用用户ID",
+                    parse_mode='Markdown'
+                )
+            elif user_manager.add_user(user_ids[0]):
+                logger.info(f"管理员 {update.effective_user.id} 添加了用户 {user_ids[0]}")
+                await update.message.reply_text(f"✅ 已成功添加用户: `{user_ids[0]}`", parse_mode='Markdown')
+            else:
+                await update.message.reply_text(f"❌ 添加用户失败，可能该ID已存在或为管理员", parse_mode='Markdown')
+            return
+        
+        # 批量添加用户
+        result = user_manager.add_users(user_ids)
+        if result['added']:
+            logger.info(f"管理员 {update.effective_user.id} 批量添加了 {len(result['added'])} 个用户")
+        
+        message = f"✅ 已添加 {len(result['added'])} 个用户\n"
+        message += self.format_skipped("已存在或为管理员", result['existing'])
+        message += self.format_skipped("无法识别", unknown + result['invalid'])
+        await update.message.reply_text(message, parse_mode='Markdown')
     
     async def remove_user_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_manager: UserManager):
         """处理/deluser命令，删除普通用户
         
+        与 /adduser 相同，支持多个用户以及回复消息或文件。
+        
         Args:
             update: Telegram更新对象
             context: 上下文对象
             user_manager: 用户管理器实例
         """
+        tokens = await self.collect_user_tokens(update, context)
+        if tokens is None:
+            return
         
         # 检查命令参数
-        if not context.args or len(context.args) != 1:
-            await update.message.reply_text("❌ 请提供用户ID\n用法: `/deluser <用户ID>`", parse_mode='Markdown')
+        if not tokens:
+            await update.message.reply_text(
+                "❌ 请提供用户ID或用户名\n"
+                "用法: `/deluser <用户ID|@用户名> ...`\n"
+                "或回复一条包含用户ID的消息或 txt/csv 文件",
+                parse_mode='Markdown'
+            )
             return
         
-        user_id = context.args[0]
+        user_ids, unknown = self.resolve_user_tokens(tokens)
         
-        # 删除用户
-        if user_manager.remove_user(user_id):
-            logger.info(f"管理员 {update.effective_user.id} 删除了用户 {user_id}")
-            await update.message.reply_text(f"✅ 已成功删除用户: `{user_id}`", parse_mode='Markdown')
-        else:
-            await update.message.reply_text(f"❌ 删除用户失败，该ID可能不存在或不是普通用户", parse_mode='Markdown') 
\ No newline at end of file
+        # 只有一个用户时保持原有的简单回复
+        if len(tokens) == 1:
+            if unknown:
+                await update.message.reply_text(
+                    f"❌ 无法识别用户: {escape_markdown(unknown[0])}\n用户名只能解析与机器人交互过的用户，请改用用户ID",
+                    parse_mode='Markdown'
+                )
+            elif user_manager.remove_user(user_ids[0]):
+                logger.info(f"管理员 {update.effective_user.id} 删除了用户 {user_ids[0]}")
+                await update.message.reply_text(f"✅ 已成功删除用户: `{user_ids[0]}`", parse_mode='Markdown')
+            else:
+                await update.message.reply_text(f"❌ 删除用户失败，该ID可能不存在或不是普通用户", parse_mode='Markdown')
+            return
+        
+        # 批量删除用户
+        result = user_manager.remove_users(user_ids)
+        if result['removed']:
+            logger.info(f"管理员 {update.effective_user.id} 批量删除了 {len(result['removed'])} 个用户")
+        
+        message = f"✅ 已删除 {len(result['removed'])} 个用户\n"
+        message += self.format_skipped("不存在或不是普通用户", result['missing'])
+        message += self.format_skipped("无法识别", unknown + result['invalid'])
+        await update.message.reply_text(message, parse_mode='Markdown')
+    
+    async def collect_user_tokens(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> Optional[List[str]]:
+        """收集命令参数及所回复的消息或文件中的用户ID和用户名
+        
+        Args:
+            update: Telegram更新对象
+            context: 上下文对象
+        
+        Returns:
+            Optional[List[str]]: 用户ID或用户名列表，读取文件失败时已回复错误并返回None
+        """
+        tokens = self.split_user_tokens(" ".join(context.args or []))
+        
+        reply = update.message.reply_to_message
+        if reply and reply.document:
+            if reply.document.file_size and reply.document.file_size > self.MAX_IMPORT_BYTES:
+                await update.message.reply_text(f"❌ 文件过大，最多支持 {self.MAX_IMPORT_BYTES // 1024}KB")
+                return None
+            try:
+                file = await reply.document.get_file()
+                content = bytes(await file.download_as_bytearray())
+            except Exception as e:
+                logger.error(f"下载用户列表文件失败: {str(e)}")
+                await update.message.reply_text(f"❌ 读取文件失败: {str(e)}")
+                return None
+            text = content.decode('utf-8-sig', errors='replace')
+            # CSV文件只取每行第一列，其余列可以是备注
+            is_csv = (reply.document.file_name or "").lower().endswith(".csv") or reply.document.mime_type == "text/csv"
+            tokens.extend(self.first_csv_column(text) if is_csv else self.split_user_tokens(text))
+        elif reply and reply.text:
+            tokens.extend(self.split_user_tokens(reply.text))
+        
+        return tokens
+    
+    @staticmethod
+    def split_user_tokens(text: str) -> List[str]:
+        """按空白、逗号、分号拆分文本，兼容每行一个ID的文本和CSV文件
+        
+        Args:
+            text: 文本内容
+        
+        Returns:
+            List[str]: 非空的片段
+        """
+        return [token.strip('"\'') for token in re.split(r'[\s,;]+', text) if token.strip('"\'')]
+    
+    @staticmethod
+    def first_csv_column(text: str) -> List[str]:
+        """读取CSV每行的第一列
+        
+        Args:
+            text: CSV内容
+        
+        Returns:
+            List[str]: 非空的第一列值
+        """
+        return [row[0].strip() for row in csv.reader(io.StringIO(text)) if row and row[0].strip()]
+    
+    @staticmethod
+    def resolve_user_tokens(tokens: List[str]) -> Tuple[List[str], List[str]]:
+        """将用户ID和用户名解析为用户ID，去除重复
+        
+        Args:
+            tokens: 用户ID或用户名列表
+        
+        Returns:
+            Tuple[List[str], List[str]]: (用户ID列表, 无法识别的片段列表)
+        """
+        user_ids, unknown = {}, []
+        for token in tokens:
+            user_id = UserUtils.resolve_user_id(token)
+            if user_id is None:
+                unknown.append(token)
+            else:
+                user_ids[user_id] = None
+        return list(user_ids), unknown
+    
+    @classmethod
+    def format_skipped(cls, label: str, items: List[str]) -> str:
+        """格式化批量操作中被跳过的条目，最多列出 SKIPPED_PREVIEW 个
+        
+        Args:
+            label: 跳过原因
+            items: 被跳过的条目
+        
+        Returns:
+            str: 消息片段，没有条目时为空字符串
+        """
+        if not items:
+            return ""
+        # 条目可能来自上传的文件，转义后再放入Markdown消息，避免 _ * ` 等字符导致发送失败
+        preview = ", ".join(escape_markdown(item) for item in items[:cls.SKIPPED_PREVIEW])
+        if len(items) > cls.SKIPPED_PREVIEW:
+            preview += " 等"
+        return f"⚠️ {label}: {len(items)} 个 ({preview})\n" 
\ No newline at end of file
@@ -2,28 +2,137 @@ import os
 import yaml
 from typing import Dict, Any
 
-def load_config() -> Dict[str, Any]:
-    """加载配置文件"""
-    # 优先查找当前目录
-    config_paths = [
-        "config.yaml",  # 当前目录
-        os.path.join(os.path.dirname(__file__), "..", "config.yaml"),  # 项目根目录
-        "/etc/telegram-bot-template/config.yaml"  # 系统路径
-    ]
-    
-    for config_path in config_paths:
+# 配置文件查找顺序：优先查找当前目录
+CONFIG_PATHS = [
+    "config.yaml",  # 当前目录
+    os.path.join(os.path.dirname(__file__), "..", "config.yaml"),  # 项目根目录
+    "/etc/telegram-bot-template/config.yaml"  # 系统路径
+]
+
+def find_config_file() -> str:
+    """查找配置文件
+    
+    Returns:
+        str: 第一个存在的配置文件路径
+    
+    Raises:
+        FileNotFoundError: 所有路径都不存在
+    """
+    for config_path in CONFIG_PATHS:
         if os.path.exists(config_path):
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config = yaml.safe_load(f)
-                break
-    else:
-        raise FileNotFoundError(f"未找到配置文件。请确保以下路径之一存在配置文件: {', '.join(config_paths)}")
-        
+            return config_path
+    raise FileNotFoundError(f"未找到配置文件。请确保以下路径之一存在配置文件: {', '.join(CONFIG_PATHS)}")
+
+def validate_config(config: Any) -> None:
+    """校验配置内容
+    
+    Args:
+        config: 解析后的配置
+    
+    Raises:
+        ValueError: 配置无效
+    """
+    if not isinstance(config, dict):
+        raise ValueError("配置文件内容必须是键值对")
+    
     required_fields = ['telegram_bot_token', 'telegram_admin_id']
     for field in required_fields:
         if not config.get(field):
             raise ValueError(f"配置文件缺少必要字段: {field}")
-            
+    
+    # 可选的配置段必须是对应的类型
+    section_types = {
+        'get_ip_urls': list,
+        'change_ip': dict,
+        'stats': dict,
+        'user_cache': dict,
+        'access_gate': dict,
+        'plugins': dict,
+        'push': dict,
+    }
+    for field, expected_type in section_types.items():
+        value = config.get(field)
+        if value is not None and not isinstance(value, expected_type):
+            raise ValueError(f"配置项 {field} 的格式无效，应为{'列表' if expected_type is list else '键值对'}")
+    
+    if not isinstance(config['telegram_bot_token'], str):
+        raise ValueError("配置项 telegram_bot_token 应为字符串")
+    
+    # 用户ID为逗号分隔的字符串，只有一个ID且未加引号时YAML解析为整数，读取时会转换为字符串
+    for field in ('telegram_admin_id', 'telegram_user_id'):
+        value = config.get(field)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (str, int))):
+            raise ValueError(f"配置项 {field} 的格式无效，应为逗号分隔的用户ID，例如 \"123456,789012\"")
+    
+    # 配置段中的列表项
+    list_fields = {
+        ('get_ip_urls',): str,
+        ('plugins', 'enabled'): str,
+        ('plugins', 'disabled'): str,
+        ('push', 'enabled'): str,
+        ('push', 'disabled'): str,
+    }
+    for path, item_type in list_fields.items():
+        value = config
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if value is None:
+            continue
+        name = '.'.join(path)
+        if not isinstance(value, list):
+            raise ValueError(f"配置项 {name} 的格式无效，应为列表")
+        if not all(isinstance(item, item_type) for item in value):
+            raise ValueError(f"配置项 {name} 的列表项应为字符串")
+    
+    push_plugins = (config.get('push') or {}).get('plugins')
+    if push_plugins is not None and not isinstance(push_plugins, dict):
+        raise ValueError("配置项 push.plugins 的格式无效，应为键值对")
+
+def read_config_file(config_path: str) -> Dict[str, Any]:
+    """读取并校验配置文件
+    
+    Args:
+        config_path: 配置文件路径
+    
+    Returns:
+        Dict: 配置字典，config_file 为配置文件路径
+    
+    Raises:
+        ValueError: 配置无效或无法解析
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        try:
+            config = yaml.safe_load(f)
+        except yaml.YAMLError as e:
+            raise ValueError(f"配置文件格式错误: {str(e)}")
+    
+    validate_config(config)
+    for field in ('telegram_admin_id', 'telegram_user_id'):
+        if isinstance(config.get(field), int):
+            config[field] = str(config[field])
+    config['config_file'] = config_path
     return config
 
+def load_config() -> Dict[str, Any]:
+    """加载配置文件"""
+    return read_config_file(find_config_file())
+
+def apply_config(target: Dict[str, Any], new_config: Dict[str, Any]) -> set:
+    """原地更新配置字典，已持有该字典的模块无需重新获取即可读到新值
+    
+    Args:
+        target: 正在使用的配置字典
+        new_config: 新的配置
+    
+    Returns:
+        set: 发生变化的顶层配置项
+    """
+    changed = {key for key in set(target) | set(new_config) if target.get(key) != new_config.get(key)}
+    for key in changed:
+        if key in new_config:
+            target[key] = new_config[key]
+        else:
+            del target[key]
+    return changed
+
 config = load_config()
\ No newline at end of file
@@ -9,15 +9,13 @@ if base_dir not in sys.path:
     sys.path.insert(0, base_dir)
 
 from src.bot.core import TelegramBot
-from src.config import load_config
+from src.config import config
 from src.logger import logger
 
 def main():
     """主函数，启动机器人"""
     try:
-        # 加载配置
-        config = load_config()
-        
+        # 使用导入时加载的配置，配置热加载会原地更新同一个字典
         # 创建并运行机器人
         logger.info("启动Telegram机器人...")
         bot = TelegramBot(config)
@@ -27,12 +27,18 @@ class PushManager:
         self.config = config or {}
         self.plugins: Dict[str, PushPluginInterface] = {}
         self._app: Application = None
+        self._read_push_config()
         
-        # 从配置中获取推送插件配置
-        push_config = self.config.get('push', {}) or {}
-        self.enabled_plugins: List[str] = push_config.get('enabled', [])
-        self.disabled_plugins: List[str] = push_config.get('disabled', [])
-        self.plugins_config: Dict[str, Dict[str, Any]] = push_config.get('plugins', {})
+    def _read_push_config(self, config: Dict[str, Any] = None) -> None:
+        """从配置中获取推送插件配置
+        
+        Args:
+            config: 配置字典，默认为初始化时的配置
+        """
+        push_config = (config if config is not None else self.config).get('push', {}) or {}
+        self.enabled_plugins: List[str] = push_config.get('enabled', []) or []
+        self.disabled_plugins: List[str] = push_config.get('disabled', []) or []
+        self.plugins_config: Dict[str, Dict[str, Any]] = push_config.get('plugins', {}) or {}
         
     def discover_plugins(self) -> None:
         """发现所有推送插件"""
@@ -192,6 +198,47 @@ class PushManager:
         
         logger.info("所有推送插件已停止")
     
+    async def reload_config(self, config: Dict[str, Any] = None) -> None:
+        """配置热加载后按新的推送配置调整插件
+        
+        不再启用的插件被停止，新启用的插件被创建并启动，配置有变化的插件用新配置重新创建并重启，
+        其余插件保持运行不受影响。
+        
+        Args:
+            config: 新的配置字典，默认为初始化时的配置
+        """
+        old_plugins_config = self.plugins_config
+        self._read_push_config(config)
+        
+        # 尚未启动时只需更新配置，启动时会按新配置加载
+        if self._app is None:
+            return
+        
+        plugins_to_load = self._determine_plugins_to_load(list(plugin_factory.get_available_plugins().keys()))
+        
+        for plugin_name in list(self.plugins):
+            if plugin_name not in plugins_to_load:
+                await self.plugins.pop(plugin_name).stop()
+                logger.info(f"推送插件 {plugin_name} 已根据新配置停用")
+        
+        for plugin_name in plugins_to_load:
+            plugin_config = self.plugins_config.get(plugin_name, {}) or {}
+            old_plugin = self.plugins.get(plugin_name)
+            if old_plugin is not None and plugin_config == (old_plugins_config.get(plugin_name, {}) or {}):
+                continue
+            
+            plugin = plugin_factory.create_plugin(plugin_name, self.user_manager, plugin_config)
+            if plugin is None:
+                continue
+            if old_plugin is not None:
+                await old_plugin.stop()
+            self.plugins[plugin_name] = plugin
+            try:
+                await plugin.start(self._app)
+                logger.info(f"推送插件 {plugin_name} 已按新配置启动")
+            except Exception as e:
+                logger.error(f"启动推送插件 {plugin_name} 时出错: {str(e)}", exc_info=True)
+    
     def get_plugin(self, name: str) -> PushPluginInterface:
         """获取指定名称的推送插件
         
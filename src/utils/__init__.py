@@ -5,6 +5,6 @@ from .stats import UserStatsManager
 from .ip_utils import IPUtils
 from .http_utils import HTTPUtils
 from .user_utils import UserUtils
-from .user_cache import user_cache, UserInfoCache
+from .user_cache import user_cache, UserInfoCache, SQLiteUserInfoCache
 
-__all__ = ['get_system_info', 'format_time_delta', 'UserStatsManager', 'IPUtils', 'HTTPUtils', 'UserUtils', 'user_cache', 'UserInfoCache']
+__all__ = ['get_system_info', 'format_time_delta', 'UserStatsManager', 'IPUtils', 'HTTPUtils', 'UserUtils', 'user_cache', 'UserInfoCache', 'SQLiteUserInfoCache']
@@ -0,0 +1,62 @@
+"""文件读写工具"""
+import os
+import json
+import tempfile
+from typing import Any
+
+
+def atomic_write_bytes(file_path: str, content: bytes) -> None:
+    """原子写入二进制文件
+    
+    先写入同目录下的临时文件，再通过 os.replace 替换目标文件，
+    避免进程中途退出时留下写了一半的文件。
+    
+    Args:
+        file_path: 目标文件路径
+        content: 文件内容
+    
+    Raises:
+        OSError: 写入或替换失败时抛出
+    """
+    directory = os.path.dirname(file_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(file_path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_text(file_path: str, content: str) -> None:
+    """原子写入文本文件（UTF-8）
+    
+    Args:
+        file_path: 目标文件路径
+        content: 文件内容
+    
+    Raises:
+        OSError: 写入或替换失败时抛出
+    """
+    atomic_write_bytes(file_path, content.encode('utf-8'))
+
+
+def atomic_write_json(file_path: str, data: Any, indent: int = 2) -> None:
+    """原子写入JSON文件
+    
+    Args:
+        file_path: 目标文件路径
+        data: 可序列化的数据
+        indent: 缩进空格数
+    
+    Raises:
+        OSError: 写入或替换失败时抛出
+        TypeError: 数据无法序列化时抛出
+    """
+    atomic_write_text(file_path, json.dumps(data, ensure_ascii=False, indent=indent))
@@ -1,240 +1,779 @@
 import os
-import json
-from datetime import datetime, date
-from typing import Dict, List, Any, Optional
-import yaml
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from datetime import datetime, date, timedelta
+from typing import Dict, Iterator, List, Any, Optional, Tuple
 
 from src.logger import logger
+from src.utils.stats_bitmap import ActiveUserIndex, UserBitmap
+from src.utils.stats_counters import LatencyHistogram, RankedCounter, WindowedTopK
+from src.utils.stats_events import CommandEventLog
+from src.utils.stats_storage import (
+    StatsBatch, PERIOD_DAILY, PERIOD_WEEKLY, PERIOD_MONTHLY,
+    add_count, create_stats_storage, rollup_keys, split_date_range
+)
 
 class UserStatsManager:
     """用户统计管理类，用于记录和查询用户的功能请求次数"""
     
-    def __init__(self, data_dir: str = "data"):
+    def __init__(self, data_dir: str = "data", config: Dict[str, Any] = None):
         """初始化统计管理器
         
         Args:
             data_dir: 数据存储目录
+            config: 配置字典，读取其中的 stats 部分
         """
         self.data_dir = data_dir
         self.stats_dir = os.path.join(data_dir, "stats")
-        self.daily_stats_dir = os.path.join(self.stats_dir, "daily")
-        self.total_stats_file = os.path.join(self.stats_dir, "total_stats.json")
         
-        # 确保目录存在
-        self._ensure_dirs()
+        # 缓冲写入配置：开启后计数先累加在内存中，按间隔或脏计数阈值批量落盘
+        stats_config = (config or {}).get('stats', {}) or {}
+        self.buffered: bool = stats_config.get('buffered', False)
+        self.flush_interval: int = stats_config.get('flush_interval', 30)
+        self.flush_threshold: int = stats_config.get('flush_threshold', 100)
+        
+        # 事件日志：每次命令调用追加一条原始事件，落盘时将已关闭的分段折叠进每日统计
+        # 事件日志本身保证了未落盘计数的持久性，因此启用后总是使用缓冲模式
+        self.event_log: Optional[CommandEventLog] = None
+        if stats_config.get('event_log', False):
+            self.event_log = CommandEventLog(
+                os.path.join(self.stats_dir, "events"),
+                stats_config.get('event_retention_days', 30)
+            )
+            self.buffered = True
+        
+        # 尚未落盘的每日增量
+        self._pending: StatsBatch = {}
+        self._dirty_count = 0
+        # _lock 保护内存数据，_flush_lock 保证落盘与查询互斥
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._flush_future: Optional[asyncio.Future] = None
+        
+        # 是否定期将已结束月份的每日文件打包为月度归档（仅JSON存储）
+        self.archive_enabled: bool = stats_config.get('archive', False)
+        
+        # 已结束周期（昨天及以前的日、周、月）的数据不会再变化，解析结果和命令汇总缓存在内存中
+        self.cache_size: int = stats_config.get('cache_size', 128)
+        self._period_cache: "OrderedDict[Tuple[str, str], Tuple[Dict[str, Dict[str, int]], Dict[str, int]]]" = OrderedDict()
+        
+        # 存储后端（JSON文件或SQLite）
+        self.storage = create_stats_storage(self.stats_dir, stats_config)
+        
+        # 每天的活跃用户位图，用于窗口内去重用户数和留存计算
+        self.active_users = ActiveUserIndex(os.path.join(self.stats_dir, "active"))
+        
+        if self.event_log:
+            self._replay_event_log()
+        
+        # 记录命令时只更新内存中的位图，启动时先加载今天的位图
+        self._preload_active_users()
+        
+        # 各命令的执行耗时直方图，仅保存在内存中，统计自启动以来的数据
+        self._latency: Dict[str, LatencyHistogram] = {}
+        
+        # 最近一小时（12个5分钟槽）和最近一天（24个1小时槽）的高频用户、命令，内存占用固定
+        top_k_capacity: int = stats_config.get('top_k_capacity', 64)
+        self._heavy_hitters: Dict[str, Dict[str, WindowedTopK]] = {
+            window: {
+                'users': WindowedTopK(window_seconds, slots, top_k_capacity),
+                'commands': WindowedTopK(window_seconds, slots, top_k_capacity),
+            }
+            for window, window_seconds, slots in (('hour', 3600, 12), ('day', 86400, 24))
+        }
+        
+        # 全局命令汇总和排名随计数增加同步维护，启动时只需汇总一次
+        with self._lock:
+            self._command_totals = RankedCounter(
+                self._summarize(self._pending_total(), self.storage.command_summary())
+            )
+    
+    def _replay_event_log(self) -> None:
+        """将上次运行时尚未折叠的事件分段逐个写入存储
+        
+        每个分段单独写入并带上分段标识，上次落盘已写入但未来得及标记为已折叠的分段由存储跳过，
+        不会重复计数。写入失败的增量放回待落盘队列，分段保留到下次落盘成功。
+        """
+        segments = self.event_log.pending_segments()
+        replayed = 0
+        failed = False
+        for segment in segments:
+            batch: StatsBatch = {}
+            for event in self.event_log.read_segment(segment):
+                try:
+                    day = date.fromtimestamp(event['ts']).isoformat()
+                    add_count(batch.setdefault(day, {}), str(event['user']), event['command'])
+                    replayed += 1
+                except (KeyError, TypeError, ValueError):
+                    logger.warning(f"跳过无效的命令事件: {event}")
+            
+            if not batch:
+                continue
+            for day_str in self.storage.apply_increments(batch, CommandEventLog.segment_id(segment)):
+                failed = True
+                pending_day = self._pending.setdefault(day_str, {})
+                for user_id, commands in batch[day_str].items():
+                    for command, count in commands.items():
+                        add_count(pending_day, user_id, command, count)
+                        self._dirty_count += count
+        
+        if segments and not failed:
+            self.event_log.mark_compacted(segments)
+        if replayed:
+            logger.info(f"已从事件日志恢复 {replayed} 条尚未折叠的命令记录")
+    
+    def record_command_usage(self, user_id: str, command: str, outcome: str = "ok") -> bool:
+        """记录用户使用命令
         
-        # 加载总体统计数据
-        self.total_stats = self._load_total_stats()
+        只在事件循环中更新内存计数，磁盘写入都在线程池中进行。缓冲模式下落盘由定时任务、
+        脏计数阈值或关闭时的 flush 完成；非缓冲模式下每次调用都立即安排后台落盘，
+        落盘期间到达的计数在本次落盘结束后合并为一次写入。启用事件日志时同时追加一条原始事件。
         
-    def _ensure_dirs(self) -> None:
-        """确保所需的目录结构存在"""
-        os.makedirs(self.stats_dir, exist_ok=True)
-        os.makedirs(self.daily_stats_dir, exist_ok=True)
+        Args:
+            user_id: 用户ID
+            command: 命令名称
+            outcome: 执行结果，如 ok、error
         
-    def _get_daily_stats_file(self, day: date = None) -> str:
-        """获取指定日期的统计文件路径
+        Returns:
+            bool: 是否记录成功
+        """
+        now = time.time()
+        today = date.fromtimestamp(now).isoformat()
+        
+        with self._lock:
+            if self.event_log:
+                self.event_log.append(now, user_id, command, outcome)
+            add_count(self._pending.setdefault(today, {}), user_id, command)
+            self._command_totals.increment(command)
+            self.active_users.add(today, user_id)
+            for trackers in self._heavy_hitters.values():
+                trackers['users'].add(user_id, now)
+                trackers['commands'].add(command, now)
+            self._dirty_count += 1
+            reached_threshold = self._dirty_count >= self.flush_threshold
+        
+        if not self.buffered or reached_threshold:
+            self._schedule_flush()
+        
+        return True
+    
+    def record_command_latency(self, command: str, seconds: float, outcome: str = "ok") -> None:
+        """记录命令执行耗时
         
         Args:
-            day: 日期对象，默认为今天
-            
+            command: 命令名称
+            seconds: 执行耗时（秒）
+            outcome: 执行结果，如 ok、error
+        """
+        with self._lock:
+            histogram = self._latency.get(command)
+            if histogram is None:
+                histogram = self._latency[command] = LatencyHistogram()
+            histogram.record(seconds, error=outcome != "ok")
+    
+    def get_latency_summary(self) -> Dict[str, Dict[str, float]]:
+        """获取各命令的执行耗时分位数
+        
         Returns:
-            str: 文件路径
+            Dict: {命令: {'count', 'errors', 'avg', 'p50', 'p95', 'p99', 'max'}}，耗时单位为秒
         """
-        if day is None:
-            day = date.today()
+        with self._lock:
+            return {
+                command: {
+                    'count': histogram.count,
+                    'errors': histogram.errors,
+                    'avg': histogram.total_seconds / histogram.count,
+                    'p50': histogram.percentile(0.50),
+                    'p95': histogram.percentile(0.95),
+                    'p99': histogram.percentile(0.99),
+                    'max': histogram.max_seconds,
+                }
+                for command, histogram in self._latency.items()
+                if histogram.count
+            }
+    
+    def get_heavy_hitters(self, window: str = "hour", limit: int = 10) -> Dict[str, List[Tuple[str, int]]]:
+        """获取最近一段时间内使用最频繁的用户和命令
+        
+        基于 Space-Saving 估计，次数可能略微偏大，仅统计自启动以来的数据。
+        
+        Args:
+            window: 时间窗口，hour 或 day
+            limit: 每项返回的数量上限
+        
+        Returns:
+            Dict: {'users': [(用户ID, 次数)], 'commands': [(命令, 次数)]}
+        """
+        now = time.time()
+        with self._lock:
+            trackers = self._heavy_hitters[window]
+            return {
+                'users': trackers['users'].top(now, limit),
+                'commands': trackers['commands'].top(now, limit),
+            }
+    
+    def _schedule_flush(self) -> None:
+        """安排一次后台落盘，避免在事件循环中执行磁盘IO"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在事件循环中（例如脚本调用），直接同步落盘
+            self.flush()
+            return
+        
+        if self._flush_future is None or self._flush_future.done():
+            self._flush_future = loop.run_in_executor(None, self.flush)
+            if not self.buffered:
+                self._flush_future.add_done_callback(self._flush_done)
+    
+    def _flush_done(self, future: asyncio.Future) -> None:
+        """非缓冲模式下，后台落盘结束后若又有新的计数则再落盘一次"""
+        if self._dirty_count:
+            self._schedule_flush()
+    
+    def flush(self) -> bool:
+        """将内存中尚未落盘的统计写入存储后端
+        
+        可在线程池中调用。写入失败的日期增量会放回待落盘队列，等待下次重试。
+        启用事件日志时，同时轮换当前分段，全部写入成功后将已关闭的分段标记为已折叠。
+        
+        Returns:
+            bool: 是否全部保存成功
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch = self._pending
+                self._pending = {}
+                self._dirty_count = 0
+                # 在同一把锁内轮换分段，保证关闭的分段与本批增量一一对应
+                segments = self.event_log.rotate() if self.event_log else []
             
-        return os.path.join(self.daily_stats_dir, f"{day.isoformat()}.json")
+            self._preload_active_users()
+            self._save_active_users()
+            
+            if not batch:
+                if segments:
+                    self.event_log.mark_compacted(segments)
+                return True
+            
+            # 本批增量都来自这些分段，写入时一并记录最后一个分段，重放时不会重复计数
+            failed_days = self.storage.apply_increments(
+                batch, CommandEventLog.segment_id(segments[-1]) if segments else None
+            )
+            
+            # 跨午夜或从事件日志恢复时，增量可能落在已缓存的过去日期上
+            for day_str in batch:
+                for period_key in rollup_keys(date.fromisoformat(day_str)):
+                    self._period_cache.pop(period_key, None)
+            
+            # 有失败时保留分段，待下次落盘成功后一并标记
+            if segments and not failed_days:
+                self.event_log.mark_compacted(segments)
+            
+            if failed_days:
+                with self._lock:
+                    for day_str in failed_days:
+                        pending_day = self._pending.setdefault(day_str, {})
+                        for user_id, commands in batch[day_str].items():
+                            for command, count in commands.items():
+                                add_count(pending_day, user_id, command, count)
+            
+            if self.buffered:
+                logger.debug(f"统计数据已落盘，涉及 {len(batch)} 天")
+            
+            return not failed_days
+    
+    def archive(self) -> int:
+        """归档已结束月份的每日统计，可在线程池中调用
         
-    def _load_total_stats(self) -> Dict[str, Dict[str, int]]:
-        """加载总体统计数据
+        读取和压缩不持锁，每个月只在替换文件时短暂持有落盘锁，归档期间查询不会被阻塞。
         
         Returns:
-            Dict: 用户请求总次数统计
+            int: 归档的天数
         """
-        if os.path.exists(self.total_stats_file):
-            try:
-                with open(self.total_stats_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                logger.error(f"加载总体统计数据失败: {str(e)}")
-                
-        # 如果文件不存在或加载失败，返回空统计
-        return {}
+        return self.storage.archive(date.today(), self._flush_lock)
+    
+    def close(self) -> None:
+        """落盘剩余数据并关闭存储后端"""
+        self.flush()
+        with self._flush_lock:
+            self.storage.close()
+            if self.event_log:
+                self.event_log.close()
+    
+    def _save_active_users(self) -> None:
+        """保存有变化的活跃用户位图，调用方需持有 _flush_lock"""
+        with self._lock:
+            snapshots = self.active_users.take_dirty()
+        
+        for day_str, data in snapshots.items():
+            if not self.active_users.save(day_str, data):
+                with self._lock:
+                    self.active_users.mark_dirty(day_str, data)
+    
+    def _active_backfill(self, day_str: str):
+        """生成根据每日统计回填活跃用户的回调
         
-    def _load_daily_stats(self, day: date = None) -> Dict[str, Dict[str, int]]:
-        """加载指定日期的统计数据
+        Args:
+            day_str: 日期字符串
+        
+        Returns:
+            Callable: 返回当天已落盘统计中的用户ID
+        """
+        return lambda: self.storage.load_day(date.fromisoformat(day_str)).keys()
+    
+    def _preload_active_users(self) -> None:
+        """加载今天以及有暂存活跃用户的日期的位图，可在线程池中调用
+        
+        启动时和每次落盘时调用，跨过午夜后新一天的位图在下一次落盘时加载，
+        记录命令时不需要读盘。调用方随后保存有变化的位图。
+        """
+        with self._lock:
+            day_strs = {date.today().isoformat(), *self.active_users.unloaded_days()}
+        self._load_active_bitmaps([date.fromisoformat(day_str) for day_str in sorted(day_strs)])
+    
+    def _active_bitmaps(self, days: List[date]) -> Dict[date, UserBitmap]:
+        """获取多天的活跃用户位图（含尚未落盘的用户），回填得到的位图安排一次后台落盘保存
         
         Args:
-            day: 日期对象，默认为今天
-            
+            days: 日期列表
+        
         Returns:
-            Dict: 当日用户请求次数统计
+            Dict[date, UserBitmap]: {日期: 位图}，调用方不应修改
         """
-        if day is None:
-            day = date.today()
-            
-        stats_file = self._get_daily_stats_file(day)
+        bitmaps, backfilled = self._load_active_bitmaps(days)
+        if backfilled:
+            self._schedule_flush()
+        return bitmaps
+    
+    def _load_active_bitmaps(self, days: List[date]) -> Tuple[Dict[date, UserBitmap], bool]:
+        """获取多天的活跃用户位图（含尚未落盘的用户）
         
-        if os.path.exists(stats_file):
-            try:
-                with open(stats_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                logger.error(f"加载{day.isoformat()}统计数据失败: {str(e)}")
-                
-        # 如果文件不存在或加载失败，返回空统计
-        return {}
+        内存中没有的位图先在锁外读取文件或根据每日统计回填，再持锁并入尚未落盘的用户，
+        读盘期间不阻塞命令计数。
         
-    def _save_total_stats(self) -> bool:
-        """保存总体统计数据
+        Args:
+            days: 日期列表
         
         Returns:
-            bool: 是否保存成功
+            Tuple: ({日期: 位图}, 是否有位图是回填得到的)
         """
-        try:
-            with open(self.total_stats_file, 'w', encoding='utf-8') as f:
-                json.dump(self.total_stats, f, ensure_ascii=False, indent=2)
-            return True
-        except Exception as e:
-            logger.error(f"保存总体统计数据失败: {str(e)}")
-            return False
-            
-    def _save_daily_stats(self, stats: Dict[str, Dict[str, int]], day: date = None) -> bool:
-        """保存指定日期的统计数据
+        with self._lock:
+            missing = [day for day in days if not self.active_users.is_cached(day.isoformat())]
+        
+        loaded = {
+            day: self.active_users.load(day.isoformat(), self._active_backfill(day.isoformat()))
+            for day in missing
+        }
+        
+        bitmaps = {}
+        with self._lock:
+            for day in days:
+                day_str = day.isoformat()
+                bitmaps[day] = self.active_users.get(
+                    day_str, self._active_backfill(day_str), self._pending.get(day_str, {}).keys(), loaded.get(day)
+                )
+        
+        return bitmaps, any(backfilled for _, backfilled in loaded.values())
+    
+    def get_active_user_count(self, start: date, end: date) -> int:
+        """获取日期区间内的去重活跃用户数
+        
+        Args:
+            start: 开始日期（包含）
+            end: 结束日期（包含）
+        
+        Returns:
+            int: 活跃用户数
+        """
+        days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+        union = UserBitmap()
+        for bitmap in self._active_bitmaps(days).values():
+            union = union | bitmap
+        return len(union)
+    
+    def get_active_summary(self, day: date = None) -> Dict[str, int]:
+        """获取截至某天的日、周、月活跃用户数
         
         Args:
-            stats: 统计数据
             day: 日期对象，默认为今天
-            
+        
         Returns:
-            bool: 是否保存成功
+            Dict: {'dau', 'wau', 'mau'}，周、月分别为截至当天的最近7天、30天
         """
         if day is None:
             day = date.today()
-            
-        stats_file = self._get_daily_stats_file(day)
         
-        try:
-            with open(stats_file, 'w', encoding='utf-8') as f:
-                json.dump(stats, f, ensure_ascii=False, indent=2)
-            return True
-        except Exception as e:
-            logger.error(f"保存{day.isoformat()}统计数据失败: {str(e)}")
-            return False
+        return {
+            'dau': self.get_active_user_count(day, day),
+            'wau': self.get_active_user_count(day - timedelta(days=6), day),
+            'mau': self.get_active_user_count(day - timedelta(days=29), day),
+        }
     
-    def record_command_usage(self, user_id: str, command: str) -> bool:
-        """记录用户使用命令
+    def get_retention(self, cohort_day: date, days_after: List[int]) -> Dict[int, Tuple[int, int]]:
+        """计算第N日留存：cohort_day 活跃的用户中，N天后仍然活跃的人数
         
         Args:
-            user_id: 用户ID
-            command: 命令名称
-            
+            cohort_day: 同期群日期
+            days_after: 间隔天数列表，如 [1, 7, 30]
+        
         Returns:
-            bool: 是否记录成功
+            Dict: {N: (留存人数, 同期群人数)}，N天后的日期晚于今天时不包含
         """
         today = date.today()
+        targets = {
+            offset: cohort_day + timedelta(days=offset)
+            for offset in days_after
+            if cohort_day + timedelta(days=offset) <= today
+        }
+        bitmaps = self._active_bitmaps([cohort_day] + list(targets.values()))
+        cohort = bitmaps[cohort_day]
+        return {
+            offset: (len(cohort & bitmaps[target]), len(cohort))
+            for offset, target in targets.items()
+        }
+    
+    @staticmethod
+    def _is_closed_period(period: str, key: str, today: date) -> bool:
+        """判断周期是否已经结束（结束日期早于今天）
         
-        # 加载今日统计
-        daily_stats = self._load_daily_stats(today)
+        Args:
+            period: 周期
+            key: 周期键
+            today: 今天的日期
         
-        # 更新今日统计
-        if user_id not in daily_stats:
-            daily_stats[user_id] = {}
-            
-        if command not in daily_stats[user_id]:
-            daily_stats[user_id][command] = 0
-            
-        daily_stats[user_id][command] += 1
+        Returns:
+            bool: 是否已结束
+        """
+        if period == PERIOD_DAILY:
+            last_day = date.fromisoformat(key)
+        elif period == PERIOD_WEEKLY:
+            iso_year, iso_week = key.split('-W')
+            last_day = date.fromisocalendar(int(iso_year), int(iso_week), 7)
+        elif period == PERIOD_MONTHLY:
+            year, month = map(int, key.split('-'))
+            next_month = date(year + month // 12, month % 12 + 1, 1)
+            last_day = next_month - timedelta(days=1)
+        else:
+            return False
+        return last_day < today
+    
+    def _load_period(self, period: str, key: str, with_stats: bool = True) -> Tuple[Dict[str, Dict[str, int]], Dict[str, int]]:
+        """加载周期统计及其命令汇总，已结束的周期走LRU缓存
         
-        # 更新总体统计
-        if user_id not in self.total_stats:
-            self.total_stats[user_id] = {}
-            
-        if command not in self.total_stats[user_id]:
-            self.total_stats[user_id][command] = 0
-            
-        self.total_stats[user_id][command] += 1
+        调用方需持有 _flush_lock。返回的字典可能来自缓存，只能读取不能修改。
         
-        # 保存统计数据
-        daily_saved = self._save_daily_stats(daily_stats, today)
-        total_saved = self._save_total_stats()
+        Args:
+            period: 周期
+            key: 周期键
+            with_stats: 是否需要用户级统计，仅需汇总时未结束的周期可以只查询汇总
+        
+        Returns:
+            Tuple: ({用户ID: {命令: 次数}}, {命令: 次数})
+        """
+        cache_key = (period, key)
+        cached = self._period_cache.get(cache_key)
+        if cached is not None:
+            self._period_cache.move_to_end(cache_key)
+            return cached
+        
+        if not self._is_closed_period(period, key, date.today()):
+            if not with_stats:
+                return {}, self.storage.period_summary(period, key)
+            stats = self.storage.load_period(period, key)
+            return stats, self._summarize(stats)
+        
+        stats = self.storage.load_period(period, key)
+        entry = (stats, self._summarize(stats))
+        if self.cache_size > 0:
+            self._period_cache[cache_key] = entry
+            while len(self._period_cache) > self.cache_size:
+                self._period_cache.popitem(last=False)
+        return entry
+    
+    def _pending_for_day(self, day: date) -> Dict[str, Dict[str, int]]:
+        """获取指定日期尚未落盘的增量（副本）
+        
+        Args:
+            day: 日期对象
+        
+        Returns:
+            Dict: {用户ID: {命令: 次数}}
+        """
+        with self._lock:
+            day_counts = self._pending.get(day.isoformat(), {})
+            return {user_id: dict(commands) for user_id, commands in day_counts.items()}
+    
+    def _pending_total(self) -> Dict[str, Dict[str, int]]:
+        """获取所有尚未落盘的增量按用户汇总的结果
+        
+        Returns:
+            Dict: {用户ID: {命令: 次数}}
+        """
+        total: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            for day_counts in self._pending.values():
+                for user_id, commands in day_counts.items():
+                    for command, count in commands.items():
+                        add_count(total, user_id, command, count)
+        return total
+    
+    @staticmethod
+    def _merge_stats(base: Dict[str, Dict[str, int]], extra: Dict[str, Dict[str, int]]) -> Dict[str, Dict[str, int]]:
+        """将增量叠加到统计数据上，不修改原数据
+        
+        Args:
+            base: 已落盘的统计数据
+            extra: 尚未落盘的增量
+        
+        Returns:
+            Dict: 合并后的统计数据
+        """
+        if not extra:
+            return base
+        
+        merged = {user_id: dict(commands) for user_id, commands in base.items()}
+        for user_id, commands in extra.items():
+            for command, count in commands.items():
+                add_count(merged, user_id, command, count)
+        return merged
+    
+    @staticmethod
+    def _summarize(stats: Dict[str, Dict[str, int]], summary: Dict[str, int] = None) -> Dict[str, int]:
+        """按命令汇总统计数据
         
-        return daily_saved and total_saved
+        Args:
+            stats: {用户ID: {命令: 次数}}
+            summary: 在已有汇总上继续累加，默认为新字典
         
+        Returns:
+            Dict: 命令使用次数汇总
+        """
+        summary = dict(summary or {})
+        for commands in stats.values():
+            for cmd, count in commands.items():
+                summary[cmd] = summary.get(cmd, 0) + count
+        return summary
+    
     def get_user_daily_stats(self, user_id: str, day: date = None) -> Dict[str, int]:
         """获取用户指定日期的使用统计
         
         Args:
             user_id: 用户ID
             day: 日期对象，默认为今天
-            
+        
         Returns:
             Dict: 命令使用次数统计
         """
         if day is None:
             day = date.today()
-            
-        daily_stats = self._load_daily_stats(day)
-        return daily_stats.get(user_id, {})
         
+        # 持有落盘锁，避免读到落盘进行到一半的数据
+        with self._flush_lock:
+            if self._is_closed_period(PERIOD_DAILY, day.isoformat(), date.today()):
+                day_stats, _ = self._load_period(PERIOD_DAILY, day.isoformat())
+                stats = {user_id: day_stats.get(user_id, {})}
+            else:
+                stats = {user_id: self.storage.load_user_day(user_id, day)}
+            pending = self._pending_for_day(day)
+        
+        extra = {user_id: pending[user_id]} if user_id in pending else {}
+        return self._merge_stats(stats, extra)[user_id]
+    
     def get_user_total_stats(self, user_id: str) -> Dict[str, int]:
         """获取用户总体使用统计
         
         Args:
             user_id: 用户ID
-            
+        
         Returns:
             Dict: 命令使用总次数统计
         """
-        return self.total_stats.get(user_id, {})
+        with self._flush_lock:
+            # 存储可能返回内存计数表的只读视图，在锁内复制，避免落盘线程之后的修改
+            stats = {user_id: dict(self.storage.load_user_total(user_id).items())}
+            pending = self._pending_total()
         
+        extra = {user_id: pending[user_id]} if user_id in pending else {}
+        return self._merge_stats(stats, extra)[user_id]
+    
     def get_all_daily_stats(self, day: date = None) -> Dict[str, Dict[str, int]]:
         """获取所有用户指定日期的使用统计
         
         Args:
             day: 日期对象，默认为今天
-            
+        
         Returns:
             Dict: 所有用户的命令使用次数统计
         """
         if day is None:
             day = date.today()
-            
-        return self._load_daily_stats(day)
         
+        with self._flush_lock:
+            day_stats, _ = self._load_period(PERIOD_DAILY, day.isoformat())
+            return self._merge_stats(day_stats, self._pending_for_day(day))
+    
     def get_all_total_stats(self) -> Dict[str, Dict[str, int]]:
         """获取所有用户的总体使用统计
         
         Returns:
             Dict: 所有用户的命令使用总次数统计
         """
-        return self.total_stats
-        
+        with self._flush_lock:
+            # 存储可能返回内存计数表的只读视图，在锁内复制成普通字典，调用方可在锁外遍历
+            total = {user_id: dict(commands.items()) for user_id, commands in self.storage.load_total().items()}
+            pending = self._pending_total()
+        return self._merge_stats(total, pending)
+    
     def get_command_summary(self, day: date = None) -> Dict[str, int]:
         """获取所有命令的使用摘要（按命令汇总）
         
         Args:
             day: 日期对象，默认为None表示获取总体统计
-            
+        
         Returns:
             Dict: 命令使用次数汇总
         """
-        summary = {}
-        
         if day is None:
-            # 总体统计
-            for user_id, commands in self.total_stats.items():
-                for cmd, count in commands.items():
-                    if cmd not in summary:
-                        summary[cmd] = 0
-                    summary[cmd] += count
-        else:
+            # 总体统计直接读取增量维护的汇总
+            with self._lock:
+                return self._command_totals.as_dict()
+        
+        with self._flush_lock:
             # 指定日期统计
-            daily_stats = self._load_daily_stats(day)
-            for user_id, commands in daily_stats.items():
-                for cmd, count in commands.items():
-                    if cmd not in summary:
-                        summary[cmd] = 0
-                    summary[cmd] += count
-                    
-        return summary 
\ No newline at end of file
+            _, summary = self._load_period(PERIOD_DAILY, day.isoformat(), with_stats=False)
+            pending = self._pending_for_day(day)
+        
+        return self._summarize(pending, summary)
+    
+    def get_top_commands(self, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        """获取总体使用次数最多的命令
+        
+        Args:
+            limit: 数量上限，默认为None表示全部命令
+        
+        Returns:
+            List[Tuple[str, int]]: [(命令, 次数)]，按次数降序排列
+        """
+        with self._lock:
+            return self._command_totals.top(limit)
+    
+    def get_total_usage(self) -> int:
+        """获取所有命令的总使用次数
+        
+        Returns:
+            int: 总次数
+        """
+        with self._lock:
+            return self._command_totals.total
+    
+    def _pending_for_range(self, start: date, end: date) -> Dict[str, Dict[str, int]]:
+        """获取日期区间内尚未落盘的增量按用户汇总的结果
+        
+        Args:
+            start: 起始日期（包含）
+            end: 结束日期（包含）
+        
+        Returns:
+            Dict: {用户ID: {命令: 次数}}
+        """
+        start_str, end_str = start.isoformat(), end.isoformat()
+        total: Dict[str, Dict[str, int]] = {}
+        with self._lock:
+            for day_str, day_counts in self._pending.items():
+                if not start_str <= day_str <= end_str:
+                    continue
+                for user_id, commands in day_counts.items():
+                    for command, count in commands.items():
+                        add_count(total, user_id, command, count)
+        return total
+    
+    def get_range_stats(self, start: date, end: date) -> Dict[str, Dict[str, int]]:
+        """获取日期区间内所有用户的使用统计
+        
+        区间会被拆分为月、周、日三级汇总，90天的区间通常只需读取十几个汇总。
+        
+        Args:
+            start: 起始日期（包含）
+            end: 结束日期（包含）
+        
+        Returns:
+            Dict: 所有用户的命令使用次数统计
+        """
+        stats: Dict[str, Dict[str, int]] = {}
+        with self._flush_lock:
+            for period, key in split_date_range(start, end):
+                period_stats, _ = self._load_period(period, key)
+                for user_id, commands in period_stats.items():
+                    for command, count in commands.items():
+                        add_count(stats, user_id, command, count)
+            pending = self._pending_for_range(start, end)
+        
+        return self._merge_stats(stats, pending)
+    
+    def get_range_command_summary(self, start: date, end: date) -> Dict[str, int]:
+        """获取日期区间内所有命令的使用摘要（按命令汇总）
+        
+        Args:
+            start: 起始日期（包含）
+            end: 结束日期（包含）
+        
+        Returns:
+            Dict: 命令使用次数汇总
+        """
+        summary: Dict[str, int] = {}
+        with self._flush_lock:
+            for period, key in split_date_range(start, end):
+                _, period_summary = self._load_period(period, key, with_stats=False)
+                for command, count in period_summary.items():
+                    summary[command] = summary.get(command, 0) + count
+            pending = self._pending_for_range(start, end)
+        
+        return self._summarize(pending, summary)
+    
+    def iter_daily_rows(self, start: date, end: date) -> Iterator[Tuple[str, str, str, int]]:
+        """逐天遍历日期区间内的明细统计，每次只加载一天的数据
+        
+        Args:
+            start: 开始日期（包含）
+            end: 结束日期（包含）
+        
+        Yields:
+            Tuple: (日期, 用户ID, 命令, 次数)
+        """
+        day = start
+        while day <= end:
+            day_str = day.isoformat()
+            with self._flush_lock:
+                day_stats = self._merge_stats(self.storage.load_day(day), self._pending_for_day(day))
+            
+            for user_id, commands in day_stats.items():
+                for command, count in commands.items():
+                    yield day_str, user_id, command, count
+            day += timedelta(days=1)
+    
+    def get_hourly_summary(self, day: date = None) -> Dict[int, Dict[str, int]]:
+        """从原始事件重新聚合指定日期每小时的命令使用次数
+        
+        Args:
+            day: 日期对象，默认为今天
+        
+        Returns:
+            Dict: {小时: {命令: 次数}}，未启用事件日志时为空
+        """
+        if not self.event_log:
+            return {}
+        
+        if day is None:
+            day = date.today()
+        
+        start = datetime.combine(day, datetime.min.time())
+        hourly: Dict[int, Dict[str, int]] = {}
+        for event in self.event_log.iter_events(start, start + timedelta(days=1)):
+            hour = datetime.fromtimestamp(event['ts']).hour
+            commands = hourly.setdefault(hour, {})
+            commands[event['command']] = commands.get(event['command'], 0) + 1
+        
+        return hourly
\ No newline at end of file
@@ -0,0 +1,178 @@
+"""每日统计月度归档"""
+import os
+import json
+import zlib
+import struct
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from src.logger import logger
+from src.utils.file_utils import atomic_write_bytes
+
+
+class StatsArchive:
+    """将一个月的每日统计打包为单个压缩归档文件
+    
+    文件格式：文件头（魔数、版本、索引长度）+ JSON索引 {日期: [偏移, 长度]} + 各天数据块，
+    每天的数据块单独用 zlib 压缩，读取某一天只需读索引并解压对应的数据块。
+    """
+    
+    MAGIC = b"TBSA"
+    VERSION = 1
+    FILE_SUFFIX = ".arc"
+    _HEADER = struct.Struct('<4sBI')
+    
+    def __init__(self, archive_dir: str):
+        """初始化
+        
+        Args:
+            archive_dir: 归档目录
+        """
+        self.archive_dir = archive_dir
+        os.makedirs(self.archive_dir, exist_ok=True)
+        
+        # 月份 -> (文件修改时间, 索引, 数据区起始偏移)
+        self._index_cache: Dict[str, Tuple[float, Dict[str, List[int]], int]] = {}
+        self._lock = threading.Lock()
+    
+    def _get_file(self, month: str) -> str:
+        return os.path.join(self.archive_dir, f"{month}{self.FILE_SUFFIX}")
+    
+    def months(self) -> List[str]:
+        """列出已归档的月份
+        
+        Returns:
+            List[str]: 月份列表（YYYY-MM），升序
+        """
+        return sorted(
+            name[:-len(self.FILE_SUFFIX)]
+            for name in os.listdir(self.archive_dir)
+            if name.endswith(self.FILE_SUFFIX)
+        )
+    
+    def _load_index(self, month: str) -> Optional[Tuple[Dict[str, List[int]], int]]:
+        """读取归档索引，文件未变化时使用缓存
+        
+        Args:
+            month: 月份（YYYY-MM）
+        
+        Returns:
+            Optional[Tuple]: (索引, 数据区起始偏移)，归档不存在或损坏时返回None
+        """
+        archive_file = self._get_file(month)
+        try:
+            mtime = os.path.getmtime(archive_file)
+        except FileNotFoundError:
+            return None
+        
+        with self._lock:
+            cached = self._index_cache.get(month)
+            if cached and cached[0] == mtime:
+                return cached[1], cached[2]
+        
+        try:
+            with open(archive_file, 'rb') as f:
+                magic, version, index_length = self._HEADER.unpack(f.read(self._HEADER.size))
+                if magic != self.MAGIC or version != self.VERSION:
+                    raise ValueError("文件头无效")
+                index = json.loads(f.read(index_length).decode('utf-8'))
+        except Exception as e:
+            logger.error(f"读取{month}统计归档索引失败: {str(e)}")
+            return None
+        
+        data_offset = self._HEADER.size + index_length
+        with self._lock:
+            self._index_cache[month] = (mtime, index, data_offset)
+        return index, data_offset
+    
+    def list_days(self, month: str) -> List[str]:
+        """列出归档中的日期
+        
+        Args:
+            month: 月份（YYYY-MM）
+        
+        Returns:
+            List[str]: 日期列表，升序
+        """
+        loaded = self._load_index(month)
+        return sorted(loaded[0]) if loaded else []
+    
+    def read_day(self, day_str: str) -> Optional[Dict[str, Dict[str, int]]]:
+        """读取某一天的统计
+        
+        Args:
+            day_str: 日期（YYYY-MM-DD）
+        
+        Returns:
+            Optional[Dict]: {用户ID: {命令: 次数}}，未归档时返回None
+        """
+        month = day_str[:7]
+        loaded = self._load_index(month)
+        if not loaded or day_str not in loaded[0]:
+            return None
+        
+        index, data_offset = loaded
+        offset, length = index[day_str]
+        try:
+            with open(self._get_file(month), 'rb') as f:
+                f.seek(data_offset + offset)
+                return json.loads(zlib.decompress(f.read(length)).decode('utf-8'))
+        except Exception as e:
+            logger.error(f"读取{day_str}归档统计失败: {str(e)}")
+            return None
+    
+    def read_month(self, month: str) -> Dict[str, Dict[str, Dict[str, int]]]:
+        """读取整个月的归档
+        
+        Args:
+            month: 月份（YYYY-MM）
+        
+        Returns:
+            Dict: {日期: {用户ID: {命令: 次数}}}
+        """
+        days = {}
+        for day_str in self.list_days(month):
+            day_stats = self.read_day(day_str)
+            if day_stats is not None:
+                days[day_str] = day_stats
+        return days
+    
+    def pack(self, days: Dict[str, Dict[str, Dict[str, int]]]) -> bytes:
+        """将一个月的每日统计压缩打包为归档文件内容，不写入文件，可在锁外调用
+        
+        Args:
+            days: {日期: {用户ID: {命令: 次数}}}
+        
+        Returns:
+            bytes: 归档文件内容
+        """
+        index: Dict[str, List[int]] = {}
+        blobs = []
+        offset = 0
+        for day_str in sorted(days):
+            blob = zlib.compress(
+                json.dumps(days[day_str], ensure_ascii=False, separators=(',', ':')).encode('utf-8'),
+                level=9
+            )
+            index[day_str] = [offset, len(blob)]
+            blobs.append(blob)
+            offset += len(blob)
+        
+        index_bytes = json.dumps(index, separators=(',', ':')).encode('utf-8')
+        header = self._HEADER.pack(self.MAGIC, self.VERSION, len(index_bytes))
+        return header + index_bytes + b''.join(blobs)
+    
+    def write_packed(self, month: str, data: bytes) -> None:
+        """写入（覆盖）pack 生成的归档内容
+        
+        Args:
+            month: 月份（YYYY-MM）
+            data: 归档文件内容
+        
+        Raises:
+            OSError: 写入失败时抛出
+        """
+        atomic_write_bytes(self._get_file(month), data)
+        
+        with self._lock:
+            self._index_cache.pop(month, None)
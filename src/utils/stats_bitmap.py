@@ -0,0 +1,405 @@
+"""活跃用户位图"""
+import os
+import sys
+import struct
+from array import array
+from collections import OrderedDict
+from datetime import date
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+from src.logger import logger
+from src.utils.file_utils import atomic_write_bytes
+
+# 容器：稀疏时为升序 array('H')，稠密时为 65536 位的整数位集
+Container = Union[array, int]
+
+
+class UserBitmap:
+    """压缩的用户ID位图（Roaring 风格）
+    
+    用户ID按高位分组，每组用一个容器保存低16位：元素不超过 ARRAY_LIMIT 个时
+    使用升序数组，超过后转为 Python 整数位集。并集、交集按组逐个容器计算。
+    """
+    
+    ARRAY_LIMIT = 4096
+    CONTAINER_BITS = 1 << 16
+    
+    # 序列化格式：每个容器一条记录（组号、类型、数据长度），后接数据，均为小端字节序
+    _HEADER = struct.Struct('<QBI')
+    _KIND_ARRAY = 0
+    _KIND_BITSET = 1
+    
+    __slots__ = ('_containers',)
+    
+    def __init__(self, user_ids: Iterable[int] = ()):
+        """初始化位图
+        
+        Args:
+            user_ids: 初始用户ID
+        """
+        self._containers: Dict[int, Container] = {}
+        for user_id in user_ids:
+            self.add(user_id)
+    
+    @classmethod
+    def _to_bitset(cls, container: Container) -> int:
+        """将容器转换为整数位集"""
+        if isinstance(container, int):
+            return container
+        bits = 0
+        for low in container:
+            bits |= 1 << low
+        return bits
+    
+    @classmethod
+    def _normalize(cls, bits: int) -> Container:
+        """元素较少的位集转换回数组容器
+        
+        Args:
+            bits: 整数位集
+        
+        Returns:
+            Container: 容器
+        """
+        if bits.bit_count() > cls.ARRAY_LIMIT:
+            return bits
+        return array('H', cls._iter_bits(bits))
+    
+    @staticmethod
+    def _iter_bits(bits: int) -> Iterator[int]:
+        """按升序遍历整数位集中的元素"""
+        while bits:
+            lowest = bits & -bits
+            yield lowest.bit_length() - 1
+            bits ^= lowest
+    
+    def add(self, user_id: int) -> None:
+        """添加用户ID
+        
+        Args:
+            user_id: 用户ID（非负整数）
+        """
+        high, low = divmod(user_id, self.CONTAINER_BITS)
+        container = self._containers.get(high)
+        
+        if container is None:
+            self._containers[high] = array('H', [low])
+        elif isinstance(container, int):
+            self._containers[high] = container | (1 << low)
+        else:
+            # 数组保持升序，二分查找插入位置
+            lo, hi = 0, len(container)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if container[mid] < low:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo < len(container) and container[lo] == low:
+                return
+            container.insert(lo, low)
+            if len(container) > self.ARRAY_LIMIT:
+                self._containers[high] = self._to_bitset(container)
+    
+    def __contains__(self, user_id: int) -> bool:
+        high, low = divmod(user_id, self.CONTAINER_BITS)
+        container = self._containers.get(high)
+        if container is None:
+            return False
+        if isinstance(container, int):
+            return bool(container >> low & 1)
+        return low in container
+    
+    def __len__(self) -> int:
+        return sum(
+            container.bit_count() if isinstance(container, int) else len(container)
+            for container in self._containers.values()
+        )
+    
+    def __iter__(self) -> Iterator[int]:
+        for high in sorted(self._containers):
+            container = self._containers[high]
+            lows = container if isinstance(container, array) else self._iter_bits(container)
+            base = high * self.CONTAINER_BITS
+            for low in lows:
+                yield base + low
+    
+    def __or__(self, other: "UserBitmap") -> "UserBitmap":
+        result = UserBitmap()
+        for high in self._containers.keys() | other._containers.keys():
+            mine = self._containers.get(high)
+            theirs = other._containers.get(high)
+            if mine is None or theirs is None:
+                container = mine if theirs is None else theirs
+                result._containers[high] = container if isinstance(container, int) else array('H', container)
+            else:
+                result._containers[high] = self._normalize(self._to_bitset(mine) | self._to_bitset(theirs))
+        return result
+    
+    def __and__(self, other: "UserBitmap") -> "UserBitmap":
+        result = UserBitmap()
+        for high in self._containers.keys() & other._containers.keys():
+            mine = self._containers[high]
+            theirs = other._containers[high]
+            if isinstance(mine, array) and isinstance(theirs, array):
+                common = array('H', sorted(set(mine).intersection(theirs)))
+            elif isinstance(mine, array) or isinstance(theirs, array):
+                values, bits = (mine, theirs) if isinstance(mine, array) else (theirs, mine)
+                common = array('H', [low for low in values if bits >> low & 1])
+            else:
+                common = self._normalize(mine & theirs)
+            if len(common) if isinstance(common, array) else common:
+                result._containers[high] = common
+        return result
+    
+    def to_bytes(self) -> bytes:
+        """序列化位图
+        
+        Returns:
+            bytes: 二进制数据
+        """
+        chunks = []
+        for high in sorted(self._containers):
+            container = self._containers[high]
+            if isinstance(container, int):
+                data = container.to_bytes(self.CONTAINER_BITS // 8, 'little')
+                kind = self._KIND_BITSET
+            else:
+                values = array('H', container)
+                # 文件中统一使用小端字节序
+                if sys.byteorder != 'little':
+                    values.byteswap()
+                data = values.tobytes()
+                kind = self._KIND_ARRAY
+            chunks.append(self._HEADER.pack(high, kind, len(data)))
+            chunks.append(data)
+        return b''.join(chunks)
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "UserBitmap":
+        """反序列化位图
+        
+        Args:
+            data: to_bytes 生成的二进制数据
+        
+        Returns:
+            UserBitmap: 位图
+        
+        Raises:
+            ValueError: 数据格式错误时抛出
+        """
+        bitmap = cls()
+        offset = 0
+        while offset < len(data):
+            if offset + cls._HEADER.size > len(data):
+                raise ValueError("位图数据不完整")
+            high, kind, length = cls._HEADER.unpack_from(data, offset)
+            offset += cls._HEADER.size
+            payload = data[offset:offset + length]
+            if len(payload) != length:
+                raise ValueError("位图数据不完整")
+            offset += length
+            
+            if kind == cls._KIND_BITSET:
+                bitmap._containers[high] = int.from_bytes(payload, 'little')
+            elif kind == cls._KIND_ARRAY:
+                values = array('H')
+                values.frombytes(payload)
+                if sys.byteorder != 'little':
+                    values.byteswap()
+                bitmap._containers[high] = values
+            else:
+                raise ValueError(f"未知的位图容器类型: {kind}")
+        return bitmap
+
+
+class ActiveUserIndex:
+    """按天保存的活跃用户位图
+    
+    每天一个位图文件（data/stats/active/YYYY-MM-DD.bin）。缺少位图的日期
+    在首次查询时根据每日统计回填，之后的窗口去重和留存计算只需位图运算。
+    内存中最多保留 max_cached 天的位图，超出时淘汰最久未使用的、已保存的过去日期。
+    记录活跃用户只访问内存，位图尚未加载时先暂存用户ID，加载时再并入。
+    调用方负责加锁。
+    """
+    
+    FILE_SUFFIX = ".bin"
+    
+    def __init__(self, active_dir: str, max_cached: int = 64):
+        """初始化
+        
+        Args:
+            active_dir: 位图文件目录
+            max_cached: 内存中最多保留多少天的位图，今天和尚未保存的位图不计入淘汰
+        """
+        self.active_dir = active_dir
+        self.max_cached = max_cached
+        os.makedirs(self.active_dir, exist_ok=True)
+        self._bitmaps: "OrderedDict[str, UserBitmap]" = OrderedDict()
+        self._dirty: Set[str] = set()
+        # 位图尚未加载时记录的活跃用户，{日期: 用户ID集合}
+        self._unloaded: Dict[str, Set[int]] = {}
+    
+    @staticmethod
+    def parse_user_id(user_id: str) -> Optional[int]:
+        """将用户ID转换为位图中的整数，无法转换时返回None
+        
+        Args:
+            user_id: 用户ID
+        
+        Returns:
+            Optional[int]: 非负整数用户ID
+        """
+        try:
+            value = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        return value if value >= 0 else None
+    
+    def _get_file(self, day_str: str) -> str:
+        return os.path.join(self.active_dir, f"{day_str}{self.FILE_SUFFIX}")
+    
+    def is_cached(self, day_str: str) -> bool:
+        """某天的位图是否已在内存中"""
+        return day_str in self._bitmaps
+    
+    def unloaded_days(self) -> List[str]:
+        """有暂存的活跃用户、等待加载位图的日期"""
+        return list(self._unloaded)
+    
+    def load(self, day_str: str, backfill: Callable[[], Iterable[str]]) -> Tuple[UserBitmap, bool]:
+        """从文件读取某天的位图，文件不存在或损坏时根据每日统计回填
+        
+        不访问内存中的位图，调用方无需加锁，结果通过 get 的 loaded 参数放入内存。
+        
+        Args:
+            day_str: 日期字符串
+            backfill: 返回当天活跃用户ID的回调
+        
+        Returns:
+            Tuple[UserBitmap, bool]: (位图, 是否为回填的结果)
+        """
+        stats_file = self._get_file(day_str)
+        if os.path.exists(stats_file):
+            try:
+                with open(stats_file, 'rb') as f:
+                    return UserBitmap.from_bytes(f.read()), False
+            except Exception as e:
+                logger.error(f"加载{day_str}活跃用户位图失败，将根据每日统计重建: {str(e)}")
+        
+        bitmap = UserBitmap()
+        for user_id in backfill():
+            value = self.parse_user_id(user_id)
+            if value is not None:
+                bitmap.add(value)
+        return bitmap, True
+    
+    def get(self, day_str: str, backfill: Callable[[], Iterable[str]], pending: Iterable[str] = (),
+            loaded: Optional[Tuple[UserBitmap, bool]] = None) -> UserBitmap:
+        """获取某天的活跃用户位图
+        
+        Args:
+            day_str: 日期字符串
+            backfill: 位图文件不存在时返回当天活跃用户ID的回调
+            pending: 首次加载时需要并入的尚未落盘的用户ID
+            loaded: 在锁外通过 load 预先加载的结果，位图已在内存中时忽略
+        
+        Returns:
+            UserBitmap: 位图，调用方不应修改
+        """
+        bitmap = self._bitmaps.get(day_str)
+        if bitmap is not None:
+            self._bitmaps.move_to_end(day_str)
+            return bitmap
+        
+        bitmap, backfilled = loaded or self.load(day_str, backfill)
+        if backfilled and len(bitmap):
+            self._dirty.add(day_str)
+        
+        for user_id in pending:
+            value = self.parse_user_id(user_id)
+            if value is not None and value not in bitmap:
+                bitmap.add(value)
+                self._dirty.add(day_str)
+        
+        for value in self._unloaded.pop(day_str, ()):
+            if value not in bitmap:
+                bitmap.add(value)
+                self._dirty.add(day_str)
+        
+        self._bitmaps[day_str] = bitmap
+        self._evict()
+        return bitmap
+    
+    def _evict(self) -> None:
+        """超出 max_cached 时按最久未使用的顺序淘汰已保存的过去日期的位图，需要时可从文件重新加载"""
+        excess = len(self._bitmaps) - self.max_cached
+        if excess <= 0:
+            return
+        
+        today_str = date.today().isoformat()
+        evictable = [
+            day_str for day_str in self._bitmaps
+            if day_str < today_str and day_str not in self._dirty
+        ]
+        for day_str in evictable[:excess]:
+            del self._bitmaps[day_str]
+    
+    def add(self, day_str: str, user_id: str) -> None:
+        """记录用户在某天活跃，只访问内存
+        
+        位图尚未加载时暂存用户ID，由 get 加载位图时并入。
+        
+        Args:
+            day_str: 日期字符串
+            user_id: 用户ID
+        """
+        value = self.parse_user_id(user_id)
+        if value is None:
+            return
+        bitmap = self._bitmaps.get(day_str)
+        if bitmap is None:
+            self._unloaded.setdefault(day_str, set()).add(value)
+        elif value not in bitmap:
+            bitmap.add(value)
+            self._dirty.add(day_str)
+    
+    def take_dirty(self) -> Dict[str, bytes]:
+        """取出有变化的位图的序列化数据，并清除脏标记
+        
+        Returns:
+            Dict[str, bytes]: {日期: 二进制数据}
+        """
+        snapshots = {day_str: self._bitmaps[day_str].to_bytes() for day_str in self._dirty}
+        self._dirty.clear()
+        # 取出后即可淘汰，保存失败时由 mark_dirty 恢复
+        self._evict()
+        return snapshots
+    
+    def mark_dirty(self, day_str: str, data: bytes) -> None:
+        """重新标记为脏，用于保存失败后重试
+        
+        Args:
+            day_str: 日期字符串
+            data: 保存失败的二进制数据，位图在保存期间被淘汰时据此恢复
+        """
+        if day_str not in self._bitmaps:
+            self._bitmaps[day_str] = UserBitmap.from_bytes(data)
+        self._dirty.add(day_str)
+    
+    def save(self, day_str: str, data: bytes) -> bool:
+        """保存位图文件
+        
+        Args:
+            day_str: 日期字符串
+            data: take_dirty 返回的二进制数据
+        
+        Returns:
+            bool: 是否保存成功
+        """
+        try:
+            atomic_write_bytes(self._get_file(day_str), data)
+            return True
+        except Exception as e:
+            logger.error(f"保存{day_str}活跃用户位图失败: {str(e)}")
+            return False
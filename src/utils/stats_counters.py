@@ -0,0 +1,462 @@
+"""统计计数器"""
+import sys
+import math
+import heapq
+from array import array
+from bisect import bisect_left, insort
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple, Union
+
+
+class RankedCounter:
+    """带排序索引的计数器
+    
+    在计数增加时同步维护按次数降序排列的索引，读取排名只需切片，
+    不必每次对全部键重新排序。键的数量（命令数）通常很少，插入和删除的开销可以忽略。
+    """
+    
+    def __init__(self, counts: Optional[Dict[str, int]] = None):
+        """初始化计数器
+        
+        Args:
+            counts: 初始计数 {键: 次数}
+        """
+        self._counts: Dict[str, int] = {}
+        # 排序索引，元素为 (-次数, 键)，次数相同时按键名排序
+        self._order: List[Tuple[int, str]] = []
+        self._total = 0
+        
+        for key, count in (counts or {}).items():
+            self.increment(key, count)
+    
+    def increment(self, key: str, count: int = 1) -> None:
+        """增加计数并调整排序索引
+        
+        Args:
+            key: 键
+            count: 增加的次数
+        """
+        if count == 0:
+            return
+        
+        old = self._counts.get(key, 0)
+        if old:
+            del self._order[bisect_left(self._order, (-old, key))]
+        
+        new = old + count
+        self._counts[key] = new
+        insort(self._order, (-new, key))
+        self._total += count
+    
+    def get(self, key: str) -> int:
+        """获取键的计数
+        
+        Args:
+            key: 键
+        
+        Returns:
+            int: 次数，不存在时为0
+        """
+        return self._counts.get(key, 0)
+    
+    def top(self, limit: Optional[int] = None) -> List[Tuple[str, int]]:
+        """获取按次数降序排列的前N项
+        
+        Args:
+            limit: 数量上限，None 表示全部
+        
+        Returns:
+            List[Tuple[str, int]]: [(键, 次数)]
+        """
+        entries = self._order if limit is None else self._order[:limit]
+        return [(key, -negative) for negative, key in entries]
+    
+    def as_dict(self) -> Dict[str, int]:
+        """获取全部计数的副本
+        
+        Returns:
+            Dict[str, int]: {键: 次数}
+        """
+        return dict(self._counts)
+    
+    @property
+    def total(self) -> int:
+        """所有键的计数总和"""
+        return self._total
+    
+    def __len__(self) -> int:
+        return len(self._counts)
+
+
+# 用户键：数字ID以int保存，其余（理论上不会出现）保留原字符串
+UserKey = Union[int, str]
+
+
+class CounterTable:
+    """紧凑的 用户 × 命令 计数表
+    
+    命令名称只保存一份并映射为连续的整数ID，用户ID以int作为键，
+    每个用户的计数是一个按命令ID索引的 array，而不是各自带一份命令名称键的字典。
+    对外通过只读的 Mapping 视图提供与 {用户ID: {命令: 次数}} 相同的读取方式。
+    """
+    
+    # 计数使用64位有符号整数
+    TYPECODE = 'q'
+    
+    def __init__(self):
+        self._commands: List[str] = []
+        self._command_ids: Dict[str, int] = {}
+        self._rows: Dict[UserKey, array] = {}
+    
+    @classmethod
+    def from_dict(cls, stats: Mapping[str, Mapping[str, int]]) -> "CounterTable":
+        """从嵌套字典构建计数表
+        
+        Args:
+            stats: {用户ID: {命令: 次数}}
+        
+        Returns:
+            CounterTable: 计数表
+        """
+        table = cls()
+        for user_id, commands in stats.items():
+            for command, count in commands.items():
+                table.add(user_id, command, count)
+        return table
+    
+    @staticmethod
+    def _user_key(user_id: str) -> UserKey:
+        """将字符串用户ID转换为内部键
+        
+        Args:
+            user_id: 用户ID
+        
+        Returns:
+            UserKey: 能无损往返的数字ID返回int，否则返回原字符串
+        """
+        try:
+            key = int(user_id)
+        except (TypeError, ValueError):
+            return user_id
+        return key if str(key) == user_id else user_id
+    
+    def _intern_command(self, command: str) -> int:
+        """获取命令ID，新命令分配下一个ID
+        
+        Args:
+            command: 命令名称
+        
+        Returns:
+            int: 命令ID
+        """
+        command_id = self._command_ids.get(command)
+        if command_id is None:
+            command_id = len(self._commands)
+            self._commands.append(sys.intern(command))
+            self._command_ids[self._commands[command_id]] = command_id
+        return command_id
+    
+    def add(self, user_id: str, command: str, count: int = 1) -> None:
+        """增加用户某个命令的计数
+        
+        Args:
+            user_id: 用户ID
+            command: 命令名称
+            count: 增加的次数
+        """
+        command_id = self._intern_command(command)
+        key = self._user_key(user_id)
+        row = self._rows.get(key)
+        if row is None:
+            row = self._rows[key] = array(self.TYPECODE)
+        if command_id >= len(row):
+            row.extend([0] * (command_id + 1 - len(row)))
+        row[command_id] += count
+    
+    def row(self, user_id: str) -> Optional["CounterRowView"]:
+        """获取用户的计数视图
+        
+        Args:
+            user_id: 用户ID
+        
+        Returns:
+            Optional[CounterRowView]: {命令: 次数} 只读视图，用户不存在时为None
+        """
+        row = self._rows.get(self._user_key(user_id))
+        return CounterRowView(self, row) if row is not None else None
+    
+    def view(self) -> "CounterTableView":
+        """获取整张表的只读视图
+        
+        Returns:
+            CounterTableView: {用户ID: {命令: 次数}} 只读视图
+        """
+        return CounterTableView(self)
+    
+    def to_dict(self) -> Dict[str, Dict[str, int]]:
+        """转换为嵌套字典，用于序列化
+        
+        Returns:
+            Dict: {用户ID: {命令: 次数}}
+        """
+        return {str(key): dict(CounterRowView(self, row).items()) for key, row in self._rows.items()}
+
+
+class CounterRowView(Mapping):
+    """计数表中单个用户的只读视图，只包含次数不为0的命令"""
+    
+    __slots__ = ('_table', '_row')
+    
+    def __init__(self, table: CounterTable, row: array):
+        self._table = table
+        self._row = row
+    
+    def __getitem__(self, command: str) -> int:
+        command_id = self._table._command_ids.get(command)
+        if command_id is not None and command_id < len(self._row) and self._row[command_id]:
+            return self._row[command_id]
+        raise KeyError(command)
+    
+    def __iter__(self) -> Iterator[str]:
+        commands = self._table._commands
+        for command_id, count in enumerate(self._row):
+            if count:
+                yield commands[command_id]
+    
+    def __len__(self) -> int:
+        return sum(1 for count in self._row if count)
+    
+    def items(self):
+        commands = self._table._commands
+        return [(commands[command_id], count) for command_id, count in enumerate(self._row) if count]
+    
+    def values(self):
+        return [count for count in self._row if count]
+    
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+
+class CounterTableView(Mapping):
+    """计数表的只读视图，键为字符串用户ID，值为 CounterRowView"""
+    
+    __slots__ = ('_table',)
+    
+    def __init__(self, table: CounterTable):
+        self._table = table
+    
+    def __getitem__(self, user_id: str) -> CounterRowView:
+        row = self._table.row(user_id)
+        if row is None:
+            raise KeyError(user_id)
+        return row
+    
+    def __iter__(self) -> Iterator[str]:
+        return (str(key) for key in self._table._rows)
+    
+    def __len__(self) -> int:
+        return len(self._table._rows)
+
+
+class LatencyHistogram:
+    """对数分桶的耗时直方图
+    
+    桶边界按 2 的 1/BUCKETS_PER_OCTAVE 次幂递增，相对误差约 19%，
+    内存占用固定，与记录次数无关。
+    """
+    
+    # 最小桶上界（秒），更短的耗时都计入第一个桶
+    MIN_SECONDS = 0.001
+    BUCKETS_PER_OCTAVE = 4
+    # 18个倍程，最大桶上界约 262 秒，更长的耗时计入最后一个桶
+    NUM_BUCKETS = BUCKETS_PER_OCTAVE * 18 + 1
+    
+    __slots__ = ('_buckets', 'count', 'errors', 'total_seconds', 'max_seconds')
+    
+    def __init__(self):
+        self._buckets = array('Q', [0] * self.NUM_BUCKETS)
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+    
+    @classmethod
+    def _bucket_index(cls, seconds: float) -> int:
+        """计算耗时所属的桶
+        
+        Args:
+            seconds: 耗时（秒）
+        
+        Returns:
+            int: 桶下标
+        """
+        if seconds <= cls.MIN_SECONDS:
+            return 0
+        index = math.ceil(math.log2(seconds / cls.MIN_SECONDS) * cls.BUCKETS_PER_OCTAVE)
+        return min(index, cls.NUM_BUCKETS - 1)
+    
+    @classmethod
+    def _bucket_upper(cls, index: int) -> float:
+        """获取桶的上界
+        
+        Args:
+            index: 桶下标
+        
+        Returns:
+            float: 上界（秒）
+        """
+        return cls.MIN_SECONDS * 2 ** (index / cls.BUCKETS_PER_OCTAVE)
+    
+    def record(self, seconds: float, error: bool = False) -> None:
+        """记录一次耗时
+        
+        Args:
+            seconds: 耗时（秒）
+            error: 本次是否执行出错
+        """
+        self._buckets[self._bucket_index(seconds)] += 1
+        self.count += 1
+        self.total_seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+        if error:
+            self.errors += 1
+    
+    def percentile(self, q: float) -> float:
+        """估算分位数
+        
+        Args:
+            q: 分位，取值 0~1，如 0.95
+        
+        Returns:
+            float: 耗时估计值（秒），取所在桶的上界且不超过最大值
+        """
+        if not self.count:
+            return 0.0
+        
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index, bucket_count in enumerate(self._buckets):
+            seen += bucket_count
+            if seen >= rank:
+                return min(self._bucket_upper(index), self.max_seconds)
+        return self.max_seconds
+
+
+class SpaceSaving:
+    """Space-Saving 频繁项统计
+    
+    最多跟踪 capacity 个键，表满时新键替换计数最小的键并继承其计数，
+    因此计数可能偏大但不会偏小，真正的高频项一定会保留在表中。
+    
+    最小项通过惰性更新的最小堆查找：每个键在堆中恰有一项，已有键增加计数时不更新堆，
+    堆项的计数只会小于等于实际计数。淘汰时弹出的堆项已过时则按实际计数放回，
+    每次放回都对应之前的计数增加，均摊每次新键 O(log capacity)。
+    """
+    
+    __slots__ = ('capacity', '_counts', '_heap')
+    
+    def __init__(self, capacity: int):
+        """初始化
+        
+        Args:
+            capacity: 最多跟踪的键数量
+        """
+        self.capacity = capacity
+        self._counts: Dict[str, int] = {}
+        # (堆项记录的计数, 键)
+        self._heap: List[Tuple[int, str]] = []
+    
+    def add(self, key: str, count: int = 1) -> None:
+        """增加键的计数
+        
+        Args:
+            key: 键
+            count: 增加的次数
+        """
+        if key in self._counts:
+            self._counts[key] += count
+            return
+        
+        if len(self._counts) < self.capacity:
+            self._counts[key] = count
+            heapq.heappush(self._heap, (count, key))
+            return
+        
+        # 只有表满且出现新键时才需要找最小项，堆顶计数与实际计数一致时即为最小项
+        while True:
+            heap_count, victim = self._heap[0]
+            actual = self._counts[victim]
+            if heap_count == actual:
+                break
+            heapq.heapreplace(self._heap, (actual, victim))
+        
+        del self._counts[victim]
+        self._counts[key] = actual + count
+        heapq.heapreplace(self._heap, (actual + count, key))
+    
+    def items(self):
+        return self._counts.items()
+    
+    def clear(self) -> None:
+        self._counts.clear()
+        self._heap.clear()
+    
+    def __len__(self) -> int:
+        return len(self._counts)
+
+
+class WindowedTopK:
+    """滑动时间窗口内的频繁项统计
+    
+    将窗口切分为若干时间槽组成环形数组，每个槽是一个 Space-Saving 表，
+    过期的槽在被复用时清空，内存占用固定为 槽数 × 容量。
+    """
+    
+    def __init__(self, window_seconds: int, slots: int, capacity: int):
+        """初始化
+        
+        Args:
+            window_seconds: 窗口长度（秒）
+            slots: 时间槽数量
+            capacity: 每个槽最多跟踪的键数量
+        """
+        self.slot_seconds = window_seconds / slots
+        self._slots = [SpaceSaving(capacity) for _ in range(slots)]
+        # 每个槽当前对应的时间槽编号，用于判断是否过期
+        self._epochs = [-1] * slots
+    
+    def add(self, key: str, timestamp: float, count: int = 1) -> None:
+        """记录一次出现
+        
+        Args:
+            key: 键
+            timestamp: 时间戳（秒）
+            count: 次数
+        """
+        epoch = int(timestamp // self.slot_seconds)
+        index = epoch % len(self._slots)
+        if self._epochs[index] != epoch:
+            self._slots[index].clear()
+            self._epochs[index] = epoch
+        self._slots[index].add(key, count)
+    
+    def top(self, now: float, limit: int = 10) -> List[Tuple[str, int]]:
+        """获取窗口内次数最多的键
+        
+        Args:
+            now: 当前时间戳（秒）
+            limit: 数量上限
+        
+        Returns:
+            List[Tuple[str, int]]: [(键, 估计次数)]，按次数降序排列
+        """
+        current = int(now // self.slot_seconds)
+        oldest = current - len(self._slots) + 1
+        
+        merged: Dict[str, int] = {}
+        for epoch, table in zip(self._epochs, self._slots):
+            if oldest <= epoch <= current:
+                for key, count in table.items():
+                    merged[key] = merged.get(key, 0) + count
+        
+        return sorted(merged.items(), key=lambda x: x[1], reverse=True)[:limit]
@@ -0,0 +1,241 @@
+"""命令事件日志（追加写入的分段日志）"""
+import os
+import json
+import shutil
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Iterator, Optional, TextIO
+
+from src.logger import logger
+
+
+class CommandEventLog:
+    """命令事件日志
+    
+    每条命令调用以一行JSON追加到当前分段文件中，追加写入不需要读取旧数据。
+    分段在统计落盘时轮换并关闭，已折叠进每日统计的分段移入 compacted 目录保留，
+    以便之后按小时等其它维度重新聚合，超过保留天数后删除。
+    """
+    
+    SEGMENT_SUFFIX = ".jsonl"
+    
+    def __init__(self, events_dir: str, retention_days: int = 30):
+        """初始化事件日志
+        
+        Args:
+            events_dir: 事件日志目录
+            retention_days: 已折叠分段的保留天数，0表示折叠后立即删除
+        """
+        self.events_dir = events_dir
+        self.retention_days = retention_days
+        self.compacted_dir = os.path.join(events_dir, "compacted")
+        os.makedirs(self.events_dir, exist_ok=True)
+        os.makedirs(self.compacted_dir, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._file: Optional[TextIO] = None
+        self._segment_path: Optional[str] = None
+        self._segment_seq = 0
+    
+    def _new_segment_path(self) -> str:
+        """生成新分段文件路径，文件名按创建时间排序"""
+        self._segment_seq += 1
+        name = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{self._segment_seq:04d}{self.SEGMENT_SUFFIX}"
+        return os.path.join(self.events_dir, name)
+    
+    def append(self, timestamp: float, user_id: str, command: str, outcome: str) -> None:
+        """追加一条命令事件
+        
+        Args:
+            timestamp: 事件时间戳（秒）
+            user_id: 用户ID
+            command: 命令名称
+            outcome: 执行结果，如 ok、error
+        """
+        line = json.dumps(
+            {'ts': round(timestamp, 3), 'user': user_id, 'command': command, 'outcome': outcome},
+            ensure_ascii=False
+        )
+        
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._segment_path = self._new_segment_path()
+                    self._file = open(self._segment_path, 'a', encoding='utf-8')
+                self._file.write(line + "\n")
+                self._file.flush()
+            except Exception as e:
+                logger.error(f"写入命令事件日志失败: {str(e)}")
+    
+    def rotate(self) -> List[str]:
+        """关闭当前分段
+        
+        Returns:
+            List[str]: 所有已关闭且尚未折叠的分段路径，按时间排序
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._segment_path = None
+        
+        return self.pending_segments()
+    
+    def pending_segments(self) -> List[str]:
+        """获取尚未折叠的分段（不含正在写入的分段）
+        
+        Returns:
+            List[str]: 分段路径列表，按时间排序
+        """
+        with self._lock:
+            current = self._segment_path
+        
+        return [
+            path for path in self._list_segments(self.events_dir)
+            if path != current
+        ]
+    
+    def _list_segments(self, directory: str) -> List[str]:
+        """列出目录下的分段文件
+        
+        Args:
+            directory: 目录路径
+        
+        Returns:
+            List[str]: 分段路径列表，按时间排序
+        """
+        try:
+            names = sorted(
+                name for name in os.listdir(directory)
+                if name.endswith(self.SEGMENT_SUFFIX)
+            )
+        except FileNotFoundError:
+            return []
+        return [os.path.join(directory, name) for name in names]
+    
+    @staticmethod
+    def segment_id(path: str) -> str:
+        """分段标识，即文件名，按字符串比较即按创建时间排序
+        
+        Args:
+            path: 分段路径
+        
+        Returns:
+            str: 分段标识
+        """
+        return os.path.basename(path)
+    
+    def mark_compacted(self, segments: List[str]) -> None:
+        """将已折叠进每日统计的分段移入 compacted 目录，并删除超过保留天数的分段
+        
+        Args:
+            segments: 分段路径列表
+        """
+        for path in segments:
+            try:
+                if self.retention_days > 0:
+                    shutil.move(path, os.path.join(self.compacted_dir, os.path.basename(path)))
+                else:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                logger.error(f"移动已折叠的事件分段 {path} 失败: {str(e)}")
+        
+        if segments:
+            self.prune()
+    
+    def prune(self) -> int:
+        """删除超过保留天数的已折叠分段
+        
+        下一个分段在截止时间之前创建时，本分段的事件都早于截止时间，可以删除。
+        
+        Returns:
+            int: 删除的分段数量
+        """
+        cutoff = datetime.now() - timedelta(days=self.retention_days)
+        segments = self._list_segments(self.compacted_dir)
+        removed = 0
+        for path, next_path in zip(segments, segments[1:]):
+            if self._segment_start(next_path) >= cutoff:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError as e:
+                logger.warning(f"删除过期的事件分段 {path} 失败: {str(e)}")
+        
+        if removed:
+            logger.info(f"已删除 {removed} 个超过 {self.retention_days} 天的事件分段")
+        return removed
+    
+    def read_segment(self, path: str) -> Iterator[Dict[str, Any]]:
+        """逐行读取分段中的事件
+        
+        Args:
+            path: 分段路径
+        
+        Yields:
+            Dict: 事件记录
+        """
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # 进程异常退出时最后一行可能不完整
+                        logger.warning(f"跳过事件分段 {path} 中无法解析的记录")
+        except FileNotFoundError:
+            return
+    
+    def iter_events(self, start: datetime, end: datetime) -> Iterator[Dict[str, Any]]:
+        """遍历指定时间范围内的所有原始事件（含已折叠和未折叠的分段）
+        
+        Args:
+            start: 起始时间（包含）
+            end: 结束时间（不包含）
+        
+        Yields:
+            Dict: 事件记录
+        """
+        start_ts = start.timestamp()
+        end_ts = end.timestamp()
+        segments = sorted(
+            self._list_segments(self.compacted_dir) + self._list_segments(self.events_dir),
+            key=os.path.basename
+        )
+        
+        for index, path in enumerate(segments):
+            # 下一个分段在起始时间之前创建，说明本分段的事件都早于起始时间
+            if index + 1 < len(segments) and self._segment_start(segments[index + 1]) < start:
+                continue
+            if self._segment_start(path) >= end:
+                break
+            
+            for event in self.read_segment(path):
+                if start_ts <= event.get('ts', 0) < end_ts:
+                    yield event
+    
+    @staticmethod
+    def _segment_start(path: str) -> datetime:
+        """从分段文件名解析分段创建时间
+        
+        Args:
+            path: 分段路径
+        
+        Returns:
+            datetime: 分段创建时间
+        """
+        return datetime.strptime(os.path.basename(path).split('-')[0], '%Y%m%dT%H%M%S%f')
+    
+    def close(self) -> None:
+        """关闭当前分段文件"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._segment_path = None
@@ -0,0 +1,863 @@
+"""统计数据存储后端"""
+import os
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import date, timedelta
+from typing import ContextManager, Dict, List, Any, Mapping, Optional, Tuple
+
+from src.logger import logger
+from src.utils.file_utils import atomic_write_json
+from src.utils.stats_archive import StatsArchive
+from src.utils.stats_counters import CounterTable
+
+# 每日增量批次格式：{日期: {用户ID: {命令: 次数}}}
+StatsBatch = Dict[str, Dict[str, Dict[str, int]]]
+
+# 汇总周期：日 → 周 → 月，周使用ISO周（周一为第一天）
+PERIOD_DAILY = "daily"
+PERIOD_WEEKLY = "weekly"
+PERIOD_MONTHLY = "monthly"
+
+# JSON统计文件中记录最后叠加的事件日志分段的键，用户ID均为数字，不会冲突
+SEGMENT_KEY = "_segment"
+
+
+def week_key(day: date) -> str:
+    """获取日期所在ISO周的键，如 2024-W05"""
+    iso_year, iso_week, _ = day.isocalendar()
+    return f"{iso_year}-W{iso_week:02d}"
+
+
+def month_key(day: date) -> str:
+    """获取日期所在月份的键，如 2024-01"""
+    return f"{day.year}-{day.month:02d}"
+
+
+def rollup_keys(day: date) -> List[Tuple[str, str]]:
+    """获取日期所属的各级周期键
+    
+    Args:
+        day: 日期对象
+    
+    Returns:
+        List[Tuple[str, str]]: [(周期, 键)]，依次为日、周、月
+    """
+    return [
+        (PERIOD_DAILY, day.isoformat()),
+        (PERIOD_WEEKLY, week_key(day)),
+        (PERIOD_MONTHLY, month_key(day)),
+    ]
+
+
+def split_date_range(start: date, end: date) -> List[Tuple[str, str]]:
+    """将日期区间拆分为尽量少的月、周、日汇总
+    
+    从起始日期开始，能覆盖整月时使用月汇总，否则能覆盖整周时使用周汇总，
+    剩余部分使用日汇总。例如90天的区间通常只需要十几个汇总。
+    
+    Args:
+        start: 起始日期（包含）
+        end: 结束日期（包含）
+    
+    Returns:
+        List[Tuple[str, str]]: [(周期, 键)]，各汇总覆盖的日期互不重叠
+    """
+    def month_end(day: date) -> date:
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    
+    periods = []
+    cursor = start
+    
+    while cursor <= end:
+        if cursor.day == 1 and month_end(cursor) <= end:
+            periods.append((PERIOD_MONTHLY, month_key(cursor)))
+            cursor = month_end(cursor) + timedelta(days=1)
+            continue
+        
+        week_end = cursor + timedelta(days=6)
+        if cursor.weekday() == 0 and week_end <= end:
+            # 整周跨入下个月且下个月能整月覆盖时，改用日汇总补齐本月，让下个月使用月汇总
+            crosses_full_month = (
+                week_end.month != cursor.month
+                and month_end(week_end) <= end
+            )
+            if not crosses_full_month:
+                periods.append((PERIOD_WEEKLY, week_key(cursor)))
+                cursor = week_end + timedelta(days=1)
+                continue
+        
+        periods.append((PERIOD_DAILY, cursor.isoformat()))
+        cursor += timedelta(days=1)
+    
+    return periods
+
+
+def add_count(stats: Dict[str, Dict[str, int]], user_id: str, command: str, count: int = 1) -> None:
+    """在嵌套统计字典上累加计数
+    
+    Args:
+        stats: {用户ID: {命令: 次数}} 格式的统计字典
+        user_id: 用户ID
+        command: 命令名称
+        count: 增加的次数
+    """
+    user_stats = stats.setdefault(user_id, {})
+    user_stats[command] = user_stats.get(command, 0) + count
+
+
+def aggregate_rollups(batch: StatsBatch) -> Dict[Tuple[str, str], Dict[str, Dict[str, int]]]:
+    """将每日增量按日、周、月三级周期汇总
+    
+    Args:
+        batch: 每日增量批次
+    
+    Returns:
+        Dict: {(周期, 键): {用户ID: {命令: 次数}}}
+    """
+    rollups: Dict[Tuple[str, str], Dict[str, Dict[str, int]]] = {}
+    for day_str, day_counts in batch.items():
+        for period_key in rollup_keys(date.fromisoformat(day_str)):
+            period_stats = rollups.setdefault(period_key, {})
+            for user_id, commands in day_counts.items():
+                for command, count in commands.items():
+                    add_count(period_stats, user_id, command, count)
+    return rollups
+
+
+class StatsStorage(ABC):
+    """统计存储后端接口
+    
+    除每日统计外，后端还需在写入增量时同步维护周、月两级汇总，
+    以便任意日期区间的查询只需读取少量汇总数据。
+    """
+    
+    @abstractmethod
+    def apply_increments(self, batch: StatsBatch, segment: Optional[str] = None) -> List[str]:
+        """批量写入每日增量，同时更新周、月汇总和总体统计
+        
+        Args:
+            batch: 每日增量批次
+            segment: 本批增量对应的最后一个事件日志分段，与增量在同一次写入中记录，
+                已记录的分段不早于它时视为已写入，不再重复叠加
+        
+        Returns:
+            List[str]: 写入失败的日期列表，全部成功时为空
+        """
+        pass
+    
+    @abstractmethod
+    def load_period(self, period: str, key: str) -> Dict[str, Dict[str, int]]:
+        """加载指定周期汇总中所有用户的统计
+        
+        Args:
+            period: 周期，PERIOD_DAILY / PERIOD_WEEKLY / PERIOD_MONTHLY
+            key: 周期键，如 2024-01-05、2024-W01、2024-01
+        
+        Returns:
+            Dict: {用户ID: {命令: 次数}}
+        """
+        pass
+    
+    def period_summary(self, period: str, key: str) -> Dict[str, int]:
+        """按命令汇总指定周期的使用次数
+        
+        Args:
+            period: 周期
+            key: 周期键
+        
+        Returns:
+            Dict: {命令: 次数}
+        """
+        summary: Dict[str, int] = {}
+        for commands in self.load_period(period, key).values():
+            for cmd, count in commands.items():
+                summary[cmd] = summary.get(cmd, 0) + count
+        return summary
+    
+    def load_day(self, day: date) -> Dict[str, Dict[str, int]]:
+        """加载指定日期所有用户的统计
+        
+        Args:
+            day: 日期对象
+        
+        Returns:
+            Dict: {用户ID: {命令: 次数}}
+        """
+        return self.load_period(PERIOD_DAILY, day.isoformat())
+    
+    def load_user_day(self, user_id: str, day: date) -> Dict[str, int]:
+        """加载指定用户在指定日期的统计
+        
+        Args:
+            user_id: 用户ID
+            day: 日期对象
+        
+        Returns:
+            Dict: {命令: 次数}
+        """
+        return self.load_day(day).get(user_id, {})
+    
+    @abstractmethod
+    def load_total(self) -> Dict[str, Dict[str, int]]:
+        """加载所有用户的总体统计
+        
+        Returns:
+            Dict: {用户ID: {命令: 次数}}
+        """
+        pass
+    
+    @abstractmethod
+    def load_user_total(self, user_id: str) -> Dict[str, int]:
+        """加载指定用户的总体统计
+        
+        Args:
+            user_id: 用户ID
+        
+        Returns:
+            Dict: {命令: 次数}
+        """
+        pass
+    
+    def command_summary(self, day: date = None) -> Dict[str, int]:
+        """按命令汇总使用次数
+        
+        Args:
+            day: 日期对象，None表示总体统计
+        
+        Returns:
+            Dict: {命令: 次数}
+        """
+        if day is not None:
+            return self.period_summary(PERIOD_DAILY, day.isoformat())
+        
+        summary: Dict[str, int] = {}
+        for commands in self.load_total().values():
+            for cmd, count in commands.items():
+                summary[cmd] = summary.get(cmd, 0) + count
+        return summary
+    
+    def archive(self, today: date, lock: ContextManager) -> int:
+        """归档已结束月份的每日数据，不使用文件存储的后端无需实现
+        
+        Args:
+            today: 今天的日期，当前月份不会被归档
+            lock: 与落盘、查询互斥的锁，只在替换数据文件时持有
+        
+        Returns:
+            int: 归档的天数
+        """
+        return 0
+    
+    def close(self) -> None:
+        """释放存储资源"""
+        pass
+
+
+class JsonStatsStorage(StatsStorage):
+    """JSON文件存储：每天、每周、每月各一个文件，外加一个总体统计文件
+    
+    已结束月份的每日文件可以打包进 archive 目录下的月度归档，
+    读取时每日文件优先，不存在时再从归档读取。
+    """
+    
+    def __init__(self, stats_dir: str, backfill_rollups: bool = True):
+        """初始化JSON存储
+        
+        Args:
+            stats_dir: 统计数据目录
+            backfill_rollups: 缺少周、月汇总时是否根据每日文件回填
+        """
+        self.stats_dir = stats_dir
+        self.daily_stats_dir = os.path.join(stats_dir, "daily")
+        self.total_stats_file = os.path.join(stats_dir, "total_stats.json")
+        self.period_dirs = {
+            PERIOD_DAILY: self.daily_stats_dir,
+            PERIOD_WEEKLY: os.path.join(stats_dir, "weekly"),
+            PERIOD_MONTHLY: os.path.join(stats_dir, "monthly"),
+        }
+        
+        self.daily_archive = StatsArchive(os.path.join(stats_dir, "archive"))
+        
+        # 周、月汇总目录不存在说明是旧版本的数据，需要从每日文件回填
+        needs_backfill = not os.path.isdir(self.period_dirs[PERIOD_MONTHLY])
+        
+        os.makedirs(self.stats_dir, exist_ok=True)
+        for directory in self.period_dirs.values():
+            os.makedirs(directory, exist_ok=True)
+        
+        # 总体统计常驻内存（紧凑计数表），落盘失败时标记为脏，下次写入时重试
+        self._total_segment: Optional[str] = None
+        self.total_stats = CounterTable.from_dict(self._load_total_stats())
+        self._total_dirty = False
+        
+        if needs_backfill and backfill_rollups:
+            self._backfill_rollups()
+    
+    def _get_period_file(self, period: str, key: str) -> str:
+        """获取指定周期汇总的文件路径
+        
+        Args:
+            period: 周期
+            key: 周期键
+        
+        Returns:
+            str: 文件路径
+        """
+        return os.path.join(self.period_dirs[period], f"{key}.json")
+    
+    def _load_total_stats(self) -> Dict[str, Dict[str, int]]:
+        """加载总体统计数据
+        
+        Returns:
+            Dict: 用户请求总次数统计
+        """
+        if os.path.exists(self.total_stats_file):
+            try:
+                with open(self.total_stats_file, 'r', encoding='utf-8') as f:
+                    stats = json.load(f)
+                self._total_segment = stats.pop(SEGMENT_KEY, None)
+                return stats
+            except Exception as e:
+                logger.error(f"加载总体统计数据失败: {str(e)}")
+        
+        # 如果文件不存在或加载失败，返回空统计
+        return {}
+    
+    def _load_period_stats(self, period: str, key: str) -> Dict[str, Dict[str, int]]:
+        """加载指定周期的统计数据
+        
+        Args:
+            period: 周期
+            key: 周期键
+        
+        Returns:
+            Dict: 该周期用户请求次数统计
+        """
+        stats = self._read_period_file(period, key)
+        stats.pop(SEGMENT_KEY, None)
+        return stats
+    
+    def _read_period_file(self, period: str, key: str) -> Dict[str, Any]:
+        """读取指定周期的统计文件，包含最后叠加的事件日志分段
+        
+        Args:
+            period: 周期
+            key: 周期键
+        
+        Returns:
+            Dict: 文件内容
+        """
+        stats_file = self._get_period_file(period, key)
+        
+        if os.path.exists(stats_file):
+            try:
+                with open(stats_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                logger.error(f"加载{key}统计数据失败: {str(e)}")
+        elif period == PERIOD_DAILY:
+            # 每日文件不存在时从月度归档读取
+            archived = self.daily_archive.read_day(key)
+            if archived is not None:
+                return archived
+        
+        # 如果文件不存在或加载失败，返回空统计
+        return {}
+    
+    def _save_total_stats(self) -> bool:
+        """保存总体统计数据
+        
+        Returns:
+            bool: 是否保存成功
+        """
+        stats = self.total_stats.to_dict()
+        if self._total_segment:
+            stats[SEGMENT_KEY] = self._total_segment
+        try:
+            atomic_write_json(self.total_stats_file, stats)
+            return True
+        except Exception as e:
+            logger.error(f"保存总体统计数据失败: {str(e)}")
+            return False
+    
+    def _save_period_stats(self, stats: Dict[str, Dict[str, int]], period: str, key: str) -> bool:
+        """保存指定周期的统计数据
+        
+        Args:
+            stats: 统计数据
+            period: 周期
+            key: 周期键
+        
+        Returns:
+            bool: 是否保存成功
+        """
+        try:
+            atomic_write_json(self._get_period_file(period, key), stats)
+            return True
+        except Exception as e:
+            logger.error(f"保存{key}统计数据失败: {str(e)}")
+            return False
+    
+    def _merge_into_period(self, period: str, key: str, increments: Dict[str, Dict[str, int]],
+                           segment: Optional[str] = None) -> bool:
+        """读取周期文件，叠加增量后写回
+        
+        Args:
+            period: 周期
+            key: 周期键
+            increments: {用户ID: {命令: 次数}}
+            segment: 增量对应的事件日志分段，和统计写入同一个文件
+        
+        Returns:
+            bool: 是否保存成功，文件已包含该分段的增量时直接返回成功
+        """
+        stats = self._read_period_file(period, key)
+        applied_segment = stats.pop(SEGMENT_KEY, None)
+        if segment and applied_segment and applied_segment >= segment:
+            return True
+        
+        for user_id, commands in increments.items():
+            for command, count in commands.items():
+                add_count(stats, user_id, command, count)
+        if segment or applied_segment:
+            stats[SEGMENT_KEY] = segment or applied_segment
+        return self._save_period_stats(stats, period, key)
+    
+    def _list_daily_files(self) -> List[str]:
+        """列出目录中单独存在的每日文件对应的日期
+        
+        Returns:
+            List[str]: 日期列表，升序
+        """
+        return sorted(
+            file_name[:-len(".json")]
+            for file_name in os.listdir(self.daily_stats_dir)
+            if file_name.endswith(".json")
+        )
+    
+    def list_days(self) -> List[str]:
+        """列出所有有统计数据的日期（含已归档的日期）
+        
+        Returns:
+            List[str]: 日期列表，升序
+        """
+        days = set(self._list_daily_files())
+        for month in self.daily_archive.months():
+            days.update(self.daily_archive.list_days(month))
+        return sorted(days)
+    
+    def _backfill_rollups(self) -> None:
+        """根据已有的每日数据生成周、月汇总"""
+        batch: StatsBatch = {}
+        for day_str in self.list_days():
+            batch[day_str] = self._load_period_stats(PERIOD_DAILY, day_str)
+        
+        if not batch:
+            return
+        
+        for (period, key), stats in aggregate_rollups(batch).items():
+            if period != PERIOD_DAILY:
+                self._save_period_stats(stats, period, key)
+        logger.info(f"已根据 {len(batch)} 个每日统计文件生成周、月汇总")
+    
+    def apply_increments(self, batch: StatsBatch, segment: Optional[str] = None) -> List[str]:
+        failed = []
+        applied: StatsBatch = {}
+        
+        # 每个文件各自记录最后叠加的分段，进程在写入途中退出后重放时，已写入的文件会被跳过
+        for day_str, day_counts in batch.items():
+            if not self._merge_into_period(PERIOD_DAILY, day_str, day_counts, segment):
+                failed.append(day_str)
+                continue
+            applied[day_str] = day_counts
+        
+        # 只有当日文件写入成功的增量才计入周、月汇总和总体统计，失败的增量由调用方重试
+        for (period, key), increments in aggregate_rollups(applied).items():
+            if period != PERIOD_DAILY and not self._merge_into_period(period, key, increments, segment):
+                logger.error(f"更新{key}汇总失败，区间统计可能不准确")
+        
+        if applied and not (segment and self._total_segment and self._total_segment >= segment):
+            for day_counts in applied.values():
+                for user_id, commands in day_counts.items():
+                    for command, count in commands.items():
+                        self.total_stats.add(user_id, command, count)
+            if segment:
+                self._total_segment = segment
+            self._total_dirty = True
+        
+        if self._total_dirty and self._save_total_stats():
+            self._total_dirty = False
+        
+        return failed
+    
+    def load_period(self, period: str, key: str) -> Dict[str, Dict[str, int]]:
+        return self._load_period_stats(period, key)
+    
+    def load_total(self) -> Mapping[str, Mapping[str, int]]:
+        return self.total_stats.view()
+    
+    def load_user_total(self, user_id: str) -> Mapping[str, int]:
+        return self.total_stats.row(user_id) or {}
+    
+    def _file_signature(self, day_str: str) -> Tuple[int, int]:
+        """每日文件的修改时间和大小，用于确认打包期间文件没有被修改"""
+        stat = os.stat(self._get_period_file(PERIOD_DAILY, day_str))
+        return stat.st_mtime_ns, stat.st_size
+    
+    def archive(self, today: date, lock: ContextManager) -> int:
+        current_month = month_key(today)
+        by_month: Dict[str, List[str]] = {}
+        for day_str in self._list_daily_files():
+            if day_str[:7] < current_month:
+                by_month.setdefault(day_str[:7], []).append(day_str)
+        
+        archived = 0
+        for month, day_strs in sorted(by_month.items()):
+            # 读取和压缩不持锁，查询和落盘照常进行
+            # 单独存在的每日文件是在归档内容基础上叠加过增量的，以它为准
+            days = self.daily_archive.read_month(month)
+            signatures: Dict[str, Tuple[int, int]] = {}
+            for day_str in day_strs:
+                try:
+                    signature = self._file_signature(day_str)
+                    with open(self._get_period_file(PERIOD_DAILY, day_str), 'r', encoding='utf-8') as f:
+                        days[day_str] = json.load(f)
+                    signatures[day_str] = signature
+                except Exception as e:
+                    logger.error(f"读取{day_str}统计数据失败，跳过归档: {str(e)}")
+            
+            if not signatures:
+                continue
+            
+            data = self.daily_archive.pack(days)
+            
+            # 每个月单独持锁，只用于替换归档文件和删除每日文件
+            with lock:
+                if not self._replace_with_archive(month, data, signatures):
+                    continue
+            archived += len(signatures)
+            logger.info(f"已将 {month} 的 {len(signatures)} 个每日统计文件归档")
+        
+        return archived
+    
+    def _replace_with_archive(self, month: str, data: bytes, signatures: Dict[str, Tuple[int, int]]) -> bool:
+        """写入归档并删除已打包的每日文件，调用方需持有落盘锁
+        
+        Args:
+            month: 月份
+            data: 归档文件内容
+            signatures: {日期: 打包时每日文件的签名}
+        
+        Returns:
+            bool: 是否已替换，打包期间有每日文件被修改时放弃，等待下次归档
+        """
+        try:
+            changed = any(self._file_signature(day_str) != signature for day_str, signature in signatures.items())
+        except OSError:
+            changed = True
+        if changed:
+            logger.info(f"{month} 的每日统计文件在打包期间被修改，下次再归档")
+            return False
+        
+        try:
+            self.daily_archive.write_packed(month, data)
+        except Exception as e:
+            logger.error(f"写入{month}统计归档失败: {str(e)}")
+            return False
+        
+        for day_str in signatures:
+            try:
+                os.remove(self._get_period_file(PERIOD_DAILY, day_str))
+            except OSError as e:
+                logger.warning(f"删除已归档的{day_str}统计文件失败: {str(e)}")
+        return True
+    
+    def close(self) -> None:
+        if self._total_dirty:
+            self._save_total_stats()
+
+
+class SQLiteStatsStorage(StatsStorage):
+    """SQLite存储：单个数据库文件，按 (日期/周/月, 用户, 命令) 保存计数"""
+    
+    # 各周期对应的表名和周期列名
+    PERIOD_TABLES = {
+        PERIOD_DAILY: ("daily_stats", "day"),
+        PERIOD_WEEKLY: ("weekly_stats", "week"),
+        PERIOD_MONTHLY: ("monthly_stats", "month"),
+    }
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            day TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            command TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, user_id, command)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_daily_stats_user ON daily_stats (user_id, day);
+        
+        CREATE TABLE IF NOT EXISTS weekly_stats (
+            week TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            command TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (week, user_id, command)
+        ) WITHOUT ROWID;
+        
+        CREATE TABLE IF NOT EXISTS monthly_stats (
+            month TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            command TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, user_id, command)
+        ) WITHOUT ROWID;
+        
+        CREATE TABLE IF NOT EXISTS total_stats (
+            user_id TEXT NOT NULL,
+            command TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, command)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_total_stats_command ON total_stats (command, count);
+        
+        CREATE TABLE IF NOT EXISTS stats_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        ) WITHOUT ROWID;
+    """
+    
+    def __init__(self, db_file: str, stats_dir: str = None):
+        """初始化SQLite存储
+        
+        Args:
+            db_file: 数据库文件路径
+            stats_dir: 旧JSON统计目录，数据库为空时从中导入历史数据
+        """
+        self.db_file = db_file
+        db_dir = os.path.dirname(db_file)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        
+        # 落盘在线程池中执行，查询在事件循环中执行，连接需跨线程共享并加锁
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        
+        if stats_dir and self._is_empty("total_stats"):
+            self._import_json(stats_dir)
+        
+        if self._is_empty("monthly_stats") and not self._is_empty("daily_stats"):
+            self._backfill_rollups()
+        
+        # 最后写入的事件日志分段，与增量在同一事务中更新
+        rows = self._query("SELECT value FROM stats_meta WHERE key = 'applied_segment'")
+        self._applied_segment: Optional[str] = rows[0][0] if rows else None
+    
+    def _is_empty(self, table: str) -> bool:
+        """指定表中是否还没有任何数据"""
+        with self._lock:
+            row = self._conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+        return row is None
+    
+    def _import_json(self, stats_dir: str) -> None:
+        """从旧的JSON统计文件导入历史数据
+        
+        Args:
+            stats_dir: JSON统计目录
+        """
+        total_stats_file = os.path.join(stats_dir, "total_stats.json")
+        if not os.path.exists(total_stats_file):
+            return
+        
+        try:
+            json_storage = JsonStatsStorage(stats_dir, backfill_rollups=False)
+            daily_rows = []
+            for day_str in json_storage.list_days():
+                daily_stats = json_storage.load_day(date.fromisoformat(day_str))
+                for user_id, commands in daily_stats.items():
+                    for command, count in commands.items():
+                        daily_rows.append((day_str, user_id, command, count))
+            
+            total_rows = [
+                (user_id, command, count)
+                for user_id, commands in json_storage.load_total().items()
+                for command, count in commands.items()
+            ]
+            
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO daily_stats (day, user_id, command, count) VALUES (?, ?, ?, ?)",
+                    daily_rows
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO total_stats (user_id, command, count) VALUES (?, ?, ?)",
+                    total_rows
+                )
+            logger.info(f"已从JSON统计文件导入 {len(daily_rows)} 条每日记录、{len(total_rows)} 条总体记录")
+        except Exception as e:
+            logger.error(f"从JSON统计文件导入数据失败: {str(e)}", exc_info=True)
+    
+    def _backfill_rollups(self) -> None:
+        """根据已有的每日记录生成周、月汇总"""
+        batch: StatsBatch = {}
+        for day_str, user_id, command, count in self._query("SELECT day, user_id, command, count FROM daily_stats"):
+            add_count(batch.setdefault(day_str, {}), user_id, command, count)
+        
+        rollups = {
+            period_key: stats
+            for period_key, stats in aggregate_rollups(batch).items()
+            if period_key[0] != PERIOD_DAILY
+        }
+        try:
+            with self._lock, self._conn:
+                self._upsert_rollups(rollups)
+            logger.info(f"已根据 {len(batch)} 天的每日记录生成周、月汇总")
+        except Exception as e:
+            logger.error(f"生成周、月汇总失败: {str(e)}", exc_info=True)
+    
+    def _upsert_rollups(self, rollups: Dict[Tuple[str, str], Dict[str, Dict[str, int]]]) -> None:
+        """在当前事务中以UPSERT方式累加各周期汇总
+        
+        Args:
+            rollups: {(周期, 键): {用户ID: {命令: 次数}}}
+        """
+        rows_by_period: Dict[str, List[tuple]] = {}
+        for (period, key), stats in rollups.items():
+            rows = rows_by_period.setdefault(period, [])
+            for user_id, commands in stats.items():
+                for command, count in commands.items():
+                    rows.append((key, user_id, command, count))
+        
+        for period, rows in rows_by_period.items():
+            table, column = self.PERIOD_TABLES[period]
+            self._conn.executemany(
+                f"""INSERT INTO {table} ({column}, user_id, command, count) VALUES (?, ?, ?, ?)
+                    ON CONFLICT ({column}, user_id, command) DO UPDATE SET count = count + excluded.count""",
+                rows
+            )
+    
+    def apply_increments(self, batch: StatsBatch, segment: Optional[str] = None) -> List[str]:
+        if segment and self._applied_segment and self._applied_segment >= segment:
+            return []
+        
+        total_counts: Dict[str, Dict[str, int]] = {}
+        for day_counts in batch.values():
+            for user_id, commands in day_counts.items():
+                for command, count in commands.items():
+                    add_count(total_counts, user_id, command, count)
+        
+        total_rows = [
+            (user_id, command, count)
+            for user_id, commands in total_counts.items()
+            for command, count in commands.items()
+        ]
+        
+        # 整批增量（含各级汇总）在一个事务内提交，失败时全部回滚
+        try:
+            with self._lock, self._conn:
+                self._upsert_rollups(aggregate_rollups(batch))
+                self._conn.executemany(
+                    """INSERT INTO total_stats (user_id, command, count) VALUES (?, ?, ?)
+                       ON CONFLICT (user_id, command) DO UPDATE SET count = count + excluded.count""",
+                    total_rows
+                )
+                if segment:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO stats_meta (key, value) VALUES ('applied_segment', ?)",
+                        (segment,)
+                    )
+            if segment:
+                self._applied_segment = segment
+            return []
+        except Exception as e:
+            logger.error(f"写入统计数据库失败: {str(e)}")
+            return list(batch.keys())
+    
+    def _query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        """执行查询并返回全部结果
+        
+        Args:
+            sql: SQL语句
+            params: 查询参数
+        
+        Returns:
+            List[tuple]: 结果行
+        """
+        try:
+            with self._lock:
+                return self._conn.execute(sql, params).fetchall()
+        except Exception as e:
+            logger.error(f"查询统计数据库失败: {str(e)}")
+            return []
+    
+    def load_period(self, period: str, key: str) -> Dict[str, Dict[str, int]]:
+        table, column = self.PERIOD_TABLES[period]
+        stats: Dict[str, Dict[str, int]] = {}
+        rows = self._query(f"SELECT user_id, command, count FROM {table} WHERE {column} = ?", (key,))
+        for user_id, command, count in rows:
+            stats.setdefault(user_id, {})[command] = count
+        return stats
+    
+    def period_summary(self, period: str, key: str) -> Dict[str, int]:
+        table, column = self.PERIOD_TABLES[period]
+        rows = self._query(
+            f"SELECT command, SUM(count) FROM {table} WHERE {column} = ? GROUP BY command",
+            (key,)
+        )
+        return dict(rows)
+    
+    def load_user_day(self, user_id: str, day: date) -> Dict[str, int]:
+        rows = self._query(
+            "SELECT command, count FROM daily_stats WHERE user_id = ? AND day = ?",
+            (user_id, day.isoformat())
+        )
+        return dict(rows)
+    
+    def load_total(self) -> Dict[str, Dict[str, int]]:
+        stats: Dict[str, Dict[str, int]] = {}
+        for user_id, command, count in self._query("SELECT user_id, command, count FROM total_stats"):
+            stats.setdefault(user_id, {})[command] = count
+        return stats
+    
+    def load_user_total(self, user_id: str) -> Dict[str, int]:
+        rows = self._query(
+            "SELECT command, count FROM total_stats WHERE user_id = ?",
+            (user_id,)
+        )
+        return dict(rows)
+    
+    def command_summary(self, day: date = None) -> Dict[str, int]:
+        if day is not None:
+            return self.period_summary(PERIOD_DAILY, day.isoformat())
+        return dict(self._query("SELECT command, SUM(count) FROM total_stats GROUP BY command"))
+    
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_stats_storage(stats_dir: str, stats_config: Dict[str, Any]) -> StatsStorage:
+    """根据配置创建统计存储后端
+    
+    Args:
+        stats_dir: 统计数据目录
+        stats_config: 配置中的 stats 部分
+    
+    Returns:
+        StatsStorage: 存储后端实例
+    """
+    backend = stats_config.get('backend', 'json')
+    
+    if backend == 'sqlite':
+        db_file = stats_config.get('sqlite_file') or os.path.join(stats_dir, "stats.db")
+        logger.info(f"统计数据使用SQLite存储: {db_file}")
+        return SQLiteStatsStorage(db_file, stats_dir)
+    
+    if backend != 'json':
+        logger.warning(f"未知的统计存储后端 {backend}，使用JSON文件存储")
+    return JsonStatsStorage(stats_dir)
@@ -2,22 +2,406 @@
 
 import os
 import json
-from datetime import datetime, timedelta
-from typing import Dict, Optional, Any
+import time
+import sqlite3
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Any
 from src.logger import logger
+from src.utils.file_utils import atomic_write_json
 
 
-class UserInfoCache:
-    """用户信息缓存类"""
+class UserRecord:
+    """单个用户的缓存记录"""
     
-    def __init__(self, cache_file: str = "data/cache/user_cache.json"):
+    __slots__ = ('username', 'full_name', 'first_name', 'last_name',
+                 'created_at', 'updated_at', 'refreshed_at', 'interaction_count')
+    
+    # 资料字段，变化时计入落盘阈值
+    PROFILE_FIELDS = ('username', 'full_name', 'first_name', 'last_name')
+    
+    def __init__(self, created_at: float, updated_at: float, interaction_count: int = 0):
+        """初始化记录
+        
+        Args:
+            created_at: 创建时间戳（秒）
+            updated_at: 最后交互时间戳（秒）
+            interaction_count: 交互次数
+        """
+        self.username: Optional[str] = None
+        self.full_name: Optional[str] = None
+        self.first_name: Optional[str] = None
+        self.last_name: Optional[str] = None
+        self.created_at = created_at
+        self.updated_at = updated_at
+        # 资料最后一次从Telegram确认的时间
+        self.refreshed_at = updated_at
+        self.interaction_count = interaction_count
+    
+    @staticmethod
+    def _parse_time(value: Any, default: float) -> float:
+        """解析缓存文件中的ISO时间字符串"""
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except (TypeError, ValueError):
+            return default
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "UserRecord":
+        """从缓存文件中的字典构建记录
+        
+        Args:
+            data: 用户信息字典
+        
+        Returns:
+            UserRecord: 记录
+        """
+        updated_at = cls._parse_time(data.get('updated_at'), 0.0)
+        record = cls(
+            created_at=cls._parse_time(data.get('created_at'), updated_at),
+            updated_at=updated_at,
+            interaction_count=data.get('interaction_count', 0)
+        )
+        record.refreshed_at = cls._parse_time(data.get('refreshed_at'), updated_at)
+        for field in cls.PROFILE_FIELDS:
+            setattr(record, field, data.get(field))
+        return record
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为与缓存文件格式一致的字典
+        
+        Returns:
+            Dict: 用户信息字典，时间为ISO字符串，未设置的资料字段不包含在内
+        """
+        data = {
+            'created_at': datetime.fromtimestamp(self.created_at).isoformat(),
+            'updated_at': datetime.fromtimestamp(self.updated_at).isoformat(),
+            'refreshed_at': datetime.fromtimestamp(self.refreshed_at).isoformat(),
+            'interaction_count': self.interaction_count
+        }
+        for field in self.PROFILE_FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = value
+        return data
+    
+    def apply_profile(self, fields: Dict[str, Optional[str]], now: float, confirm: bool = False) -> bool:
+        """写入资料字段
+        
+        Args:
+            fields: 资料字段，值为None的字段不更新
+            now: 当前时间戳
+            confirm: 没有提供任何字段时是否也标记为已确认
+        
+        Returns:
+            bool: 资料是否有变化
+        """
+        changed = False
+        # 只更新非空的字段
+        for field, value in fields.items():
+            if value is not None and getattr(self, field) != value:
+                setattr(self, field, value)
+                changed = True
+        
+        # 提供了资料即视为已确认
+        if confirm or any(value is not None for value in fields.values()):
+            self.refreshed_at = now
+        return changed
+    
+    def display_name(self, user_id: int) -> str:
+        """获取显示名称，格式为 "昵称 (`用户ID`)" 或 "`用户ID`"
+        
+        Args:
+            user_id: 用户ID
+        
+        Returns:
+            str: 显示名称
+        """
+        simple_name = self.simple_name(user_id)
+        if simple_name == str(user_id):
+            return f"`{user_id}`"
+        return f"{simple_name} (`{user_id}`)"
+    
+    def simple_name(self, user_id: int) -> str:
+        """获取简单显示名称（仅昵称，不包含ID）
+        
+        Args:
+            user_id: 用户ID
+        
+        Returns:
+            str: 昵称，没有昵称时为用户ID字符串
+        """
+        # 优先使用全名，其次使用用户名，最后使用ID
+        if self.full_name:
+            return self.full_name
+        elif self.username:
+            return f"@{self.username}"
+        elif self.first_name:
+            return f"{self.first_name} {self.last_name or ''}".strip()
+        else:
+            return str(user_id)
+
+
+class UserCacheBase(ABC):
+    """用户信息缓存基类
+    
+    修改只更新内存并标记为脏，由定时任务、脏计数阈值或关闭时的 flush 写入存储。
+    仅 interaction_count、updated_at 变化的更新不计入阈值，只随下次落盘一起保存。
+    """
+    
+    # 可通过 user_cache 配置调整的参数及默认值
+    SETTINGS = {
+        'flush_interval': 60,
+        'flush_threshold': 20,
+        'max_entries': 10000,
+        'ttl_days': 90,
+        'refresh_interval': 300,
+        'refresh_after_hours': 24,
+        'refresh_batch': 10,
+    }
+    
+    def __init__(self, flush_interval: int = 60, flush_threshold: int = 20,
+                 max_entries: int = 10000, ttl_days: int = 90):
+        """初始化公共配置
+        
+        Args:
+            flush_interval: 定时落盘间隔（秒）
+            flush_threshold: 累计多少次资料变化后提前落盘
+            max_entries: 最多缓存的用户数
+            ttl_days: 超过多少天未更新的用户被清除，0表示不按时间清除
+        """
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.max_entries = max_entries
+        self.ttl_days = ttl_days
+        
+        # 后台刷新：每隔 refresh_interval 秒刷新一批资料超过 refresh_after_hours 小时未确认的用户
+        self.refresh_interval = self.SETTINGS['refresh_interval']
+        self.refresh_after_hours = self.SETTINGS['refresh_after_hours']
+        self.refresh_batch = self.SETTINGS['refresh_batch']
+        
+        # _version 每次修改加一，落盘时记录版本，写入期间若有新修改则保持脏状态
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._version = 0
+        self._saved_version = 0
+        self._profile_changes = 0
+        self._flush_future: Optional[asyncio.Future] = None
+    
+    def configure(self, config: Dict[str, Any]) -> None:
+        """根据配置调整落盘参数和容量
+        
+        Args:
+            config: 配置字典，读取其中的 user_cache 部分
+        """
+        cache_config = (config or {}).get('user_cache', {}) or {}
+        for name in self.SETTINGS:
+            setattr(self, name, cache_config.get(name, getattr(self, name)))
+        
+        # 容量或有效期变小时立即生效
+        self.expire(limit=None)
+    
+    def _is_expired(self, record: UserRecord, now: float) -> bool:
+        """判断记录是否超过有效期"""
+        return self.ttl_days > 0 and record.updated_at < now - self.ttl_days * 86400
+    
+    @property
+    def dirty(self) -> bool:
+        """是否有尚未落盘的修改"""
+        return self._version != self._saved_version
+    
+    def _mark_dirty(self, profile_changed: bool) -> None:
+        """标记缓存有修改，资料变化累计到阈值时安排后台落盘
+        
+        Args:
+            profile_changed: 是否为新用户或资料字段变化
+        """
+        with self._lock:
+            self._version += 1
+            if not profile_changed:
+                return
+            self._profile_changes += 1
+            reached_threshold = self._profile_changes >= self.flush_threshold
+        
+        if reached_threshold:
+            self._schedule_flush()
+    
+    def _schedule_flush(self) -> None:
+        """安排一次后台落盘，避免在事件循环中执行磁盘IO"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在事件循环中（例如脚本调用），直接同步落盘
+            self.flush()
+            return
+        
+        if self._flush_future is None or self._flush_future.done():
+            self._flush_future = loop.run_in_executor(None, self.flush)
+    
+    def flush(self) -> bool:
+        """将尚未落盘的修改写入存储，没有修改时直接返回，可在线程池中调用
+        
+        Returns:
+            bool: 是否保存成功
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self.dirty:
+                    return True
+                version = self._version
+                # 在锁内生成快照，写入时不阻塞更新
+                snapshot = self._take_snapshot()
+                self._profile_changes = 0
+            
+            try:
+                self._persist(snapshot)
+            except Exception as e:
+                logger.error(f"保存用户缓存失败: {str(e)}")
+                return False
+            
+            with self._lock:
+                self._saved_version = version
+                self._persisted(snapshot)
+            return True
+    
+    @abstractmethod
+    def _take_snapshot(self) -> Any:
+        """在锁内取出需要落盘的数据"""
+        pass
+    
+    @abstractmethod
+    def _persist(self, snapshot: Any) -> None:
+        """写入快照，失败时抛出异常"""
+        pass
+    
+    def _persisted(self, snapshot: Any) -> None:
+        """快照写入成功后调用，调用方持有锁"""
+        pass
+    
+    @abstractmethod
+    def expire(self, limit: Optional[int] = None) -> int:
+        """清除超出容量和有效期的记录
+        
+        Args:
+            limit: 最多清除的过期记录数，None表示全部
+        
+        Returns:
+            int: 清除的记录数
+        """
+        pass
+    
+    @abstractmethod
+    def update_user_info(self, user_id: int, username: str = None, full_name: str = None,
+                        first_name: str = None, last_name: str = None):
+        """用户交互时更新信息，交互次数加一"""
+        pass
+    
+    @abstractmethod
+    def refresh_profile(self, user_id: int, username: str = None, full_name: str = None,
+                        first_name: str = None, last_name: str = None) -> None:
+        """用从API获取的资料刷新用户信息，不计入交互次数"""
+        pass
+    
+    @abstractmethod
+    def stale_user_ids(self, max_age: float, limit: int) -> List[int]:
+        """获取资料最久未确认的用户"""
+        pass
+    
+    @abstractmethod
+    def find_user_id_by_username(self, username: str) -> Optional[int]:
+        """根据用户名查找用户ID
+        
+        Args:
+            username: 用户名，可带 @ 前缀，不区分大小写
+        
+        Returns:
+            Optional[int]: 用户ID，未找到时返回None
+        """
+        pass
+    
+    @abstractmethod
+    def _get_record(self, user_id: int) -> Optional[UserRecord]:
+        """获取未过期的用户记录，不存在或已过期时返回None"""
+        pass
+    
+    @abstractmethod
+    def cleanup_old_entries(self, days: int = 30):
+        """清理多少天前的缓存条目"""
+        pass
+    
+    @abstractmethod
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        pass
+    
+    def get_user_display_name(self, user_id: int) -> str:
+        """获取用户显示名称
+        
+        Args:
+            user_id: 用户ID
+        
+        Returns:
+            str: 用户显示名称
+        """
+        record = self._get_record(user_id)
+        return record.display_name(user_id) if record else f"`{user_id}`"
+    
+    def get_user_simple_name(self, user_id: int) -> str:
+        """获取用户简单显示名称（仅昵称，不包含ID）
+        
+        Args:
+            user_id: 用户ID
+        
+        Returns:
+            str: 用户简单显示名称
+        """
+        record = self._get_record(user_id)
+        return record.simple_name(user_id) if record else str(user_id)
+    
+    def get_user_info(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """获取用户完整缓存信息
+        
+        Args:
+            user_id: 用户ID
+        
+        Returns:
+            Optional[Dict]: 用户信息字典，如果不存在则返回None
+        """
+        record = self._get_record(user_id)
+        return record.to_dict() if record else None
+    
+    def close(self) -> None:
+        """落盘并释放资源"""
+        self.flush()
+
+
+class UserInfoCache(UserCacheBase):
+    """JSON文件用户信息缓存
+    
+    记录保存在按 updated_at 排序的 OrderedDict 中（每次更新移到末尾），
+    超过容量时淘汰最久未更新的用户，超过有效期的用户在每次更新时从头部逐步清除。
+    另有一个按 refreshed_at 排序的索引，供后台刷新任务找出资料最久未确认的用户。
+    启动时一次性加载整个文件，落盘时重写整个文件。
+    """
+    
+    # 每次更新时最多清除的过期记录数，避免单次调用耗时过长
+    EXPIRE_BATCH = 16
+    
+    def __init__(self, cache_file: str = "data/cache/user_cache.json", **kwargs):
         """初始化用户信息缓存
         
         Args:
             cache_file: 缓存文件路径
+            **kwargs: 传给 UserCacheBase 的公共配置
         """
+        super().__init__(**kwargs)
         self.cache_file = cache_file
-        self.cache_data = {}
+        self.cache_data: "OrderedDict[str, UserRecord]" = OrderedDict()
+        self._refresh_order: "OrderedDict[str, None]" = OrderedDict()
+        
         self._ensure_cache_dir()
         self._load_cache()
     
@@ -32,26 +416,68 @@ class UserInfoCache:
         try:
             if os.path.exists(self.cache_file):
                 with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    self.cache_data = json.load(f)
+                    raw_data = json.load(f)
+                records = sorted(
+                    ((user_id, UserRecord.from_dict(data)) for user_id, data in raw_data.items()),
+                    key=lambda item: item[1].updated_at
+                )
+                self.cache_data = OrderedDict(records)
+                self._refresh_order = OrderedDict(
+                    (user_id, None)
+                    for user_id, _ in sorted(records, key=lambda item: item[1].refreshed_at)
+                )
+                self.expire(limit=None)
                 logger.info(f"已加载用户缓存，包含 {len(self.cache_data)} 个用户")
             else:
-                self.cache_data = {}
+                self.cache_data = OrderedDict()
+                self._refresh_order = OrderedDict()
                 logger.info("用户缓存文件不存在，创建新缓存")
         except Exception as e:
             logger.error(f"加载用户缓存失败: {str(e)}")
-            self.cache_data = {}
+            self.cache_data = OrderedDict()
+            self._refresh_order = OrderedDict()
     
-    def _save_cache(self):
-        """保存缓存数据到文件"""
-        try:
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(self.cache_data, f, ensure_ascii=False, indent=2)
-            return True
-        except Exception as e:
-            logger.error(f"保存用户缓存失败: {str(e)}")
-            return False
+    def expire(self, limit: Optional[int] = EXPIRE_BATCH) -> int:
+        """从最久未更新的一端清除超出容量和有效期的记录
+        
+        Args:
+            limit: 最多清除的过期记录数，None表示全部；超出容量的记录总是全部清除
+        
+        Returns:
+            int: 清除的记录数
+        """
+        now = time.time()
+        removed = 0
+        with self._lock:
+            while len(self.cache_data) > self.max_entries:
+                self._pop_oldest()
+                removed += 1
+            
+            while self.cache_data and (limit is None or removed < limit):
+                oldest = next(iter(self.cache_data.values()))
+                if not self._is_expired(oldest, now):
+                    break
+                self._pop_oldest()
+                removed += 1
+            
+            if removed:
+                self._version += 1
+        return removed
+    
+    def _take_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """生成整个缓存文件的内容，调用方需持有锁"""
+        return {user_id: record.to_dict() for user_id, record in self.cache_data.items()}
+    
+    def _persist(self, snapshot: Dict[str, Dict[str, Any]]) -> None:
+        """重写整个缓存文件"""
+        atomic_write_json(self.cache_file, snapshot, indent=None)
+    
+    def _pop_oldest(self) -> None:
+        """移除最久未更新的记录，调用方需持有锁"""
+        user_id, _ = self.cache_data.popitem(last=False)
+        self._refresh_order.pop(user_id, None)
     
-    def update_user_info(self, user_id: int, username: str = None, full_name: str = None, 
+    def update_user_info(self, user_id: int, username: str = None, full_name: str = None,
                         first_name: str = None, last_name: str = None):
         """更新用户信息
         
@@ -63,100 +489,142 @@ class UserInfoCache:
             last_name: 姓氏
         """
         user_id_str = str(user_id)
-        current_time = datetime.now().isoformat()
+        now = time.time()
         
-        # 如果用户不存在，创建新记录
-        if user_id_str not in self.cache_data:
-            self.cache_data[user_id_str] = {
-                'created_at': current_time,
-                'updated_at': current_time,
-                'interaction_count': 0
-            }
-        
-        # 更新用户信息
-        user_data = self.cache_data[user_id_str]
-        user_data['updated_at'] = current_time
-        user_data['interaction_count'] = user_data.get('interaction_count', 0) + 1
+        with self._lock:
+            # 如果用户不存在（或已过期），创建新记录
+            record = self.cache_data.get(user_id_str)
+            profile_changed = record is None or self._is_expired(record, now)
+            if profile_changed:
+                record = UserRecord(created_at=now, updated_at=now)
+                self.cache_data[user_id_str] = record
+            
+            # 更新用户信息，并移到最近更新的一端
+            record.updated_at = now
+            record.interaction_count += 1
+            self.cache_data.move_to_end(user_id_str)
+            
+            fields = {'username': username, 'full_name': full_name, 'first_name': first_name, 'last_name': last_name}
+            profile_changed = self._apply_profile(user_id_str, record, fields, now) or profile_changed
         
-        # 只更新非空的字段
-        if username is not None:
-            user_data['username'] = username
-        if full_name is not None:
-            user_data['full_name'] = full_name
-        if first_name is not None:
-            user_data['first_name'] = first_name
-        if last_name is not None:
-            user_data['last_name'] = last_name
-        
-        self._save_cache()
+        self._mark_dirty(profile_changed)
+        self.expire()
         logger.debug(f"已更新用户 {user_id} 的缓存信息")
     
-    def get_user_display_name(self, user_id: int) -> str:
-        """获取用户显示名称
+    def _apply_profile(self, user_id_str: str, record: UserRecord, fields: Dict[str, Optional[str]],
+                       now: float, confirm: bool = False) -> bool:
+        """写入资料字段，调用方需持有锁
         
         Args:
-            user_id: 用户ID
-            
+            user_id_str: 用户ID
+            record: 用户记录
+            fields: 资料字段，值为None的字段不更新
+            now: 当前时间戳
+            confirm: 没有提供任何字段时是否也标记为已确认
+        
         Returns:
-            str: 用户显示名称
+            bool: 资料是否有变化
         """
-        user_id_str = str(user_id)
+        refreshed_at = record.refreshed_at
+        changed = record.apply_profile(fields, now, confirm)
         
-        if user_id_str not in self.cache_data:
-            return f"`{user_id}`"
-        
-        user_data = self.cache_data[user_id_str]
-        
-        # 优先使用全名，其次使用用户名，最后使用ID
-        if user_data.get('full_name'):
-            return f"{user_data['full_name']} (`{user_id}`)"
-        elif user_data.get('username'):
-            return f"@{user_data['username']} (`{user_id}`)"
-        elif user_data.get('first_name'):
-            last_name = user_data.get('last_name', '')
-            full_name = f"{user_data['first_name']} {last_name}".strip()
-            return f"{full_name} (`{user_id}`)"
-        else:
-            return f"`{user_id}`"
+        # 已确认的记录移到刷新索引末尾
+        if record.refreshed_at != refreshed_at or user_id_str not in self._refresh_order:
+            self._refresh_order[user_id_str] = None
+            self._refresh_order.move_to_end(user_id_str)
+        return changed
     
-    def get_user_simple_name(self, user_id: int) -> str:
-        """获取用户简单显示名称（仅昵称，不包含ID）
+    def refresh_profile(self, user_id: int, username: str = None, full_name: str = None,
+                        first_name: str = None, last_name: str = None) -> None:
+        """用从API获取的资料刷新用户信息，不计入交互次数，也不改变 updated_at
+        
+        所有字段都为None时只标记为已确认，避免反复刷新无法获取资料的用户。
         
         Args:
             user_id: 用户ID
+            username: 用户名
+            full_name: 全名
+            first_name: 名字
+            last_name: 姓氏
+        """
+        user_id_str = str(user_id)
+        now = time.time()
+        
+        with self._lock:
+            record = self.cache_data.get(user_id_str)
+            profile_changed = record is None
+            if record is None:
+                record = UserRecord(created_at=now, updated_at=now)
+                self.cache_data[user_id_str] = record
             
+            fields = {'username': username, 'full_name': full_name, 'first_name': first_name, 'last_name': last_name}
+            profile_changed = self._apply_profile(user_id_str, record, fields, now, confirm=True) or profile_changed
+        
+        self._mark_dirty(profile_changed)
+        if profile_changed:
+            self.expire()
+    
+    def stale_user_ids(self, max_age: float, limit: int) -> List[int]:
+        """获取资料最久未确认的用户
+        
+        Args:
+            max_age: 资料确认后多少秒视为过时
+            limit: 最多返回的用户数
+        
         Returns:
-            str: 用户简单显示名称
+            List[int]: 用户ID列表，按确认时间从早到晚排列
         """
-        user_id_str = str(user_id)
+        cutoff = time.time() - max_age
+        stale = []
+        with self._lock:
+            for user_id_str in self._refresh_order:
+                if len(stale) >= limit or self.cache_data[user_id_str].refreshed_at > cutoff:
+                    break
+                try:
+                    stale.append(int(user_id_str))
+                except ValueError:
+                    continue
+        return stale
+    
+    def find_user_id_by_username(self, username: str) -> Optional[int]:
+        """根据用户名查找用户ID，从最近更新的用户开始逐个比较
         
-        if user_id_str not in self.cache_data:
-            return str(user_id)
+        Args:
+            username: 用户名，可带 @ 前缀，不区分大小写
         
-        user_data = self.cache_data[user_id_str]
+        Returns:
+            Optional[int]: 用户ID，未找到时返回None
+        """
+        target = username.lstrip('@').lower()
+        if not target:
+            return None
         
-        # 优先使用全名，其次使用用户名，最后使用ID
-        if user_data.get('full_name'):
-            return user_data['full_name']
-        elif user_data.get('username'):
-            return f"@{user_data['username']}"
-        elif user_data.get('first_name'):
-            last_name = user_data.get('last_name', '')
-            return f"{user_data['first_name']} {last_name}".strip()
-        else:
-            return str(user_id)
+        now = time.time()
+        with self._lock:
+            for user_id_str, record in reversed(self.cache_data.items()):
+                if self._is_expired(record, now):
+                    break
+                if record.username and record.username.lower() == target:
+                    try:
+                        return int(user_id_str)
+                    except ValueError:
+                        continue
+        return None
     
-    def get_user_info(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """获取用户完整缓存信息
+    def _get_record(self, user_id: int) -> Optional[UserRecord]:
+        """获取未过期的用户记录
         
         Args:
             user_id: 用户ID
-            
+        
         Returns:
-            Optional[Dict]: 用户信息字典，如果不存在则返回None
+            Optional[UserRecord]: 记录，不存在或已过期时返回None
         """
-        user_id_str = str(user_id)
-        return self.cache_data.get(user_id_str)
+        with self._lock:
+            record = self.cache_data.get(str(user_id))
+        if record is None or self._is_expired(record, time.time()):
+            return None
+        return record
     
     def cleanup_old_entries(self, days: int = 30):
         """清理旧的缓存条目
@@ -164,19 +632,19 @@ class UserInfoCache:
         Args:
             days: 删除多少天前的条目
         """
-        cutoff_date = datetime.now() - timedelta(days=days)
-        cutoff_str = cutoff_date.isoformat()
+        cutoff = time.time() - days * 86400
         
-        old_count = len(self.cache_data)
-        self.cache_data = {
-            user_id: data for user_id, data in self.cache_data.items()
-            if data.get('updated_at', '') > cutoff_str
-        }
-        new_count = len(self.cache_data)
+        removed = 0
+        with self._lock:
+            while self.cache_data and next(iter(self.cache_data.values())).updated_at <= cutoff:
+                self._pop_oldest()
+                removed += 1
+            if removed:
+                self._version += 1
         
-        if old_count != new_count:
-            self._save_cache()
-            logger.info(f"清理了 {old_count - new_count} 个旧的用户缓存条目")
+        if removed:
+            self.flush()
+            logger.info(f"清理了 {removed} 个旧的用户缓存条目")
     
     def get_cache_stats(self) -> Dict[str, Any]:
         """获取缓存统计信息
@@ -186,10 +654,542 @@ class UserInfoCache:
         """
         return {
             'total_users': len(self.cache_data),
+            'max_entries': self.max_entries,
             'cache_file': self.cache_file,
             'cache_size_kb': round(os.path.getsize(self.cache_file) / 1024, 2) if os.path.exists(self.cache_file) else 0
         }
 
 
+
+class SQLiteUserInfoCache(UserCacheBase):
+    """SQLite用户信息缓存
+    
+    记录保存在以用户ID为主键的表中，username（不区分大小写）、updated_at、refreshed_at 建有索引，
+    按用户名反查、过期清除和查找待刷新用户都不需要遍历全部记录，也不需要启动时整体加载。
+    修改先写入内存中的待写入记录（读取时优先使用），由 flush 批量写入数据库。
+    最近读写过的记录保存在有限大小的内存LRU中，活跃用户的交互更新不需要查询数据库。
+    """
+    
+    # 内存中保留的最近使用记录数
+    RECENT_SIZE = 1024
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT COLLATE NOCASE,
+            full_name TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            refreshed_at REAL NOT NULL,
+            interaction_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_users_username ON users (username);
+        CREATE INDEX IF NOT EXISTS idx_users_updated_at ON users (updated_at);
+        CREATE INDEX IF NOT EXISTS idx_users_refreshed_at ON users (refreshed_at);
+    """
+    
+    COLUMNS = ('user_id',) + UserRecord.PROFILE_FIELDS + ('created_at', 'updated_at', 'refreshed_at', 'interaction_count')
+    
+    def __init__(self, db_file: str = "data/cache/user_cache.db", json_file: str = None, **kwargs):
+        """初始化SQLite用户缓存
+        
+        Args:
+            db_file: 数据库文件路径
+            json_file: 旧JSON缓存文件，数据库为空时从中导入
+            **kwargs: 传给 UserCacheBase 的公共配置
+        """
+        super().__init__(**kwargs)
+        self.db_file = db_file
+        db_dir = os.path.dirname(db_file)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        
+        # 尚未写入数据库的记录，键为用户ID
+        self._pending: Dict[int, UserRecord] = {}
+        # 最近使用且已与数据库一致的记录，按最近使用顺序排列
+        self._recent: "OrderedDict[int, UserRecord]" = OrderedDict()
+        
+        # 落盘在线程池中执行，查询在事件循环中执行，连接需跨线程共享并加锁
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._conn.commit()
+        
+        if json_file:
+            self._import_json(json_file)
+    
+    def _import_json(self, json_file: str) -> None:
+        """数据库为空时从旧JSON缓存文件导入
+        
+        Args:
+            json_file: JSON缓存文件路径
+        """
+        if not os.path.exists(json_file):
+            return
+        with self._db_lock:
+            if self._conn.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+                return
+        
+        try:
+            with open(json_file, 'r', encoding='utf-8') as f:
+                raw_data = json.load(f)
+            rows = []
+            for user_id_str, data in raw_data.items():
+                try:
+                    rows.append(self._to_row(int(user_id_str), UserRecord.from_dict(data)))
+                except ValueError:
+                    continue
+            self._write_rows(rows)
+            logger.info(f"已从 {json_file} 导入 {len(rows)} 个用户到用户缓存数据库")
+        except Exception as e:
+            logger.error(f"从JSON导入用户缓存失败: {str(e)}")
+    
+    @staticmethod
+    def _to_row(user_id: int, record: UserRecord) -> tuple:
+        """记录转换为数据库行"""
+        return (user_id, record.username, record.full_name, record.first_name, record.last_name,
+                record.created_at, record.updated_at, record.refreshed_at, record.interaction_count)
+    
+    @staticmethod
+    def _from_row(row: tuple) -> UserRecord:
+        """数据库行转换为记录"""
+        record = UserRecord(created_at=row[5], updated_at=row[6], interaction_count=row[8])
+        record.username, record.full_name, record.first_name, record.last_name = row[1:5]
+        record.refreshed_at = row[7]
+        return record
+    
+    def _write_rows(self, rows: List[tuple]) -> None:
+        """批量写入数据库行"""
+        placeholders = ", ".join("?" for _ in self.COLUMNS)
+        with self._db_lock:
+            with self._conn:
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO users ({', '.join(self.COLUMNS)}) VALUES ({placeholders})",
+                    rows
+                )
+    
+    def _load_record(self, user_id: int) -> Optional[UserRecord]:
+        """获取记录，依次查找待写入的记录、最近使用的记录和数据库，调用方需持有锁
+        
+        Args:
+            user_id: 用户ID
+        
+        Returns:
+            Optional[UserRecord]: 记录，不存在时返回None
+        """
+        record = self._pending.get(user_id)
+        if record is not None:
+            return record
+        record = self._recent.get(user_id)
+        if record is not None:
+            self._recent.move_to_end(user_id)
+            return record
+        
+        with self._db_lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM users WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        record = self._from_row(row)
+        self._remember(user_id, record)
+        return record
+    
+    def _remember(self, user_id: int, record: UserRecord) -> None:
+        """将与数据库一致的记录放入最近使用的记录，超出 RECENT_SIZE 时丢弃最久未使用的，调用方需持有锁"""
+        self._recent[user_id] = record
+        self._recent.move_to_end(user_id)
+        if len(self._recent) > self.RECENT_SIZE:
+            self._recent.popitem(last=False)
+    
+    def _take_snapshot(self) -> Dict[int, tuple]:
+        """生成待写入记录的数据库行，调用方需持有锁"""
+        return {user_id: self._to_row(user_id, record) for user_id, record in self._pending.items()}
+    
+    def _persist(self, snapshot: Dict[int, tuple]) -> None:
+        """写入待写入记录并清除超出容量和有效期的记录"""
+        if snapshot:
+            self._write_rows(list(snapshot.values()))
+        self._delete_expired()
+    
+    def _persisted(self, snapshot: Dict[int, tuple]) -> None:
+        """移除已写入且之后没有再修改的待写入记录，转入最近使用的记录"""
+        for user_id, row in snapshot.items():
+            record = self._pending.get(user_id)
+            if record is not None and self._to_row(user_id, record) == row:
+                del self._pending[user_id]
+                self._remember(user_id, record)
+    
+    def _delete_expired(self) -> int:
+        """删除超出容量和有效期的记录
+        
+        Returns:
+            int: 删除的记录数
+        """
+        # {用户ID: 被删除记录的更新时间}
+        deleted: Dict[int, float] = {}
+        with self._db_lock:
+            with self._conn:
+                if self.ttl_days > 0:
+                    cutoff = time.time() - self.ttl_days * 86400
+                    deleted.update(self._conn.execute(
+                        "SELECT user_id, updated_at FROM users WHERE updated_at < ?", (cutoff,)
+                    ).fetchall())
+                
+                # 过期的记录也是最旧的，按更新时间取最旧的记录即包含它们
+                total = self._conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+                if total - len(deleted) > self.max_entries:
+                    deleted.update(self._conn.execute(
+                        "SELECT user_id, updated_at FROM users ORDER BY updated_at LIMIT ?",
+                        (total - self.max_entries,)
+                    ).fetchall())
+                
+                self._conn.executemany("DELETE FROM users WHERE user_id = ?", [(user_id,) for user_id in deleted])
+        
+        if deleted:
+            self._forget(deleted)
+        return len(deleted)
+    
+    def _forget(self, deleted: Dict[int, float]) -> None:
+        """从内存中移除已从数据库删除的记录
+        
+        删除后没有再修改的待写入记录一并移除，避免之后仍从内存中读到或被重新写入数据库。
+        
+        Args:
+            deleted: {用户ID: 被删除记录的更新时间}
+        """
+        with self._lock:
+            for user_id, updated_at in deleted.items():
+                self._recent.pop(user_id, None)
+                record = self._pending.get(user_id)
+                if record is not None and record.updated_at <= updated_at:
+                    del self._pending[user_id]
+    
+    def expire(self, limit: Optional[int] = None) -> int:
+        """清除超出容量和有效期的记录，删除走索引，不需要分批
+        
+        Args:
+            limit: 为与JSON缓存保持一致而保留，不使用
+        
+        Returns:
+            int: 清除的记录数
+        """
+        return self._delete_expired()
+    
+    def update_user_info(self, user_id: int, username: str = None, full_name: str = None,
+                        first_name: str = None, last_name: str = None):
+        """更新用户信息
+        
+        Args:
+            user_id: 用户ID
+            username: 用户名
+            full_name: 全名
+            first_name: 名字
+            last_name: 姓氏
+        """
+        user_id = int(user_id)
+        now = time.time()
+        
+        with self._lock:
+            record = self._load_record(user_id)
+            profile_changed = record is None or self._is_expired(record, now)
+            if profile_changed:
+                record = UserRecord(created_at=now, updated_at=now)
+            self._pending[user_id] = record
+            
+            record.updated_at = now
+            record.interaction_count += 1
+            
+            fields = {'username': username, 'full_name': full_name, 'first_name': first_name, 'last_name': last_name}
+            profile_changed = record.apply_profile(fields, now) or profile_changed
+        
+        self._mark_dirty(profile_changed)
+        logger.debug(f"已更新用户 {user_id} 的缓存信息")
+    
+    def refresh_profile(self, user_id: int, username: str = None, full_name: str = None,
+                        first_name: str = None, last_name: str = None) -> None:
+        """用从API获取的资料刷新用户信息，不计入交互次数，也不改变 updated_at
+        
+        所有字段都为None时只标记为已确认，避免反复刷新无法获取资料的用户。
+        
+        Args:
+            user_id: 用户ID
+            username: 用户名
+            full_name: 全名
+            first_name: 名字
+            last_name: 姓氏
+        """
+        user_id = int(user_id)
+        now = time.time()
+        
+        with self._lock:
+            record = self._load_record(user_id)
+            profile_changed = record is None
+            if record is None:
+                record = UserRecord(created_at=now, updated_at=now)
+            self._pending[user_id] = record
+            
+            fields = {'username': username, 'full_name': full_name, 'first_name': first_name, 'last_name': last_name}
+            profile_changed = record.apply_profile(fields, now, confirm=True) or profile_changed
+        
+        self._mark_dirty(profile_changed)
+    
+    def stale_user_ids(self, max_age: float, limit: int) -> List[int]:
+        """获取资料最久未确认的用户
+        
+        Args:
+            max_age: 资料确认后多少秒视为过时
+            limit: 最多返回的用户数
+        
+        Returns:
+            List[int]: 用户ID列表，按确认时间从早到晚排列
+        """
+        cutoff = time.time() - max_age
+        with self._lock:
+            pending = {user_id: record.refreshed_at for user_id, record in self._pending.items()}
+            with self._db_lock:
+                # 多取待写入记录数量的行，弥补其中已在内存中重新确认的用户
+                rows = self._conn.execute(
+                    "SELECT user_id, refreshed_at FROM users WHERE refreshed_at <= ? "
+                    "ORDER BY refreshed_at LIMIT ?",
+                    (cutoff, limit + len(pending))
+                ).fetchall()
+        
+        candidates = {user_id: refreshed_at for user_id, refreshed_at in rows if user_id not in pending}
+        candidates.update(
+            (user_id, refreshed_at) for user_id, refreshed_at in pending.items() if refreshed_at <= cutoff
+        )
+        return sorted(candidates, key=candidates.get)[:limit]
+    
+    def find_user_id_by_username(self, username: str) -> Optional[int]:
+        """根据用户名查找用户ID，通过用户名索引查询
+        
+        Args:
+            username: 用户名，可带 @ 前缀，不区分大小写
+        
+        Returns:
+            Optional[int]: 用户ID，未找到时返回None
+        """
+        target = username.lstrip('@').lower()
+        if not target:
+            return None
+        
+        now = time.time()
+        with self._lock:
+            matches = [
+                (record.updated_at, user_id) for user_id, record in self._pending.items()
+                if record.username and record.username.lower() == target
+            ]
+            with self._db_lock:
+                rows = self._conn.execute(
+                    "SELECT user_id, updated_at FROM users WHERE username = ?", (target,)
+                ).fetchall()
+            # 待写入记录中用户名已改变的用户以内存为准
+            matches.extend((updated_at, user_id) for user_id, updated_at in rows if user_id not in self._pending)
+        
+        for updated_at, user_id in sorted(matches, reverse=True):
+            if self.ttl_days <= 0 or updated_at >= now - self.ttl_days * 86400:
+                return user_id
+        return None
+    
+    def _get_record(self, user_id: int) -> Optional[UserRecord]:
+        """获取未过期的用户记录
+        
+        Args:
+            user_id: 用户ID
+        
+        Returns:
+            Optional[UserRecord]: 记录，不存在或已过期时返回None
+        """
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            record = self._load_record(user_id)
+        if record is None or self._is_expired(record, time.time()):
+            return None
+        return record
+    
+    def cleanup_old_entries(self, days: int = 30):
+        """清理旧的缓存条目
+        
+        Args:
+            days: 删除多少天前的条目
+        """
+        self.flush()
+        cutoff = time.time() - days * 86400
+        with self._db_lock:
+            with self._conn:
+                removed = self._conn.execute("DELETE FROM users WHERE updated_at <= ?", (cutoff,)).rowcount
+        with self._lock:
+            for user_id in [user_id for user_id, record in self._recent.items() if record.updated_at <= cutoff]:
+                del self._recent[user_id]
+        
+        if removed:
+            logger.info(f"清理了 {removed} 个旧的用户缓存条目")
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息
+        
+        Returns:
+            Dict: 缓存统计信息
+        """
+        with self._db_lock:
+            total = self._conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        return {
+            'total_users': total,
+            'pending_users': len(self._pending),
+            'max_entries': self.max_entries,
+            'cache_file': self.db_file,
+            'cache_size_kb': round(os.path.getsize(self.db_file) / 1024, 2) if os.path.exists(self.db_file) else 0
+        }
+    
+    def close(self) -> None:
+        """落盘并关闭数据库连接"""
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+
+
+class UserCacheProxy:
+    """全局用户缓存入口
+    
+    根据配置 user_cache.backend 选择 JSON 或 SQLite 缓存，其余属性和方法转发给当前实现，
+    使用方始终通过同一个 user_cache 对象访问，切换实现后不需要重新导入。
+    
+    缓存实现在第一次使用时才创建（JSON缓存此时加载整个文件），导入模块不读取磁盘；
+    启动后可调用 preload 在后台线程中提前加载。加载前读取配置参数不会触发加载。
+    """
+    
+    BACKENDS = ("json", "sqlite")
+    
+    def __init__(self):
+        """初始化，缓存实现延迟创建"""
+        self._config: Dict[str, Any] = {}
+        self._backend: Optional[UserCacheBase] = None
+        self._backend_name: Optional[str] = None
+        self._init_lock = threading.Lock()
+    
+    def _cache_config(self) -> Dict[str, Any]:
+        """获取 user_cache 配置部分"""
+        return (self._config or {}).get('user_cache', {}) or {}
+    
+    def _selected_backend(self) -> str:
+        """配置中选择的缓存类型"""
+        backend = str(self._cache_config().get('backend', 'json')).lower()
+        if backend not in self.BACKENDS:
+            logger.warning(f"未知的用户缓存类型 {backend}，使用 json")
+            backend = "json"
+        return backend
+    
+    def _create_backend(self, backend: str, json_file: str) -> UserCacheBase:
+        """创建缓存实现并应用配置
+        
+        Args:
+            backend: 缓存类型
+            json_file: JSON缓存文件，SQLite 缓存为空时从中导入
+        
+        Returns:
+            UserCacheBase: 缓存实现
+        """
+        if backend == "sqlite":
+            cache = SQLiteUserInfoCache(
+                self._cache_config().get('sqlite_file', 'data/cache/user_cache.db'),
+                json_file=json_file
+            )
+        else:
+            cache = UserInfoCache(json_file)
+        cache.configure(self._config)
+        logger.info(f"用户缓存使用 {backend} 存储")
+        return cache
+    
+    @property
+    def backend(self) -> UserCacheBase:
+        """当前缓存实现，第一次访问时创建，多个线程同时访问时只创建一次"""
+        backend = self._backend
+        if backend is not None:
+            return backend
+        
+        with self._init_lock:
+            if self._backend is None:
+                name = self._selected_backend()
+                self._backend = self._create_backend(name, "data/cache/user_cache.json")
+                self._backend_name = name
+            return self._backend
+    
+    @property
+    def loaded(self) -> bool:
+        """缓存实现是否已创建"""
+        return self._backend is not None
+    
+    def configure(self, config: Dict[str, Any]) -> None:
+        """保存配置；缓存已加载时立即应用，配置切换了缓存类型时迁移到新实现
+        
+        Args:
+            config: 配置字典，读取其中的 user_cache 部分
+        """
+        with self._init_lock:
+            self._config = config or {}
+            old_backend = self._backend
+            if old_backend is None:
+                return
+            
+            name = self._selected_backend()
+            if name == self._backend_name:
+                old_backend.configure(self._config)
+                return
+            
+            # 先落盘旧实现，SQLite 缓存为空时会从 JSON 文件导入
+            old_backend.flush()
+            self._backend = self._create_backend(
+                name, getattr(old_backend, 'cache_file', "data/cache/user_cache.json")
+            )
+            self._backend_name = name
+            old_backend.close()
+    
+    def preload(self) -> None:
+        """在后台线程中创建缓存实现，避免第一次使用时在事件循环中加载"""
+        if self._backend is not None:
+            return
+        threading.Thread(target=self._preload, name="user-cache-preload", daemon=True).start()
+    
+    def _preload(self) -> None:
+        """后台加载线程"""
+        try:
+            self.backend
+        except Exception as e:
+            logger.error(f"预加载用户缓存失败: {str(e)}")
+    
+    @property
+    def dirty(self) -> bool:
+        """是否有尚未落盘的修改，未加载时为False"""
+        return self._backend is not None and self._backend.dirty
+    
+    def flush(self) -> bool:
+        """落盘，未加载时没有需要保存的数据"""
+        if self._backend is None:
+            return True
+        return self._backend.flush()
+    
+    def close(self) -> None:
+        """落盘并释放资源，未加载时不做任何事"""
+        if self._backend is not None:
+            self._backend.close()
+    
+    def __getattr__(self, name: str) -> Any:
+        # 初始化完成前（如复制对象时）不转发，避免递归
+        if '_init_lock' not in self.__dict__:
+            raise AttributeError(name)
+        # 加载前读取配置参数直接使用配置值，不触发加载
+        if name in UserCacheBase.SETTINGS and self._backend is None:
+            return self._cache_config().get(name, UserCacheBase.SETTINGS[name])
+        return getattr(self.backend, name)
+
+
 # 全局用户缓存实例
-user_cache = UserInfoCache() 
\ No newline at end of file
+user_cache = UserCacheProxy() 
\ No newline at end of file
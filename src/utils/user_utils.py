@@ -1,6 +1,9 @@
 """用户工具类"""
 
-from typing import Optional
+import re
+import time
+import asyncio
+from typing import Any, Dict, Iterable, Optional
 from telegram.ext import ContextTypes
 from src.logger import logger
 from .user_cache import user_cache
@@ -9,6 +12,173 @@ from .user_cache import user_cache
 class UserUtils:
     """用户相关工具类"""
     
+    # 获取失败的用户在这段时间内不再请求API（秒）
+    NEGATIVE_CACHE_TTL = 600
+    # 负缓存最多记录的用户数，超出时先清理已过期的记录
+    NEGATIVE_CACHE_SIZE = 1000
+    
+    # 后台刷新资料时两次请求之间的间隔（秒）
+    REFRESH_DELAY = 1.0
+    
+    # 批量获取昵称时同时进行的 get_chat 请求上限，避免触发API限流
+    BATCH_CONCURRENCY = 8
+    _batch_semaphore: Optional[asyncio.Semaphore] = None
+    
+    # 正在进行的 get_chat 请求，同一用户的并发查询共享同一个结果
+    _inflight: Dict[int, asyncio.Future] = {}
+    # 获取失败的用户ID -> 过期时间戳
+    _failures: Dict[int, float] = {}
+    
+    @staticmethod
+    def _to_user_id(user_id: Any) -> Optional[int]:
+        """将用户ID转换为整数，无法转换时返回None"""
+        if isinstance(user_id, int):
+            return user_id
+        try:
+            return int(user_id)
+        except (TypeError, ValueError):
+            return None
+    
+    @staticmethod
+    def _has_profile(user_info: Optional[dict]) -> bool:
+        """缓存信息中是否包含可用于显示的昵称"""
+        return bool(user_info) and any(
+            user_info.get(field) for field in ('full_name', 'username', 'first_name')
+        )
+    
+    @classmethod
+    def _remember_failure(cls, user_id: int) -> None:
+        """记录获取失败的用户
+        
+        Args:
+            user_id: 用户ID
+        """
+        now = time.monotonic()
+        if len(cls._failures) >= cls.NEGATIVE_CACHE_SIZE:
+            cls._failures = {uid: expires for uid, expires in cls._failures.items() if expires > now}
+            if len(cls._failures) >= cls.NEGATIVE_CACHE_SIZE:
+                cls._failures.pop(next(iter(cls._failures)))
+        cls._failures[user_id] = now + cls.NEGATIVE_CACHE_TTL
+    
+    @classmethod
+    def _recently_failed(cls, user_id: int) -> bool:
+        """用户是否在负缓存有效期内"""
+        expires = cls._failures.get(user_id)
+        if expires is None:
+            return False
+        if expires <= time.monotonic():
+            cls._failures.pop(user_id, None)
+            return False
+        return True
+    
+    @classmethod
+    async def _fetch_profile(cls, user_id: int, context: ContextTypes.DEFAULT_TYPE) -> Optional[dict]:
+        """通过API获取用户信息并更新缓存
+        
+        Args:
+            user_id: 用户ID
+            context: Telegram上下文对象
+        
+        Returns:
+            Optional[dict]: 用户信息字典，获取失败时返回None
+        """
+        try:
+            chat = await context.bot.get_chat(user_id)
+        except Exception as e:
+            logger.debug(f"无法通过API获取用户 {user_id} 信息: {str(e)}")
+            cls._remember_failure(user_id)
+            return None
+        
+        # 更新缓存（查询他人资料不计入该用户的交互次数）
+        user_cache.refresh_profile(
+            user_id=user_id,
+            username=chat.username,
+            full_name=chat.full_name,
+            first_name=chat.first_name,
+            last_name=chat.last_name
+        )
+        
+        return {
+            'id': chat.id,
+            'username': chat.username,
+            'full_name': chat.full_name,
+            'first_name': chat.first_name,
+            'last_name': chat.last_name,
+            'type': chat.type
+        }
+    
+    @classmethod
+    async def _resolve_profile(cls, user_id: int, context: ContextTypes.DEFAULT_TYPE = None) -> Optional[dict]:
+        """获取用户信息：优先读取缓存，缺少昵称时请求API
+        
+        同一用户的并发请求只会调用一次 get_chat，获取失败的用户在
+        NEGATIVE_CACHE_TTL 秒内直接返回缓存内容，不再重复请求。
+        
+        Args:
+            user_id: 用户ID
+            context: Telegram上下文对象（可选），未提供时只读取缓存
+        
+        Returns:
+            Optional[dict]: 用户信息字典，没有任何信息时返回None
+        """
+        cached_info = user_cache.get_user_info(user_id)
+        if cls._has_profile(cached_info) or not context or cls._recently_failed(user_id):
+            return cached_info
+        
+        return await cls._fetch_shared(user_id, context) or cached_info
+    
+    @classmethod
+    async def _fetch_shared(cls, user_id: int, context: ContextTypes.DEFAULT_TYPE) -> Optional[dict]:
+        """请求API获取用户信息，同一用户已有请求进行中时等待其结果
+        
+        Args:
+            user_id: 用户ID
+            context: Telegram上下文对象
+        
+        Returns:
+            Optional[dict]: 用户信息字典，获取失败时返回None
+        """
+        future = cls._inflight.get(user_id)
+        if future is None:
+            future = asyncio.ensure_future(cls._fetch_profile(user_id, context))
+            cls._inflight[user_id] = future
+            future.add_done_callback(lambda _: cls._inflight.pop(user_id, None))
+        
+        # shield 避免某个等待方被取消时影响其它等待方
+        return await asyncio.shield(future)
+    
+    @classmethod
+    async def refresh_stale_profiles(cls, context: ContextTypes.DEFAULT_TYPE) -> int:
+        """后台刷新资料最久未确认的一批用户，由定时任务调用
+        
+        每次最多刷新 user_cache.refresh_batch 个用户，请求之间间隔 REFRESH_DELAY 秒；
+        有用户触发的查询正在进行时跳过本轮，把API额度留给前台请求。
+        
+        Args:
+            context: Telegram上下文对象
+        
+        Returns:
+            int: 成功刷新的用户数
+        """
+        if cls._inflight:
+            return 0
+        
+        refreshed = 0
+        stale_ids = user_cache.stale_user_ids(user_cache.refresh_after_hours * 3600, user_cache.refresh_batch)
+        for index, user_id in enumerate(stale_ids):
+            if index:
+                await asyncio.sleep(cls.REFRESH_DELAY)
+            
+            if await cls._fetch_shared(user_id, context):
+                refreshed += 1
+            else:
+                # 获取失败也标记为已确认，避免每轮都重试同一批用户
+                user_cache.refresh_profile(user_id)
+        
+        if refreshed:
+            logger.debug(f"后台刷新了 {refreshed} 个用户的资料")
+        return refreshed
+    
     @staticmethod
     async def get_user_display_name(user_id: any, context: ContextTypes.DEFAULT_TYPE = None) -> str:
         """获取用户显示名称（昵称或ID）
@@ -20,43 +190,55 @@ class UserUtils:
         Returns:
             str: 用户显示名称，格式为 "昵称 (`用户ID`)" 或 "`用户ID`"
         """
-        if not isinstance(user_id, int):
-            try:
-                user_id = int(user_id)
-            except ValueError:
-                return f"`{user_id}`"
-        
-        # 优先从缓存获取
-        cached_name = user_cache.get_user_display_name(user_id)
-        if cached_name != f"`{user_id}`":  # 如果缓存中有昵称信息
-            return cached_name
-        
-        # 如果缓存中没有且提供了context，尝试从API获取
-        if context:
-            try:
-                chat = await context.bot.get_chat(user_id)
-                
-                # 更新缓存
-                user_cache.update_user_info(
-                    user_id=user_id,
-                    username=chat.username,
-                    full_name=chat.full_name,
-                    first_name=chat.first_name,
-                    last_name=chat.last_name
-                )
-                
-                # 优先使用全名，其次使用用户名，最后使用ID
-                if chat.full_name:
-                    return f"{chat.full_name} (`{user_id}`)"
-                elif chat.username:
-                    return f"@{chat.username} (`{user_id}`)"
-                else:
-                    return f"`{user_id}`"
-            except Exception as e:
-                logger.debug(f"无法通过API获取用户 {user_id} 信息: {str(e)}")
-        
-        # 如果都失败了，返回用户ID
-        return f"`{user_id}`"
+        numeric_id = UserUtils._to_user_id(user_id)
+        if numeric_id is None:
+            return f"`{user_id}`"
+        
+        await UserUtils._resolve_profile(numeric_id, context)
+        return user_cache.get_user_display_name(numeric_id)
+    
+    @classmethod
+    async def get_user_display_names(cls, user_ids: Iterable[Any], context: ContextTypes.DEFAULT_TYPE = None) -> Dict[str, str]:
+        """批量获取用户显示名称
+        
+        缓存命中的用户直接返回，其余用户并发请求API，
+        同时进行的请求数不超过 BATCH_CONCURRENCY。
+        
+        Args:
+            user_ids: 用户ID列表
+            context: Telegram上下文对象（可选）
+        
+        Returns:
+            Dict[str, str]: {字符串用户ID: 显示名称}，格式同 get_user_display_name
+        """
+        names: Dict[str, str] = {}
+        misses = []
+        for user_id in user_ids:
+            key = str(user_id)
+            if key in names:
+                continue
+            numeric_id = cls._to_user_id(user_id)
+            if numeric_id is None:
+                names[key] = f"`{user_id}`"
+            elif not context or cls._has_profile(user_cache.get_user_info(numeric_id)):
+                names[key] = user_cache.get_user_display_name(numeric_id)
+            else:
+                names[key] = f"`{numeric_id}`"
+                misses.append((key, numeric_id))
+        
+        if not misses:
+            return names
+        
+        if cls._batch_semaphore is None:
+            cls._batch_semaphore = asyncio.Semaphore(cls.BATCH_CONCURRENCY)
+        
+        async def resolve(key: str, numeric_id: int) -> None:
+            async with cls._batch_semaphore:
+                await cls._resolve_profile(numeric_id, context)
+            names[key] = user_cache.get_user_display_name(numeric_id)
+        
+        await asyncio.gather(*(resolve(key, numeric_id) for key, numeric_id in misses))
+        return names
     
     @staticmethod
     async def get_user_simple_name(user_id: any, context: ContextTypes.DEFAULT_TYPE = None) -> str:
@@ -69,43 +251,12 @@ class UserUtils:
         Returns:
             str: 用户简单显示名称，如果获取失败则返回用户ID字符串
         """
-        if not isinstance(user_id, int):
-            try:
-                user_id = int(user_id)
-            except ValueError:
-                return f"`{user_id}`"
-        
-        # 优先从缓存获取
-        cached_name = user_cache.get_user_simple_name(user_id)
-        if cached_name != str(user_id):  # 如果缓存中有昵称信息
-            return cached_name
-        
-        # 如果缓存中没有且提供了context，尝试从API获取
-        if context:
-            try:
-                chat = await context.bot.get_chat(user_id)
-                
-                # 更新缓存
-                user_cache.update_user_info(
-                    user_id=user_id,
-                    username=chat.username,
-                    full_name=chat.full_name,
-                    first_name=chat.first_name,
-                    last_name=chat.last_name
-                )
-                
-                # 优先使用全名，其次使用用户名，最后使用ID
-                if chat.full_name:
-                    return chat.full_name
-                elif chat.username:
-                    return f"@{chat.username}"
-                else:
-                    return str(user_id)
-            except Exception as e:
-                logger.debug(f"无法通过API获取用户 {user_id} 信息: {str(e)}")
-        
-        # 如果都失败了，返回用户ID
-        return str(user_id)
+        numeric_id = UserUtils._to_user_id(user_id)
+        if numeric_id is None:
+            return f"`{user_id}`"
+        
+        await UserUtils._resolve_profile(numeric_id, context)
+        return user_cache.get_user_simple_name(numeric_id)
     
     @staticmethod
     async def get_user_info(user_id: any, context: ContextTypes.DEFAULT_TYPE = None) -> Optional[dict]:
@@ -118,44 +269,36 @@ class UserUtils:
         Returns:
             Optional[dict]: 用户信息字典，获取失败时返回None
         """
-        if not isinstance(user_id, int):
-            try:
-                user_id = int(user_id)
-            except ValueError:
-                return None
+        numeric_id = UserUtils._to_user_id(user_id)
+        if numeric_id is None:
+            return None
         
         # 先尝试从缓存获取
-        cached_info = user_cache.get_user_info(user_id)
+        cached_info = user_cache.get_user_info(numeric_id)
         if cached_info:
             return cached_info
         
-        # 如果缓存中没有且提供了context，尝试从API获取
-        if context:
-            try:
-                chat = await context.bot.get_chat(user_id)
-                
-                user_info = {
-                    'id': chat.id,
-                    'username': chat.username,
-                    'full_name': chat.full_name,
-                    'first_name': chat.first_name,
-                    'last_name': chat.last_name,
-                    'type': chat.type
-                }
-                
-                # 更新缓存
-                user_cache.update_user_info(
-                    user_id=user_id,
-                    username=chat.username,
-                    full_name=chat.full_name,
-                    first_name=chat.first_name,
-                    last_name=chat.last_name
-                )
-                
-                return user_info
-            except Exception as e:
-                logger.debug(f"无法通过API获取用户 {user_id} 完整信息: {str(e)}")
+        return await UserUtils._resolve_profile(numeric_id, context)
+    
+    @staticmethod
+    def resolve_user_id(arg: str) -> Optional[str]:
+        """将命令参数解析为用户ID
+        
+        整数（可带一个负号，不含前导零）直接作为用户ID；以 @ 开头时按用户名在用户缓存中查找，
+        只能找到与机器人交互过的用户。
         
+        Args:
+            arg: 命令参数，如 "123456" 或 "@username"
+        
+        Returns:
+            Optional[str]: 用户ID字符串，无法解析时返回None
+        """
+        arg = (arg or "").strip()
+        if arg.startswith('@'):
+            user_id = user_cache.find_user_id_by_username(arg)
+            return str(user_id) if user_id is not None else None
+        if re.fullmatch(r'-?[1-9][0-9]*', arg):
+            return arg
         return None
     
     @staticmethod